@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the download engine and the GUI.
+
+Run `python -m bench` from the repository root; see bench/__main__.py.
+"""
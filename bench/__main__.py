@@ -0,0 +1,178 @@
+"""
+Benchmark entry point. Usage, from the repository root:
+
+    python -m bench -o before.json
+    python -m bench -s clips,hls --latency 50 --server-rate 4M -o after.json
+    python -m bench compare before.json after.json
+
+Every run starts a local fixture server (bench/server.py), runs each
+scenario in a fresh process against it and writes one JSON document
+with the commit, the settings and per-scenario metrics: jobs per second,
+MB/s, time to first byte, p50/p99 job latency and peak RSS. Unless
+--no-gui is given, a last run measures Tk event-loop lag in the GUI.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .harness import SCENARIOS, child_main, compare, run_scenario
+from .server import FixtureServer
+
+
+def git_commit():
+    """Return (commit, dirty) of the working tree, or (None, None) outside git"""
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def parse_rate(text):
+    from downloader.bandwidth import parse_rate as parse
+    try:
+        return parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_parser():
+    from downloader.jobqueue import DEFAULT_MAX_WORKERS
+    from downloader.segmented import DEFAULT_MAX_CONNECTIONS
+    
+    parser = argparse.ArgumentParser(prog='python -m bench', description="Offline download benchmarks.")
+    commands = parser.add_subparsers(dest='command')
+    
+    run = commands.add_parser('run', help="run the benchmarks (the default)")
+    add_run_arguments(run, DEFAULT_MAX_WORKERS, DEFAULT_MAX_CONNECTIONS)
+    
+    diff = commands.add_parser('compare', help="show metrics that changed between two result files")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=5.0,
+                      help="smallest change to show, in percent (default: 5)")
+    
+    # Used by the run command to start its scenario processes
+    commands.add_parser('child')
+    commands.add_parser('gui-child')
+    return parser
+
+
+def add_run_arguments(parser, workers, connections):
+    parser.add_argument('-s', '--scenarios', default=','.join(SCENARIOS),
+                        help=f"comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument('-n', '--jobs', type=int, help="jobs per scenario instead of its default")
+    parser.add_argument('-j', '--workers', type=int, default=workers,
+                        help=f"parallel downloads (default: {workers})")
+    parser.add_argument('--host-limit', type=int,
+                        help="parallel downloads per host (default: same as --workers, since every "
+                             "fixture is served from one host)")
+    parser.add_argument('-c', '--connections', type=int, default=connections,
+                        help=f"max parallel connections per file (default: {connections})")
+    parser.add_argument('--transcode-workers', type=int, help="parallel MP3 encodes (default: CPU count)")
+    parser.add_argument('--stream-audio', action='store_true', help="stream audio into ffmpeg")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="server delay before each response, in milliseconds")
+    parser.add_argument('--server-rate', type=parse_rate, metavar='RATE',
+                        help="server speed per connection, such as 2M")
+    parser.add_argument('--no-range', action='store_true', help="server ignores Range requests")
+    parser.add_argument('--no-gui', action='store_true', help="skip the GUI responsiveness probe")
+    parser.add_argument('--gui-scenario', default='clips',
+                        help="scenario pasted into the GUI for the probe (default: clips)")
+    parser.add_argument('-o', '--output', metavar='FILE', help="write the results here instead of stdout")
+
+
+def run(args):
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario: {unknown[0]} (choose from {', '.join(SCENARIOS)})")
+        
+    engine = {
+        'workers': args.workers,
+        'host_limit': args.host_limit or args.workers,
+        'connections': args.connections,
+        'transcode_workers': args.transcode_workers,
+        'stream_audio': args.stream_audio,
+    }
+    commit, dirty = git_commit()
+    import yt_dlp.version
+    from downloader import core
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'ffmpeg': core.get_ffmpeg_path(),
+        'engine': engine,
+        'server': {'latency_ms': args.latency, 'rate': args.server_rate, 'ranges': not args.no_range},
+        'scenarios': {},
+    }
+    
+    with FixtureServer(latency=args.latency / 1000, rate=args.server_rate,
+                       ranges=not args.no_range) as server:
+        for name in names:
+            scenario = dict(SCENARIOS[name])
+            if args.jobs:
+                scenario['jobs'] = args.jobs
+            print(f"bench: {name} ({scenario['jobs']} jobs)...", file=sys.stderr, flush=True)
+            results['scenarios'][name] = run_scenario(server, name, scenario, engine)
+            print(f"bench: {name}: {summary_line(results['scenarios'][name])}", file=sys.stderr, flush=True)
+            
+        if not args.no_gui:
+            print("bench: GUI responsiveness...", file=sys.stderr, flush=True)
+            scenario = dict(SCENARIOS[args.gui_scenario])
+            if args.jobs:
+                scenario['jobs'] = args.jobs
+            results['gui'] = run_scenario(server, args.gui_scenario, scenario, engine, child='gui-child')
+            
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+    else:
+        print(text)
+
+
+def summary_line(metrics):
+    if 'error' in metrics:
+        return f"error: {metrics['error']}"
+    return (f"{metrics['done']}/{metrics['jobs']} done, {metrics['jobs_per_sec']} jobs/s, "
+            f"{metrics['mb_per_sec']} MB/s, latency p50 {metrics['latency']['p50']}s "
+            f"p99 {metrics['latency']['p99']}s, peak RSS {metrics['peak_rss_mb']} MB")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith('-'):
+        argv = ['run'] + list(argv)
+    args = build_parser().parse_args(argv)
+    
+    if args.command == 'child':
+        print(json.dumps(child_main(json.load(sys.stdin))))
+    elif args.command == 'gui-child':
+        from .guiprobe import gui_child_main
+        print(json.dumps(gui_child_main(json.load(sys.stdin))))
+    elif args.command == 'compare':
+        with open(args.old, encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, encoding='utf-8') as f:
+            new = json.load(f)
+        lines = compare(old, new, args.threshold / 100)
+        print('\n'.join(lines) if lines else "No changes above the threshold")
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
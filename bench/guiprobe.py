@@ -0,0 +1,76 @@
+"""
+Tk event-loop lag while the GUI runs downloads.
+
+The probe starts the real VideoDownloaderGUI, pastes the scenario URLs
+into it and schedules a tick every PROBE_INTERVAL_MS. The lag of a tick
+is how much later than requested it ran; anything over a frame or two
+is visible as a stuttering window.
+"""
+
+import time
+
+
+PROBE_INTERVAL_MS = 10
+# The GUI gives up on a run that has not finished by then
+PROBE_TIMEOUT = 300
+
+
+def gui_child_main(spec):
+    """Body of the GUI child process; returns the metrics dict or a skip reason"""
+    started = time.perf_counter()
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        # No display, or Tk is missing from this Python
+        return {'skipped': str(e) or type(e).__name__}
+        
+    from video_downloader import VideoDownloaderGUI
+    from downloader.jobqueue import ACTIVE, PROCESSING, QUEUED, DONE
+    
+    app = VideoDownloaderGUI(root)
+    app.output_dir.set(spec['output_dir'])
+    app.quality.set(spec['quality'])
+    window_seconds = time.perf_counter() - started
+    
+    lags = []
+    state = {'due': None, 'submitted': None, 'finished': None}
+    
+    def tick():
+        now = time.perf_counter()
+        if state['due'] is not None:
+            lags.append(max(0.0, now - state['due']))
+        counts = app.queue.counts()
+        busy = counts.get(QUEUED, 0) + counts.get(ACTIVE, 0) + counts.get(PROCESSING, 0)
+        if not busy or now - state['submitted'] > PROBE_TIMEOUT:
+            state['finished'] = now
+            root.quit()
+            return
+        state['due'] = now + PROBE_INTERVAL_MS / 1000
+        root.after(PROBE_INTERVAL_MS, tick)
+        
+    def paste():
+        app.url_entry.delete(0, tk.END)
+        app.url_entry.insert(0, ' '.join(spec['urls']))
+        state['submitted'] = time.perf_counter()
+        app.start_download()
+        tick()
+        
+    # Measure once the window is up and the warm-up has started
+    root.after(200, paste)
+    root.mainloop()
+    
+    counts = app.queue.counts()
+    app.queue.shutdown(wait=False)
+    root.destroy()
+    
+    from .harness import summarize
+    return {
+        'jobs': len(spec['urls']),
+        'done': counts.get(DONE, 0),
+        'window_seconds': round(window_seconds, 4),
+        'wall': round(state['finished'] - state['submitted'], 4),
+        'ticks': len(lags),
+        'lag': summarize(lags),
+        'lag_over_50ms': sum(1 for lag in lags if lag > 0.05),
+    }
@@ -0,0 +1,187 @@
+"""
+Benchmark scenarios and the metrics collected for them.
+
+Each scenario runs in a fresh interpreter with its own data directory,
+so imports, caches and peak RSS of one scenario do not leak into the
+next. The child drives the engine the way the CLI does (DownloadQueue,
+core.run_job, shared sessions and transcode pool) and prints one JSON
+object with its measurements.
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+KB = 1024
+MB = 1024 * 1024
+
+# name -> what to download; `jobs` jobs of the same shape are queued at once
+SCENARIOS = {
+    'clips': {'kind': 'media', 'ext': 'mp4', 'size': 512 * KB, 'jobs': 40, 'quality': 'best'},
+    'large': {'kind': 'media', 'ext': 'mp4', 'size': 64 * MB, 'jobs': 2, 'quality': 'best'},
+    'audio': {'kind': 'media', 'ext': 'm4a', 'size': 4 * MB, 'jobs': 10, 'quality': 'audio'},
+    'hls': {'kind': 'hls', 'segments': 20, 'segment_size': 256 * KB, 'jobs': 6, 'quality': 'best'},
+}
+
+# Seconds a scenario may run before it counts as hung
+CHILD_TIMEOUT = 600
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(values, digits=4):
+    """Return p50, p99 and max of a list of seconds"""
+    def rounded(value):
+        return None if value is None else round(value, digits)
+        
+    return {'p50': rounded(percentile(values, 0.5)), 'p99': rounded(percentile(values, 0.99)),
+            'max': rounded(max(values) if values else None)}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (MB if sys.platform == 'darwin' else KB), 1)
+
+
+def scenario_urls(base_url, scenario):
+    """Return one fresh URL per job, so no job is answered from a cache"""
+    run = uuid.uuid4().hex[:8]
+    urls = []
+    for index in range(scenario['jobs']):
+        name = f'{run}-{index}'
+        if scenario['kind'] == 'hls':
+            urls.append(f"{base_url}/hls/{scenario['segments']}x{scenario['segment_size']}/{name}.m3u8")
+        else:
+            urls.append(f"{base_url}/media/{scenario['size']}/{name}.{scenario['ext']}")
+    return urls
+
+
+def run_scenario(server, name, scenario, engine, child='child'):
+    """Run one scenario in a child process (`python -m bench <child>`) and return its metrics"""
+    spec = {'name': name, 'urls': scenario_urls(server.base_url, scenario),
+            'quality': scenario['quality'], 'engine': engine}
+    requests_before, bytes_before = server.requests, server.bytes_sent
+    with tempfile.TemporaryDirectory(prefix='vd-bench-') as home:
+        spec['output_dir'] = os.path.join(home, 'downloads')
+        env = dict(os.environ, VIDEO_DOWNLOADER_HOME=home)
+        result = subprocess.run([sys.executable, '-m', 'bench', child], input=json.dumps(spec),
+                                capture_output=True, text=True, env=env, timeout=CHILD_TIMEOUT)
+    if result.returncode != 0:
+        return {'error': (result.stderr.strip().splitlines() or ['child failed'])[-1]}
+    metrics = json.loads(result.stdout)
+    if 'skipped' in metrics:
+        return metrics
+    transferred = server.bytes_sent - bytes_before
+    metrics['server_requests'] = server.requests - requests_before
+    metrics['bytes'] = transferred
+    metrics['mb_per_sec'] = round(transferred / MB / metrics['wall'], 2) if metrics['wall'] else None
+    return metrics
+
+
+def child_main(spec):
+    """Body of the child process; returns the metrics dict"""
+    started = time.perf_counter()
+    from downloader import core
+    from downloader.jobqueue import DownloadQueue, Job, DONE
+    from downloader.infocache import InfoCache
+    from downloader.sessions import SessionPool
+    from downloader.transcode import TranscodePool
+    import_seconds = time.perf_counter() - started
+    
+    engine = spec['engine']
+    info_cache = InfoCache()
+    transcoder = TranscodePool(max_workers=engine.get('transcode_workers'))
+    sessions = SessionPool(max_idle=engine['workers'])
+    first_byte = {}
+    lock = threading.Lock()
+    
+    def runner(job):
+        def progress_hook(d):
+            if d.get('downloaded_bytes') and job.id not in first_byte:
+                with lock:
+                    first_byte.setdefault(job.id, time.time() - job.started)
+                    
+        return core.run_job(job, progress_hook=progress_hook, info_cache=info_cache,
+                            connections=engine['connections'], transcoder=transcoder,
+                            stream_audio=engine.get('stream_audio', False), sessions=sessions,
+                            ydl_opts={'quiet': True, 'no_warnings': True, 'noprogress': True})
+                            
+    queue = DownloadQueue(runner, max_workers=engine['workers'], host_limit=engine['host_limit'])
+    wall_started = time.perf_counter()
+    jobs = [queue.submit(Job(url, quality=spec['quality'], output_dir=spec['output_dir']))
+            for url in spec['urls']]
+    queue.wait()
+    wall = time.perf_counter() - wall_started
+    queue.shutdown()
+    transcoder.shutdown()
+    sessions.close()
+    info_cache.close()
+    
+    done = [job for job in jobs if job.status == DONE]
+    errors = sorted({job.error for job in jobs if job.status != DONE and job.error})
+    return {
+        'jobs': len(jobs),
+        'done': len(done),
+        'failed': len(jobs) - len(done),
+        'errors': errors[:3],
+        'import_seconds': round(import_seconds, 4),
+        'wall': round(wall, 4),
+        'jobs_per_sec': round(len(done) / wall, 2) if wall else None,
+        'ttfb': summarize(list(first_byte.values())),
+        'latency': summarize([job.finished - job.started for job in done]),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(old, new, threshold=0.05):
+    """Return lines describing metrics that moved by more than `threshold` between two result files"""
+    # Metrics where a larger value is better; the rest are better when smaller
+    higher_is_better = ('jobs_per_sec', 'mb_per_sec')
+    lines = []
+    runs = dict(new.get('scenarios', {}), gui=new.get('gui'))
+    previous_runs = dict(old.get('scenarios', {}), gui=old.get('gui'))
+    for name, after in runs.items():
+        before = previous_runs.get(name)
+        if not before or not after or 'error' in before or 'error' in after:
+            continue
+        for metric, value, previous in _flatten(after, before):
+            if not previous or value is None:
+                continue
+            change = (value - previous) / previous
+            if abs(change) < threshold:
+                continue
+            better = (change > 0) == (metric.split('.')[0] in higher_is_better)
+            lines.append(f"{name:8} {metric:18} {previous:>10} -> {value:<10} "
+                         f"{change:+.1%} {'better' if better else 'WORSE'}")
+    return lines
+
+
+def _flatten(after, before, prefix=''):
+    for key, value in after.items():
+        previous = before.get(key) if isinstance(before, dict) else None
+        if isinstance(value, dict):
+            yield from _flatten(value, previous or {}, prefix + key + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ('jobs', 'done'):
+            yield prefix + key, value, previous
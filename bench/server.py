@@ -0,0 +1,229 @@
+"""
+Local HTTP server with synthetic media fixtures.
+
+Nothing is stored on disk: every file is a short container header
+followed by a repeating pattern, so any byte range can be produced
+directly. Paths encode the fixture, which keeps URLs unique per job:
+
+    /media/<size>/<name>.mp4|.m4a      progressive file of <size> bytes
+    /hls/<segments>x<size>/<name>.m3u8
+    /hls/<segments>x<size>/<name>-<n>.ts
+
+Latency (before the response headers), a per-connection rate cap and
+Range support can be set for the whole server. `range_limit` makes it
+stop honouring Range after that many range requests, like a CDN edge
+that changes under a running download.
+"""
+
+import http.server
+import os
+import re
+import socketserver
+import struct
+import threading
+import time
+
+
+BLOCK_SIZE = 64 * 1024
+# Shared body pattern; repeated to any length
+PATTERN = os.urandom(BLOCK_SIZE)
+SEGMENT_SECONDS = 2
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d+)-(\d*)$')
+MEDIA_PATH = re.compile(r'^/media/(\d+)/[\w.-]+\.(mp4|m4a)$')
+HLS_PATH = re.compile(r'^/hls/(\d+)x(\d+)/([\w.-]+?)(?:\.m3u8|-(\d+)\.ts)$')
+
+CONTENT_TYPES = {
+    'mp4': 'video/mp4',
+    'm4a': 'audio/mp4',
+    'm3u8': 'application/vnd.apple.mpegurl',
+    'ts': 'video/mp2t',
+}
+
+
+def box(kind, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def mp4_header(brand):
+    """ftyp and moov boxes followed by the header of an mdat box running to the end of the file"""
+    ftyp = box(b'ftyp', brand + struct.pack('>I', 0) + brand + b'isom')
+    moov = box(b'moov', box(b'mvhd', bytes(100)))
+    # An mdat size of 0 means the box runs to the end of the file
+    return ftyp + moov + struct.pack('>I4s', 0, b'mdat')
+
+
+class Fixture:
+    """A file of `size` bytes: `head` followed by the shared pattern"""
+    
+    def __init__(self, size, content_type, head=b''):
+        self.size = max(size, len(head))
+        self.content_type = content_type
+        self.head = head
+        
+    def read(self, start, end):
+        """Return bytes start..end inclusive"""
+        parts = []
+        if start < len(self.head):
+            parts.append(self.head[start:end + 1])
+            start = len(self.head)
+        while start <= end:
+            offset = start % BLOCK_SIZE
+            piece = PATTERN[offset:offset + end - start + 1]
+            parts.append(piece)
+            start += len(piece)
+        return b''.join(parts)
+
+
+def hls_playlist(name, segments):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}',
+             '#EXT-X-MEDIA-SEQUENCE:0']
+    for index in range(segments):
+        lines += [f'#EXTINF:{SEGMENT_SECONDS}.0,', f'{name}-{index}.ts']
+    lines.append('#EXT-X-ENDLIST')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def find_fixture(path):
+    """Return the Fixture for a request path, or None"""
+    match = MEDIA_PATH.match(path)
+    if match:
+        ext = match.group(2)
+        head = mp4_header(b'M4A ' if ext == 'm4a' else b'isom')
+        return Fixture(int(match.group(1)), CONTENT_TYPES[ext], head)
+    match = HLS_PATH.match(path)
+    if match:
+        segments, size = int(match.group(1)), int(match.group(2))
+        if match.group(4) is None:
+            playlist = hls_playlist(match.group(3), segments)
+            return Fixture(len(playlist), CONTENT_TYPES['m3u8'], playlist)
+        if int(match.group(4)) < segments:
+            # MPEG-TS sync byte at the start of the segment
+            return Fixture(size, CONTENT_TYPES['ts'], b'\x47')
+    return None
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+        
+    def do_HEAD(self):
+        self._respond(body=False)
+        
+    def do_GET(self):
+        self._respond(body=True)
+        
+    def _respond(self, body):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+            
+        fixture = find_fixture(self.path.split('?', 1)[0])
+        if fixture is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+            
+        start, end, status = 0, fixture.size - 1, 200
+        match = RANGE_PATTERN.match(self.headers.get('Range') or '')
+        if match and server.ranges and server.take_range():
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), end)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{fixture.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+            
+        self.send_response(status)
+        self.send_header('Content-Type', fixture.content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{fixture.size}')
+        self.end_headers()
+        if not body:
+            return
+            
+        sent_since = time.monotonic()
+        sent = 0
+        position = start
+        try:
+            while position <= end:
+                chunk = fixture.read(position, min(position + BLOCK_SIZE, end + 1) - 1)
+                self.wfile.write(chunk)
+                position += len(chunk)
+                sent += len(chunk)
+                if server.rate:
+                    # Pace the connection to the configured rate
+                    delay = sent / server.rate - (time.monotonic() - sent_since)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.bytes_sent += sent
+
+
+class FixtureServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Serves synthetic fixtures on a background thread; use as a context manager"""
+    
+    daemon_threads = True
+    
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, rate=None, ranges=True, range_limit=None):
+        super().__init__((host, port), FixtureHandler)
+        # Seconds before each response, bytes per second per connection
+        self.latency = latency
+        self.rate = rate
+        self.ranges = ranges
+        # Range requests still answered with 206; None for no limit
+        self.range_limit = range_limit
+        self.requests = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self._thread = None
+        
+    def take_range(self):
+        with self.lock:
+            if self.range_limit is None:
+                return True
+            if self.range_limit <= 0:
+                return False
+            self.range_limit -= 1
+            return True
+            
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+        
+    def media_url(self, name, size, ext='mp4'):
+        return f'{self.base_url}/media/{size}/{name}.{ext}'
+        
+    def hls_url(self, name, segments, segment_size):
+        return f'{self.base_url}/hls/{segments}x{segment_size}/{name}.m3u8'
+        
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True, name='fixture-server')
+        self._thread.start()
+        return self
+        
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        
+    def __enter__(self):
+        return self.start()
+        
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,7 @@
+"""
+Download engine used by the Video Downloader GUI.
+"""
+
+from .jobqueue import Job, DownloadQueue, host_key
+
+__all__ = ['Job', 'DownloadQueue', 'host_key']
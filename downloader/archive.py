@@ -0,0 +1,212 @@
+"""
+Index of files already downloaded, used to skip repeated URLs.
+
+Canonical URL keys and extractor ids ('youtube:<id>') map to the files a
+job wrote for a given quality. Every file is stored with its size,
+modification time and SHA-256 hash; the hash lets rebuild() find a
+download again after it was moved or renamed. A lookup is one primary-key query plus
+a stat() of the file, with no network access. The index lives in SQLite
+(WAL mode), so the GUI, CLI and several worker threads can share it.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from .paths import get_data_dir
+from .urls import canonical_key
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# An upsert keeps the keys that already point at a file (REPLACE would cascade-delete them)
+UPSERT_FILE = ('INSERT INTO files VALUES (?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET '
+               'size = excluded.size, mtime = excluded.mtime, sha256 = excluded.sha256')
+
+# Partial and temporary files that never count as finished downloads
+IGNORED_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp', '.json', '.segments')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadArchive:
+    def __init__(self, path=None):
+        self.path = str(path or get_data_dir() / 'archive.sqlite3')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                added REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+            CREATE TABLE IF NOT EXISTS keys (
+                key TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+                PRIMARY KEY (key, quality, path)
+            );
+        ''')
+        self._db.execute('PRAGMA foreign_keys=ON')
+        
+    def lookup(self, url, quality):
+        """Return the existing files for a URL, or None if it was not downloaded"""
+        return self.lookup_key(canonical_key(url), quality)
+        
+    def lookup_key(self, key, quality):
+        if not key:
+            return None
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT f.path, f.size FROM keys k JOIN files f ON f.path = k.path '
+                'WHERE k.key = ? AND k.quality = ?', (key, quality)).fetchall()
+        if not rows:
+            return None
+        # The folder may have been cleaned up since; only trust files that are still there
+        for path, size in rows:
+            try:
+                if os.stat(path).st_size != size:
+                    return None
+            except OSError:
+                self.forget(path)
+                return None
+        return [path for path, _ in rows]
+        
+    def record(self, keys, quality, paths):
+        """Remember that `paths` were written for every key in `keys`"""
+        keys = [key for key in dict.fromkeys(keys) if key]
+        entries = [self._file_entry(path) for path in paths]
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for entry in entries:
+                    self._db.execute(UPSERT_FILE, entry)
+                    for key in keys:
+                        self._db.execute('INSERT OR IGNORE INTO keys VALUES (?, ?, ?)',
+                                         (key, quality, entry[0]))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+                
+    def forget(self, path):
+        with self._lock:
+            self._db.execute('DELETE FROM files WHERE path = ?', (str(Path(path).resolve()),))
+            
+    def rebuild(self, folder, log=None):
+        """Bring the index in line with a downloads folder.
+        
+        Only new or changed files are hashed, so running this on every
+        start is cheap, but it reads every new file once: call it off the
+        startup path. A file with the same content as one recorded before,
+        say after the folder was moved or the file renamed, takes over that
+        file's keys. Files that were deleted are dropped together with their
+        keys. Returns the number of files that got keys.
+        """
+        folder = Path(folder).resolve()
+        if not folder.is_dir():
+            return 0
+        prefix = str(folder) + os.sep
+        
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT path, size, mtime FROM files WHERE substr(path, 1, ?) = ?',
+                (len(prefix), prefix)).fetchall()
+        # Only direct children; downloads are not written to subfolders
+        known = {path: (size, mtime) for path, size, mtime in rows
+                 if os.path.dirname(path) == str(folder)}
+        
+        seen = set()
+        entries = []
+        for entry in os.scandir(folder):
+            if not entry.is_file() or entry.name.endswith(IGNORED_SUFFIXES):
+                continue
+            path = str(Path(entry.path).resolve())
+            seen.add(path)
+            stat = entry.stat()
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                entries.append(self._file_entry(path))
+            except OSError:
+                continue
+                
+        missing = [path for path in known if path not in seen]
+        indexed = 0
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for entry in entries:
+                    # Unknown content still gets a row, so it is not hashed again next time
+                    self._db.execute(UPSERT_FILE, entry)
+                    added = self._db.execute(
+                        'INSERT OR IGNORE INTO keys SELECT k.key, k.quality, ? FROM keys k '
+                        'JOIN files f ON f.path = k.path WHERE f.sha256 = ? AND f.path != ?',
+                        (entry[0], entry[3], entry[0])).rowcount
+                    if added > 0:
+                        indexed += 1
+                        if log:
+                            log(f"Indexed {os.path.basename(entry[0])}")
+                        # The file it was recorded under is gone when it was moved
+                        for (previous,) in self._db.execute(
+                                'SELECT path FROM files WHERE sha256 = ? AND path != ?',
+                                (entry[3], entry[0])).fetchall():
+                            if not os.path.exists(previous):
+                                self._db.execute('DELETE FROM files WHERE path = ?', (previous,))
+                for path in missing:
+                    self._db.execute('DELETE FROM files WHERE path = ?', (path,))
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return indexed
+        
+    @contextmanager
+    def claim(self, key):
+        """Serialize work on the same key across worker threads.
+        
+        A second job for a URL that is already downloading waits here and
+        then finds the first job's result with lookup().
+        """
+        with self._inflight_lock:
+            lock, users = self._inflight.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._inflight[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._inflight_lock:
+                lock, users = self._inflight[key]
+                if users <= 1:
+                    del self._inflight[key]
+                else:
+                    self._inflight[key] = (lock, users - 1)
+                    
+    def close(self):
+        with self._lock:
+            self._db.close()
+            
+    def _file_entry(self, path):
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime, file_sha256(path), time.time())
@@ -0,0 +1,137 @@
+"""
+Shared bandwidth scheduler for all download workers.
+
+Every chunk a worker reads is paid for with tokens from a global bucket
+and, if the site has its own cap, from that site's bucket. A bucket may
+go into debt by one chunk, so chunk size and burst size never need to
+match. When a bucket is short, waiters of a higher priority class on
+that bucket are served first, so an interactive paste keeps its speed
+while a bulk batch slows down. A job held up by its own site's cap does
+not slow down other sites. Rates can be changed at any time; running
+downloads pick them up on their next chunk. With no limits set,
+consume() returns without taking a lock.
+"""
+
+import re
+import threading
+import time
+
+from .jobqueue import INTERACTIVE, NORMAL, BULK
+
+
+PRIORITIES = (INTERACTIVE, NORMAL, BULK)
+# Seconds of traffic a bucket may save up while idle
+BURST_SECONDS = 0.5
+# Longest single wait, so waiters notice limit changes and priority shifts
+MAX_WAIT = 0.5
+
+RATE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?(?:/s)?\s*$', re.IGNORECASE)
+RATE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text):
+    """Parse '500K', '2M' or '1.5MB/s' into bytes per second; 0 means unlimited"""
+    match = RATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r}")
+    rate = float(match.group(1)) * RATE_UNITS[match.group(2).lower()]
+    return int(rate) or None
+
+
+class TokenBucket:
+    def __init__(self, rate=None):
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        # Waiters per priority class that found this bucket short, or others queued on it
+        self.waiting = [0] * len(PRIORITIES)
+        self.set_rate(rate)
+        
+    def set_rate(self, rate):
+        if rate and not self.rate:
+            # A new limit starts with a full burst
+            self.tokens = rate * BURST_SECONDS
+        self.rate = rate or None
+        self.updated = time.monotonic()
+        
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.rate * BURST_SECONDS, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        
+    def available(self):
+        return not self.rate or self.tokens > 0
+
+
+class BandwidthScheduler:
+    def __init__(self, rate=None, host_rates=None):
+        self._cond = threading.Condition()
+        self._global = TokenBucket(rate)
+        self._hosts = {}
+        self._limited = bool(rate)
+        for host, host_rate in (host_rates or {}).items():
+            self.set_host_rate(host, host_rate)
+            
+    @property
+    def rate(self):
+        return self._global.rate
+        
+    def host_rates(self):
+        with self._cond:
+            return {host: bucket.rate for host, bucket in self._hosts.items() if bucket.rate}
+            
+    def set_rate(self, rate):
+        """Set the global cap in bytes per second; None or 0 removes it"""
+        with self._cond:
+            self._global.set_rate(rate)
+            self._update_limited()
+            
+    def set_host_rate(self, host, rate):
+        """Cap one site (a jobqueue.host_key value); None or 0 removes the cap"""
+        with self._cond:
+            bucket = self._hosts.get(host)
+            if bucket is None:
+                bucket = self._hosts[host] = TokenBucket()
+            bucket.set_rate(rate)
+            self._update_limited()
+            
+    def consume(self, nbytes, host=None, priority=NORMAL):
+        """Account for nbytes read by a job; blocks while its buckets are in debt"""
+        if not self._limited:
+            return
+        priority = min(max(priority, INTERACTIVE), BULK)
+        with self._cond:
+            host_bucket = self._hosts.get(host)
+            buckets = [self._global] if host_bucket is None else [self._global, host_bucket]
+            # Only the buckets this job actually waits for; a job held up by its own site's cap
+            # must not hold back other sites on the global bucket
+            holding = []
+            try:
+                while True:
+                    now = time.monotonic()
+                    for bucket in buckets:
+                        bucket.refill(now)
+                    blocked = [bucket for bucket in buckets
+                               if not bucket.available() or any(bucket.waiting[:priority])]
+                    if not blocked:
+                        for bucket in buckets:
+                            if bucket.rate:
+                                bucket.tokens -= nbytes
+                        return
+                    for bucket in blocked:
+                        if bucket not in holding:
+                            bucket.waiting[priority] += 1
+                            holding.append(bucket)
+                    delays = [-bucket.tokens / bucket.rate for bucket in buckets
+                              if bucket.rate and bucket.tokens <= 0]
+                    self._cond.wait(min(max(delays, default=MAX_WAIT), MAX_WAIT))
+            finally:
+                for bucket in holding:
+                    bucket.waiting[priority] -= 1
+                # Lower priority waiters may go now
+                self._cond.notify_all()
+                
+    def _update_limited(self):
+        # Called with the lock held
+        self._limited = bool(self._global.rate) or any(b.rate for b in self._hosts.values())
+        self._cond.notify_all()
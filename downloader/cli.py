@@ -0,0 +1,162 @@
+"""
+Command line entry point for headless and batch downloads.
+
+Writes one NDJSON result line per job to stdout (or --results) and log
+messages to stderr. Usage:
+
+    python -m downloader URL [URL ...]
+    python -m downloader -i urls.txt -j 8 -o downloads
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+from . import core
+from .engine import PRIORITIES, Engine, add_engine_arguments
+from .journal import JobJournal
+from .metrics import format_phases
+from .paths import get_data_dir
+from .progress import format_bytes, format_eta
+from .retry import FailureReport, short_reason
+from .jobqueue import Job, QUEUED, DONE, FAILED, CANCELLED
+
+
+# Seconds between progress lines per job in verbose mode
+PROGRESS_LOG_INTERVAL = 5.0
+
+
+def read_url_file(path):
+    """Yield URLs from a list file, skipping blank lines and # comments"""
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith(('#', ';')):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader',
+        description="Download videos and audio without the GUI.")
+    parser.add_argument('urls', nargs='*', metavar='URL', help="video URLs to download")
+    parser.add_argument('-i', '--input', metavar='FILE',
+                        help="file with one URL per line ('-' reads stdin)")
+    parser.add_argument('-q', '--quality', choices=['best', 'audio', 'worst'], default='best',
+                        help="best video, MP3 audio or mute (default: best)")
+    parser.add_argument('--priority', choices=list(PRIORITIES), default='normal',
+                        help="priority of these jobs for queue order and bandwidth (default: normal)")
+    parser.add_argument('--results', metavar='FILE',
+                        help="write NDJSON results to FILE instead of stdout")
+    parser.add_argument('--resume', action='store_true',
+                        help="requeue unfinished jobs from the journal, continuing partial files")
+    add_engine_arguments(parser)
+    return parser
+
+
+class ResultWriter:
+    """Writes one NDJSON line per finished job; safe to call from any thread"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.failed = 0
+        
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            if record.get('status') != DONE:
+                self.failed += 1
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    
+    urls = list(args.urls)
+    if args.input:
+        urls.extend(read_url_file(args.input))
+        
+    journal = JobJournal(args.journal or get_data_dir() / 'cli-journal.ndjson')
+    resumed = journal.pending() if args.resume else []
+    if not urls and not resumed:
+        build_parser().error("no URLs given" if not args.resume else "nothing to resume")
+        
+    def log(message):
+        if args.verbose:
+            print(message, file=sys.stderr, flush=True)
+            
+    results_stream = open(args.results, 'a', encoding='utf-8') if args.results else sys.stdout
+    writer = ResultWriter(results_stream)
+    failures = FailureReport()
+    
+    def on_update(job):
+        if job.status == QUEUED and job.retry_at is not None:
+            log(f"[{job.id}] retry {job.attempts} in {job.retry_at - time.time():.0f}s: {short_reason(job.error)}")
+        if job.status in (DONE, FAILED, CANCELLED):
+            writer.write(job.to_dict())
+            log(f"[{job.id}] {job.status}: {job.url}")
+            if job.status == FAILED:
+                failures.add(job)
+            if engine.metrics is not None and job.started is not None:
+                log(f"[{job.id}] phases: {format_phases(job.timings)}")
+                
+    def on_progress(job, d, snapshot):
+        if d['status'] == 'downloading':
+            percent = snapshot['percent']
+            done = f"{percent:.0f}%" if percent is not None else format_bytes(snapshot['downloaded'])
+            log(f"[{job.id}] {done} {format_bytes(snapshot['speed'])}/s ETA {format_eta(snapshot['eta'])}")
+            
+    engine = Engine(args, journal, log, on_update, on_progress if args.verbose else None,
+                    progress_interval=PROGRESS_LOG_INTERVAL)
+    queue = engine.queue
+    interrupted = False
+    try:
+        engine.resume(resumed, args.quality)
+        jobs = []
+        for url in urls:
+            job = Job(url, quality=args.quality, output_dir=args.output_dir,
+                      priority=PRIORITIES[args.priority])
+            if not core.is_valid_url(url):
+                job.status = FAILED
+                job.error = "Invalid URL"
+                writer.write(job.to_dict())
+                failures.add(job)
+                continue
+            jobs.append(job)
+        # One journal write for the whole batch
+        queue.submit_many(jobs)
+        queue.wait()
+    except KeyboardInterrupt:
+        log("Interrupted, cancelling queued jobs and finishing running ones (interrupt again to quit)")
+        interrupted = True
+        
+    # Running workers write results until they stop, so the stream is closed after them
+    try:
+        engine.shutdown()
+    except KeyboardInterrupt:
+        # Partial files and the journal are left for --resume
+        return 130
+    finally:
+        engine.close_metrics()
+    journal.close()
+    if results_stream is not sys.stdout:
+        results_stream.close()
+    if interrupted:
+        return 130
+        
+    # Printed even without -v, after the results, so it is the last thing on screen
+    for line in failures.take():
+        print(line, file=sys.stderr)
+    return 1 if writer.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Client for the download daemon (see daemon.py).
+
+DaemonClient wraps the JSON API with urllib, so scripts need nothing
+beyond the standard library. RemoteQueue looks like a DownloadQueue to
+the GUI: it mirrors the daemon's jobs from the event stream, sends
+submissions from a background thread and reports changes through the
+same callbacks as the local queue.
+"""
+
+import json
+import os
+import queue
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from .jobqueue import Job, INTERACTIVE, NORMAL, BULK
+
+
+DAEMON_ENV = 'VIDEO_DOWNLOADER_DAEMON'
+TOKEN_ENV = 'VIDEO_DOWNLOADER_TOKEN'
+
+REQUEST_TIMEOUT = 30
+# Seconds before a dropped event stream is opened again
+RECONNECT_DELAY = 2.0
+# The daemon sends a comment line at least this often
+STREAM_TIMEOUT = 60
+
+# Same names as engine.PRIORITIES, which would pull in yt_dlp
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BULK: 'bulk'}
+
+
+class DaemonError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}" if status else message)
+        self.status = status
+
+
+class DaemonClient:
+    def __init__(self, url, token=None):
+        self.url = url.rstrip('/')
+        self.token = token
+        
+    @classmethod
+    def from_env(cls):
+        """Return a client for $VIDEO_DOWNLOADER_DAEMON, or None when it is not set"""
+        url = os.environ.get(DAEMON_ENV)
+        return cls(url, os.environ.get(TOKEN_ENV)) if url else None
+        
+    def request(self, method, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=self._headers())
+        if data is not None:
+            request.add_header('Content-Type', 'application/json')
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error') or e.reason
+            except ValueError:
+                message = e.reason
+            raise DaemonError(e.code, message)
+        except OSError as e:
+            raise DaemonError(None, f"Cannot reach {self.url}: {e}")
+        return json.loads(body) if body else None
+        
+    def submit(self, urls, quality='best', output_dir=None, priority='normal'):
+        """Queue URLs; returns {'jobs': [...], 'rejected': [...]}"""
+        payload = {'urls': list(urls), 'quality': quality, 'priority': priority}
+        if output_dir:
+            payload['output_dir'] = output_dir
+        return self.request('POST', '/jobs', payload)
+        
+    def jobs(self, status=None, after=0, limit=None):
+        """Yield job dicts in id order, fetching them a page at a time"""
+        while after is not None:
+            query = {'after': after}
+            if status:
+                query['status'] = status
+            if limit:
+                query['limit'] = limit
+            page = self.request('GET', '/jobs?' + urlencode(query))
+            yield from page['jobs']
+            after = page['next']
+            
+    def job(self, job_id):
+        return self.request('GET', f'/jobs/{job_id}')
+        
+    def cancel(self, job_id):
+        return self.request('DELETE', f'/jobs/{job_id}')
+        
+    def status(self):
+        return self.request('GET', '/status')
+        
+    def update_settings(self, **settings):
+        return self.request('PUT', '/settings', settings)
+        
+    def events(self, since=None):
+        """Yield (id, kind, data) from the event stream until it closes"""
+        request = urllib.request.Request(self.url + '/events', headers=self._headers())
+        if since is not None:
+            request.add_header('Last-Event-ID', str(since))
+        with urllib.request.urlopen(request, timeout=STREAM_TIMEOUT) as response:
+            event_id, kind, data = None, 'message', []
+            for raw in response:
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if not line:
+                    if data:
+                        yield event_id, kind, json.loads('\n'.join(data))
+                    kind, data = 'message', []
+                elif line.startswith(':'):
+                    continue
+                else:
+                    field, _, value = line.partition(':')
+                    value = value[1:] if value.startswith(' ') else value
+                    if field == 'id':
+                        event_id = int(value)
+                    elif field == 'event':
+                        kind = value
+                    elif field == 'data':
+                        data.append(value)
+                        
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.token}'} if self.token else {}
+
+
+def update_job(job, data):
+    """Copy a job dict from the daemon onto a local Job"""
+    for key in ('status', 'filename', 'error', 'skipped', 'parent', 'priority', 'entries', 'attempts',
+                'retry_at'):
+        if key in data:
+            setattr(job, key, data[key])
+    return job
+
+
+class RemoteQueue:
+    """The daemon's queue, mirrored locally for a GUI that attached to it.
+    
+    `on_update(job)` is called for every job event, `on_progress(job_id,
+    snapshot)` for progress and `on_log(message)` for daemon log lines and
+    connection problems. Callbacks run on the background threads.
+    """
+    
+    def __init__(self, client, on_update=None, on_progress=None, on_log=None):
+        self.client = client
+        self.on_update = on_update
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.jobs = {}
+        self.max_workers = None
+        # The daemon's --output-dir, fetched before the first submission
+        self.root = None
+        self._outside_warned = False
+        self._lock = threading.Lock()
+        self._outbox = queue.Queue()
+        self._closed = threading.Event()
+        threading.Thread(target=self._listen, daemon=True, name='daemon-events').start()
+        threading.Thread(target=self._send, daemon=True, name='daemon-submit').start()
+        
+    def submit(self, job):
+        """Queue a job on the daemon; it shows up through the event stream with the daemon's id"""
+        self._outbox.put(('submit', job))
+        return job
+        
+    def cancel(self, job_id):
+        self._outbox.put(('cancel', job_id))
+        return True
+        
+    def set_max_workers(self, count):
+        self._outbox.put(('settings', {'max_workers': int(count)}))
+        
+    def set_rate(self, rate):
+        self._outbox.put(('settings', {'rate': rate}))
+        
+    def counts(self):
+        with self._lock:
+            result = {}
+            for job in self.jobs.values():
+                result[job.status] = result.get(job.status, 0) + 1
+            return result
+            
+    def shutdown(self, wait=True):
+        """Detach; the daemon keeps running the jobs"""
+        self._closed.set()
+        self._outbox.put(None)
+        
+    def _send(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            action, value = item
+            try:
+                if action == 'submit':
+                    result = self.client.submit([value.url], value.quality, self._output_dir(value.output_dir),
+                                                PRIORITY_NAMES.get(value.priority, 'normal'))
+                    for job in result['jobs']:
+                        self._apply(job)
+                    for rejected in result['rejected']:
+                        self._log(f"❌ Daemon rejected {rejected['url']}: {rejected['error']}")
+                elif action == 'cancel':
+                    self._apply(self.client.cancel(value))
+                else:
+                    self.max_workers = self.client.update_settings(**value).get('max_workers')
+            except DaemonError as e:
+                self._log(f"❌ Daemon: {e}")
+                
+    def _output_dir(self, folder):
+        """`folder` relative to the daemon's download folder, or None for the daemon's own folder.
+        
+        The daemon only writes inside its --output-dir, and the GUI's
+        folder is a local path that usually lies elsewhere.
+        """
+        if self.root is None:
+            self.root = os.path.realpath(self.client.status()['settings']['output_dir'])
+        if folder:
+            try:
+                relative = os.path.relpath(os.path.realpath(folder), self.root)
+            except ValueError:
+                # Another drive on Windows
+                relative = os.pardir
+            if relative != os.curdir and not relative.startswith(os.pardir):
+                return relative
+            if os.path.realpath(folder) != self.root and not self._outside_warned:
+                self._outside_warned = True
+                self._log(f"Downloads go to the daemon's folder {self.root}, not {folder}")
+        return None
+        
+    def _listen(self):
+        last_id = None
+        connected = False
+        warned = False
+        while not self._closed.is_set():
+            try:
+                for event_id, kind, data in self.client.events(last_id):
+                    if not connected:
+                        connected, warned = True, False
+                        self._log(f"Attached to download daemon at {self.client.url}")
+                    last_id = event_id
+                    if kind == 'job':
+                        self._apply(data)
+                    elif kind == 'progress' and self.on_progress:
+                        self.on_progress(data['id'], data)
+                    elif kind == 'log':
+                        self._log(data.get('message', ''))
+            except (OSError, ValueError) as e:
+                # Once per outage, not on every reconnect attempt
+                if not warned:
+                    warned = True
+                    self._log(f"⚠️ Lost the download daemon at {self.client.url} ({e}), reconnecting")
+                connected = False
+            self._closed.wait(RECONNECT_DELAY)
+            
+    def _apply(self, data):
+        with self._lock:
+            job = self.jobs.get(data['id'])
+            if job is None:
+                job = Job(data.get('url', ''), data.get('quality', 'best'))
+                job.id = data['id']
+                self.jobs[job.id] = job
+            update_job(job, data)
+        if self.on_update:
+            self.on_update(job)
+            
+    def _log(self, message):
+        if self.on_log:
+            self.on_log(message)
@@ -0,0 +1,460 @@
+"""
+Download engine shared by the GUI and the command line.
+
+Nothing here imports tkinter, so it can run on machines without a display.
+"""
+
+import contextlib
+import functools
+import glob
+import itertools
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import CancelledError, Future
+from pathlib import Path
+
+import yt_dlp
+from yt_dlp.utils import PagedList
+
+from .formats import QUALITY, choose_format, site_profile
+from .infocache import is_cacheable
+from .jobqueue import BULK, CANCELLED, DONE, FAILED, Job
+from .progress import format_bytes
+from .segmented import partial_bytes
+from .sessions import SessionPool
+from .transcode import transcode_audio
+from .urls import canonical_key, info_key, is_valid_url
+
+
+# Results whose entries are queued as separate jobs
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+# Entries fetched per slice from paged playlists
+PAGE_SLICE = 50
+
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_path():
+    """Try to find FFmpeg executable (looked up once per process)"""
+    # Check if running as executable
+    if getattr(sys, 'frozen', False):
+        # Running as exe, check for bundled ffmpeg
+        exe_dir = Path(sys.executable).parent
+        ffmpeg_exe = exe_dir / 'ffmpeg.exe'
+        if ffmpeg_exe.exists():
+            return str(ffmpeg_exe)
+    else:
+        # Running as script, check the application folder
+        app_dir = Path(__file__).resolve().parent.parent
+        ffmpeg_exe = app_dir / 'ffmpeg.exe'
+        if ffmpeg_exe.exists():
+            return str(ffmpeg_exe)
+            
+    # Check system PATH for ffmpeg
+    ffmpeg_system = shutil.which('ffmpeg')
+    if ffmpeg_system:
+        return ffmpeg_system
+        
+    return None
+
+
+def get_ydl_opts(job, log=None):
+    """Build yt-dlp options for a job's URL, quality and output folder"""
+    output_path = Path(job.output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    common_opts = {
+        'outtmpl': str(output_path / '%(title)s.%(ext)s'),
+        'writeinfojson': False,
+        'writesubtitles': False,
+        'writeautomaticsub': False,
+        # Pick up .part files left behind by an interrupted run
+        'continuedl': True,
+    }
+    
+    # Check if audio quality is selected for MP3 extraction
+    if job.quality == 'audio':
+        # Check if FFmpeg is available
+        ffmpeg_path = get_ffmpeg_path()
+        
+        if ffmpeg_path:
+            # FFmpeg available - can convert to MP3
+            return dict(common_opts, **{
+                'format': 'bestaudio[ext=mp3]/bestaudio[acodec=mp3]/bestaudio',
+                'postprocessors': [{
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': 'mp3',
+                    'preferredquality': '192',
+                    'nopostoverwrites': False,
+                }],
+                'ffmpeg_location': ffmpeg_path,
+            })
+            
+        # No FFmpeg - download best audio format available
+        if log:
+            log("⚠️ FFmpeg not found - downloading in best available audio format")
+        return dict(common_opts, format='bestaudio/best')
+        
+    # Default video format options
+    return dict(common_opts, format=site_profile(job.url)['format'])
+
+
+def apply_job_format(job, opts):
+    """Prefer the exact format a resumed job was using, so its .part file matches"""
+    if job.format:
+        opts['format'] = f"{job.format}/{opts['format']}"
+    return opts
+
+
+class JournalStart:
+    """Records the selected format and output path just before the transfer"""
+    
+    def __init__(self, journal, job, log=None):
+        self.journal = journal
+        self.job = job
+        self.log = log
+        
+    def __call__(self, info):
+        path = info.get('_filename')
+        self.journal.record_started(self.job, info.get('format_id'), path)
+        if path and self.log:
+            stem = os.path.splitext(path)[0]
+            partial = sum(partial_bytes(p) for p in glob.glob(glob.escape(stem) + '*.part'))
+            if partial:
+                self.log(f"Resuming {os.path.basename(path)} from {format_bytes(partial)}")
+
+
+def downloaded_files(info):
+    """Return the final paths written for an extract_info result"""
+    if info is None:
+        return []
+    if info.get('_type') == 'playlist':
+        files = []
+        for entry in info.get('entries') or []:
+            files.extend(downloaded_files(entry))
+        return files
+    return [d['filepath'] for d in info.get('requested_downloads') or [] if d.get('filepath')]
+
+
+def extract_info(ydl, url, info_cache=None, log=None):
+    """Return (info, from_cache) with the unprocessed extraction result for url"""
+    key = canonical_key(url)
+    if info_cache is not None:
+        info = info_cache.get(key)
+        if info is not None:
+            if log:
+                log(f"Using cached video info for {key}")
+            return info, True
+            
+    info = ydl.extract_info(url, download=False, process=False)
+    
+    if info_cache is not None and is_cacheable(info):
+        keys = [key]
+        clean = ydl.sanitize_info(info, remove_private_keys=True)
+        alias = info_key(clean)
+        if alias:
+            keys.append(alias)
+        info_cache.put(keys, clean)
+    return info, False
+
+
+def archive_entries(info):
+    """Yield (keys, files) for every video written for an extract_info result"""
+    if info is None:
+        return
+    if info.get('_type') == 'playlist':
+        for entry in info.get('entries') or []:
+            yield from archive_entries(entry)
+        return
+    files = downloaded_files(info)
+    if files:
+        keys = [info_key(info)]
+        for url in (info.get('webpage_url'), info.get('original_url')):
+            if url:
+                keys.append(canonical_key(url))
+        yield keys, files
+
+
+def already_downloaded(job, files, log=None):
+    job.filename = files[0]
+    job.skipped = True
+    if log:
+        log(f"Already downloaded: {os.path.basename(files[0])}")
+    return files
+
+
+def run_job(job, progress_hook=None, log=None, ydl_opts=None, info_cache=None, archive=None,
+            journal=None, connections=None, transcoder=None, stream_audio=False, expand=None,
+            sessions=None, bandwidth=None, metrics=None, format_policy=QUALITY):
+    """Download a job's URL; raises yt_dlp.DownloadError on failure.
+    
+    `progress_hook` receives yt-dlp progress dicts and `log` receives
+    human readable messages. Extra `ydl_opts` override the defaults.
+    With an `info_cache`, extraction is skipped when a fresh entry exists.
+    With an `archive`, URLs that were downloaded before are answered from
+    the index and new downloads are recorded in it. With a `journal`, the
+    chosen format and output path are recorded before the transfer starts.
+    `connections` caps parallel connections per file (1 disables splitting).
+    With a `transcoder`, MP3 encoding is handed to that pool and a Future
+    resolving to the final files is returned instead of the file list.
+    With `stream_audio`, audio is piped into ffmpeg while it downloads.
+    With `expand`, a playlist or channel is not downloaded in place: an
+    iterator of child jobs, resolved lazily, is passed to `expand` (such as
+    DownloadQueue.feed) and its result is returned. With `sessions`, the
+    YoutubeDL is borrowed from that SessionPool instead of built for the job.
+    With `bandwidth`, every chunk is paid for on that BandwidthScheduler at
+    the job's host and priority. With `metrics`, the job's phases are
+    traced and added to `job.timings` and that Metrics registry.
+    `format_policy` is how formats.choose_format() weighs quality against
+    transfer and processing cost.
+    """
+    trace = metrics.trace(job) if metrics is not None else None
+    try:
+        if archive is None:
+            result = _run_job(job, progress_hook, log, ydl_opts, info_cache, None, journal,
+                              connections, transcoder, stream_audio, expand, sessions, bandwidth, trace,
+                              format_policy)
+        else:
+            # A second job for the same video waits for the first and then reuses its file
+            key = canonical_key(job.url)
+            claim = contextlib.ExitStack()
+            claim.enter_context(archive.claim(key))
+            try:
+                existing = archive.lookup_key(key, job.quality)
+                if existing:
+                    result = already_downloaded(job, existing, log)
+                else:
+                    result = _run_job(job, progress_hook, log, ydl_opts, info_cache, archive, journal,
+                                      connections, transcoder, stream_audio, expand, sessions,
+                                      bandwidth, trace, format_policy)
+            except BaseException:
+                claim.close()
+                raise
+            # An MP3 conversion is recorded in the archive when it finishes, so it keeps the claim;
+            # an expanded playlist is done with it
+            if isinstance(result, Future) and job.entries is None:
+                result.add_done_callback(lambda future: claim.close())
+            else:
+                claim.close()
+    except BaseException as e:
+        if trace is not None:
+            if isinstance(e, Exception) and not job.aborted:
+                # The queue closes it once it knows whether the job is retried
+                job.trace = trace
+            else:
+                close_trace(trace, e)
+        raise
+    if trace is not None:
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: close_trace(trace, future))
+        else:
+            close_trace(trace)
+    return result
+
+
+def close_trace(trace, outcome=None):
+    """Finish a job's trace; `outcome` is the exception or Future the job ended with"""
+    if isinstance(outcome, Future):
+        outcome = CancelledError() if outcome.cancelled() else outcome.exception()
+    if outcome is None:
+        status = DONE
+    elif trace.job.aborted:
+        status = CANCELLED
+    elif isinstance(outcome, Exception) and not isinstance(outcome, CancelledError):
+        status = FAILED
+    else:
+        status = CANCELLED
+    trace.close(status, outcome if status == FAILED else None)
+    trace.job.timings.update(trace.totals())
+
+
+def _run_job(job, progress_hook, log, ydl_opts, info_cache, archive, journal, connections,
+             transcoder, stream_audio, expand, sessions, bandwidth, trace, format_policy):
+    opts = get_ydl_opts(job, log=log)
+    if ydl_opts:
+        opts.update(ydl_opts)
+    apply_job_format(job, opts)
+    audio_ffmpeg = opts.get('ffmpeg_location') if job.quality == 'audio' else None
+    # Encode while streaming or on the transcode pool instead of inside yt-dlp
+    ffmpeg = audio_ffmpeg if transcoder is not None or stream_audio else None
+    if ffmpeg:
+        opts['postprocessors'] = [pp for pp in opts.get('postprocessors', [])
+                                  if pp['key'] != 'FFmpegExtractAudio']
+        
+    if log:
+        log(f"Starting download from: {job.url}")
+        
+    started = time.monotonic()
+    # Without a shared pool the session is closed as soon as it is released
+    sessions = sessions or SessionPool(max_idle=0)
+    if trace is not None:
+        trace.begin('session')
+    ydl = sessions.acquire(opts)
+    healthy = True
+    try:
+        if trace is not None:
+            trace.end('session')
+            ydl.trace = trace
+        ydl.progress_hook = progress_hook
+        if connections is not None:
+            ydl.segmented_connections = connections
+        if stream_audio and ffmpeg:
+            ydl.stream_audio = True
+        if bandwidth is not None:
+            ydl.throttle = functools.partial(bandwidth.consume, host=job.host, priority=job.priority)
+        if journal is not None:
+            ydl.before_download = JournalStart(journal, job, log)
+        if trace is not None:
+            trace.begin('extract')
+        info, cached = extract_info(ydl, job.url, info_cache, log)
+        if trace is not None:
+            trace.end('extract')
+            
+        if expand is not None and info.get('_type') in PLAYLIST_TYPES:
+            entries = iter_entries(info.get('entries'))
+            first = next(entries, None)
+            entries = itertools.chain([first] if first else [], entries)
+            # Only references to other pages can become jobs of their own
+            if first is None or first.get('_type') in ('url', 'url_transparent'):
+                job.entries = 0
+                # The entries are fetched page by page with this session, so it stays open
+                jobs = playlist_jobs(job, functools.partial(sessions.release, ydl),
+                                     info.get('title') or job.url, entries, log)
+                ydl = None
+                return expand(jobs)
+            info['entries'] = entries
+            
+        # Short links only reveal the video id after extraction
+        if archive is not None and info.get('_type', 'video') == 'video':
+            existing = archive.lookup_key(info_key(info), job.quality)
+            if existing:
+                return already_downloaded(job, existing, log)
+                
+        # A resumed job keeps the format its .part file was started with
+        if info.get('_type', 'video') == 'video' and not job.format:
+            choice = choose_format(info, job.quality, format_policy,
+                                   ffmpeg=opts.get('ffmpeg_location') or get_ffmpeg_path(),
+                                   keep_audio=bool(ffmpeg))
+            if choice is not None:
+                if log:
+                    log(choice.reason)
+                ydl.select_format(f"{choice.spec}/{opts['format']}")
+                if choice.keep_audio:
+                    ffmpeg = None
+                    ydl.stream_audio = False
+                    
+        try:
+            if trace is not None:
+                trace.begin('select')
+            info = ydl.process_ie_result(info, download=True)
+        except yt_dlp.DownloadError:
+            if not cached:
+                raise
+            # Stream URLs can be revoked before their stated expiry; extract again
+            if log:
+                log("Cached video info is stale, extracting again")
+            if trace is not None:
+                trace.retry('stale_info')
+                trace.begin('select')
+            info_cache.invalidate(canonical_key(job.url))
+            info, _ = extract_info(ydl, job.url, info_cache, log)
+            info = ydl.process_ie_result(info, download=True)
+    except BaseException as e:
+        # A session interrupted by anything but a download error may be half way through a job
+        healthy = isinstance(e, yt_dlp.DownloadError)
+        raise
+    finally:
+        if ydl is not None:
+            sessions.release(ydl, reuse=healthy)
+    job.timings['download'] = time.monotonic() - started
+    
+    if ffmpeg:
+        return transcode_job(job, info, transcoder, ffmpeg, archive, log, trace)
+    return finish_job(job, info, archive, log)
+
+
+def iter_entries(entries):
+    """Iterate playlist entries without resolving the whole list first"""
+    if isinstance(entries, PagedList):
+        for start in itertools.count(0, PAGE_SLICE):
+            page = entries.getslice(start, start + PAGE_SLICE)
+            yield from page
+            if len(page) < PAGE_SLICE:
+                return
+    else:
+        yield from entries or []
+
+
+def playlist_jobs(job, release, title, entries, log=None):
+    """Yield a child job for every playlist entry, counting them in job.entries; calls release() when done"""
+    if log:
+        log(f"Expanding playlist: {title}")
+    try:
+        for entry in entries:
+            url = entry and (entry.get('webpage_url') or entry.get('url'))
+            # Some extractors only give a bare id here; those cannot be queued on their own
+            if not url or not is_valid_url(url):
+                if log:
+                    log(f"Skipping playlist entry without a usable URL in {title}")
+                continue
+            job.entries += 1
+            yield Job(url, quality=job.quality, output_dir=job.output_dir, parent=job.id,
+                      priority=max(job.priority, BULK))
+    finally:
+        release()
+    if log:
+        log(f"Queued {job.entries} entries from {title}")
+
+
+def transcode_job(job, info, transcoder, ffmpeg, archive, log=None, trace=None):
+    """Encode a job's downloads to MP3.
+    
+    Returns a Future of the final files when the work went to `transcoder`,
+    otherwise encodes on this thread and returns the files.
+    """
+    # Streamed audio is already MP3
+    sources = [path for path in downloaded_files(info) if not path.endswith('.mp3')]
+    if not sources:
+        return finish_job(job, info, archive, log)
+    if trace is not None:
+        trace.begin('transcode')
+    if transcoder is None:
+        return finish_job(job, info, archive, log,
+                          {path: transcode_audio(path, ffmpeg) for path in sources})
+    result = Future()
+    
+    def done(conversion):
+        if trace is not None:
+            trace.end('transcode')
+        try:
+            renamed, timings = conversion.result()
+            for stage, seconds in timings.items():
+                job.timings['transcode_' + stage] = seconds
+            result.set_result(finish_job(job, info, archive, log, renamed))
+        except Exception as e:
+            if log:
+                log(f"❌ Conversion failed: {e}")
+            result.set_exception(e)
+            
+    if log:
+        log("Queued for MP3 conversion")
+    transcoder.convert(sources, ffmpeg).add_done_callback(done)
+    return result
+
+
+def finish_job(job, info, archive, log=None, renamed=None):
+    """Record a finished job's files; `renamed` maps downloaded paths to converted ones"""
+    renamed = renamed or {}
+    if archive is not None:
+        for keys, paths in archive_entries(info):
+            if info.get('_type') != 'playlist':
+                keys.append(canonical_key(job.url))
+            archive.record(keys, job.quality, [renamed.get(path, path) for path in paths])
+            
+    files = [renamed.get(path, path) for path in downloaded_files(info)]
+    if files:
+        job.filename = files[0]
+        if log:
+            for path in files:
+                log(f"Saved: {os.path.basename(path)}")
+    return files
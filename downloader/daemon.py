@@ -0,0 +1,565 @@
+"""
+Long-running download service with a JSON API. Usage:
+
+    python -m downloader.daemon --port 8765 -j 6 -o downloads
+
+Jobs come in over HTTP from scripts, browser extensions, other machines
+and the GUI (see client.py) and run on one Engine. Everything that talks
+to the network runs on a single asyncio event loop; downloads run on the
+queue's worker threads as in the other front ends and post to an
+EventChannel that the loop drains every EVENT_TICK seconds. The channel
+merges progress per job, so a watcher receives at most one progress
+event per job per tick however many jobs are running, and each event is
+encoded once for all watchers.
+
+    GET    /status                         queue counts, settings, watchers
+    GET    /jobs?status=&after=&limit=     jobs in id order, `limit` at a time
+    POST   /jobs                           {"urls": [...], "quality", "output_dir", "priority"}
+    GET    /jobs/<id>
+    DELETE /jobs/<id>                      cancel a queued job or stop a running one
+    PUT    /settings                       {"max_workers": 4, "rate": "2M" or null}
+    GET    /events                         server-sent events: job, progress, log
+
+Request bodies must be sent as application/json, which keeps web pages
+from submitting jobs with plain form posts. With a token, every request
+needs `Authorization: Bearer <token>` (or `?token=` for EventSource).
+Listening on anything but localhost without a token generates one.
+Without a token, requests must name a loopback address or the listening
+address in their Host header, so a web page on a rebound DNS name cannot
+reach the API. Output folders given by clients must lie inside
+--output-dir, and may be given relative to it.
+"""
+
+import argparse
+import asyncio
+import collections
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import signal
+import sys
+import threading
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit, unquote
+
+from .bandwidth import parse_rate
+from .engine import PRIORITIES, Engine, add_engine_arguments
+from .events import EventChannel, LOG, JOB, PROGRESS
+from .journal import JobJournal
+from .paths import get_data_dir
+from .urls import is_valid_url
+from .jobqueue import Job, ACTIVE
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+TOKEN_ENV = 'VIDEO_DOWNLOADER_TOKEN'
+
+QUALITIES = ('best', 'audio', 'worst')
+
+# Seconds between two drains of the worker events
+EVENT_TICK = 0.1
+# Seconds between comment lines that keep idle event streams open
+HEARTBEAT = 15.0
+# Events kept for watchers that reconnect with Last-Event-ID
+EVENT_HISTORY = 5000
+# Batches a watcher may fall behind before it is disconnected
+WATCHER_BACKLOG = 200
+
+# Seconds an idle keep-alive connection stays open
+IDLE_TIMEOUT = 60.0
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+DEFAULT_LIST_LIMIT = 500
+MAX_LIST_LIMIT = 5000
+
+REASONS = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+           403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+           411: 'Length Required', 413: 'Payload Too Large', 415: 'Unsupported Media Type',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        parts = urlsplit(target)
+        self.path = unquote(parts.path)
+        self.query = dict(parse_qsl(parts.query))
+        self.headers = headers
+        self.body = body
+        
+    @property
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() != 'close'
+        
+    def json(self):
+        content_type = self.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+        if content_type != 'application/json':
+            raise HTTPError(415, "Request body must be application/json")
+        try:
+            data = json.loads(self.body or b'{}')
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns None when the client closed the connection"""
+    try:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+        
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HTTPError(400, "Too many headers")
+        name, sep, value = line.decode('latin-1').partition(':')
+        if not sep:
+            raise HTTPError(400, "Malformed header")
+        headers[name.strip().lower()] = value.strip()
+        
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HTTPError(411, "Send a Content-Length instead of a chunked body")
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b''
+    return Request(method.upper(), target, headers, body)
+
+
+def response_bytes(status, payload=None, keep_alive=True):
+    body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            "Cache-Control: no-store"]
+    if payload is not None:
+        head.append("Content-Type: application/json; charset=utf-8")
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+def sse_bytes(seq, kind, data):
+    return f"id: {seq}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+class Watcher:
+    """One open event stream; holds the encoded batches it has not sent yet"""
+    
+    def __init__(self):
+        self.batches = collections.deque()
+        self.wake = asyncio.Event()
+        self.overflowed = False
+        self.closed = False
+        
+    def push(self, batch):
+        if len(self.batches) >= WATCHER_BACKLOG:
+            # Too slow to keep up; it can reconnect and replay from the history
+            self.overflowed = True
+        else:
+            self.batches.append(batch)
+        self.wake.set()
+        
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+
+class EventHub:
+    """Numbers the events drained from the workers and fans them out to every watcher"""
+    
+    def __init__(self):
+        self.seq = 0
+        self.history = collections.deque(maxlen=EVENT_HISTORY)
+        self.watchers = set()
+        
+    def publish(self, events):
+        """Encode (kind, data) pairs once and queue them for every watcher"""
+        chunks = []
+        for kind, data in events:
+            self.seq += 1
+            chunk = sse_bytes(self.seq, kind, data)
+            self.history.append((self.seq, chunk))
+            chunks.append(chunk)
+        if chunks:
+            batch = b''.join(chunks)
+            for watcher in self.watchers:
+                watcher.push(batch)
+                
+    def replay(self, since):
+        """Return the events after `since`, or None when the history no longer reaches back that far"""
+        if since > self.seq:
+            return None
+        if since < self.seq and (not self.history or self.history[0][0] > since + 1):
+            return None
+        return b''.join(chunk for seq, chunk in self.history if seq > since)
+        
+    def close(self):
+        for watcher in self.watchers:
+            watcher.close()
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class DownloadDaemon:
+    """Serves the JSON API for one Engine on the running event loop"""
+    
+    def __init__(self, engine, events, token=None):
+        self.engine = engine
+        self.queue = engine.queue
+        self.events = events
+        self.token = token
+        self.root = Path(engine.args.output_dir).resolve()
+        self.hub = EventHub()
+        self.server = None
+        self._pump = None
+        
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self._pump = asyncio.ensure_future(self.pump_events())
+        return self
+        
+    @property
+    def address(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return host, port
+        
+    async def stop(self):
+        self.server.close()
+        self.hub.close()
+        if self._pump is not None:
+            self._pump.cancel()
+        await self.server.wait_closed()
+        
+    async def pump_events(self):
+        while True:
+            await asyncio.sleep(EVENT_TICK)
+            drained = self.events.drain()
+            if drained:
+                self.hub.publish([self.encode_event(event) for event in drained])
+                
+    def encode_event(self, event):
+        if event.kind == JOB:
+            job = self.queue.jobs.get(event.job_id)
+            # Read at drain time, so a merged event carries the latest state
+            return JOB, job.to_dict() if job is not None else {'id': event.job_id}
+        if event.kind == PROGRESS:
+            return PROGRESS, dict(event.data, id=event.job_id)
+        return event.kind, event.data
+        
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    writer.write(response_bytes(e.status, {'error': e.message}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                try:
+                    self.check_host(request)
+                    self.check_token(request)
+                    if request.method == 'GET' and request.path == '/events':
+                        await self.stream_events(request, writer)
+                        break
+                    status, payload = await self.dispatch(request)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                writer.write(response_bytes(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            
+    def check_host(self, request):
+        if self.token is not None:
+            return
+        host = urlsplit('//' + request.headers.get('host', '')).hostname
+        if not host or not (is_loopback(host) or host == self.address[0]):
+            raise HTTPError(403, "Host not allowed; use a loopback address or set a token")
+            
+    def check_token(self, request):
+        if self.token is None:
+            return
+        supplied = request.query.get('token') or ''
+        auth = request.headers.get('authorization', '')
+        if auth.lower().startswith('bearer '):
+            supplied = auth[7:].strip()
+        if not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            raise HTTPError(401, "Missing or wrong token")
+            
+    async def dispatch(self, request):
+        parts = [part for part in request.path.split('/') if part]
+        method = request.method
+        if parts == ['status'] and method == 'GET':
+            return 200, self.status()
+        if parts == ['settings'] and method in ('GET', 'PUT'):
+            if method == 'PUT':
+                self.update_settings(request.json())
+            return 200, self.settings()
+        if parts == ['jobs'] and method == 'GET':
+            return 200, self.list_jobs(request.query)
+        if parts == ['jobs'] and method == 'POST':
+            return await self.submit(request.json())
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.find_job(parts[1])
+            if method == 'GET':
+                return 200, job.to_dict()
+            if method == 'DELETE':
+                # A running download stops at its next progress update and then reports CANCELLED
+                if not self.queue.abort(job.id):
+                    raise HTTPError(409, f"Job {job.id} is {job.status}; only queued and running jobs "
+                                         "can be cancelled")
+                return 200, job.to_dict()
+        if parts and parts[0] in ('status', 'settings', 'jobs'):
+            raise HTTPError(405, f"{method} is not supported on {request.path}")
+        raise HTTPError(404, f"No such endpoint: {request.path}")
+        
+    def status(self):
+        return {'counts': self.queue.counts(), 'settings': self.settings(),
+                'paused_hosts': self.engine.breaker.paused(),
+                'watchers': len(self.hub.watchers), 'seq': self.hub.seq}
+                
+    def settings(self):
+        return {'max_workers': self.queue.max_workers, 'host_limit': self.queue.host_limit,
+                'rate': self.engine.bandwidth.rate, 'output_dir': str(self.root)}
+                
+    def update_settings(self, data):
+        if 'max_workers' in data:
+            try:
+                count = int(data['max_workers'])
+            except (TypeError, ValueError):
+                raise HTTPError(400, "max_workers must be a number")
+            self.queue.set_max_workers(count)
+        if 'rate' in data:
+            value = data['rate']
+            try:
+                rate = parse_rate(value) if isinstance(value, str) else (int(value) if value else None)
+            except (TypeError, ValueError) as e:
+                raise HTTPError(400, f"Invalid rate: {e}")
+            self.engine.bandwidth.set_rate(rate)
+            
+    def find_job(self, text):
+        try:
+            job = self.queue.jobs.get(int(text))
+        except ValueError:
+            job = None
+        if job is None:
+            raise HTTPError(404, f"No job {text}")
+        return job
+        
+    def list_jobs(self, query):
+        try:
+            after = int(query.get('after', 0))
+            limit = min(int(query.get('limit', DEFAULT_LIST_LIMIT)), MAX_LIST_LIMIT)
+        except ValueError:
+            raise HTTPError(400, "after and limit must be numbers")
+        statuses = set(query['status'].split(',')) if query.get('status') else None
+        jobs = [job for job in self.queue.snapshot()
+                if job.id > after and (statuses is None or job.status in statuses)]
+        page = jobs[:max(limit, 1)]
+        return {'jobs': [job.to_dict() for job in page],
+                'next': page[-1].id if len(jobs) > len(page) else None}
+                
+    def output_dir(self, value):
+        if not value:
+            return str(self.root)
+        path = (self.root / str(value)).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise HTTPError(403, f"Output folder must be inside {self.root}")
+        return str(path)
+        
+    async def submit(self, data):
+        urls = data.get('urls')
+        if urls is None and data.get('url'):
+            urls = [data['url']]
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+            raise HTTPError(400, "Expected 'url' or a non-empty list of 'urls'")
+        quality = data.get('quality', 'best')
+        if quality not in QUALITIES:
+            raise HTTPError(400, f"quality must be one of {', '.join(QUALITIES)}")
+        priority = data.get('priority', 'normal')
+        if priority not in PRIORITIES:
+            raise HTTPError(400, f"priority must be one of {', '.join(PRIORITIES)}")
+        output_dir = self.output_dir(data.get('output_dir'))
+        
+        jobs, rejected = [], []
+        for url in urls:
+            url = url.strip()
+            if is_valid_url(url):
+                jobs.append(Job(url, quality=quality, output_dir=output_dir, priority=PRIORITIES[priority]))
+            else:
+                rejected.append({'url': url, 'error': "Invalid URL"})
+        if not jobs:
+            raise HTTPError(400, "No valid URLs")
+        # Journal writes are fsync'ed; keep them off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.queue.submit_many, jobs)
+        return 201, {'jobs': [job.to_dict() for job in jobs], 'rejected': rejected}
+        
+    async def stream_events(self, request, writer):
+        since = request.headers.get('last-event-id') or request.query.get('since')
+        watcher = Watcher()
+        # Registered before the snapshot, with no await in between, so nothing is missed
+        self.hub.watchers.add(watcher)
+        try:
+            backlog = self.hub.replay(int(since)) if since and since.isdigit() else None
+            if backlog is None:
+                # New watcher or one that fell too far behind: start from the current state
+                backlog = b''.join(sse_bytes(self.hub.seq, JOB, job.to_dict())
+                                   for job in self.queue.snapshot())
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                         b"Cache-Control: no-store\r\n"
+                         b"Connection: close\r\n\r\n"
+                         b"retry: 2000\n\n" + backlog)
+            await writer.drain()
+            while not watcher.closed:
+                try:
+                    await asyncio.wait_for(watcher.wake.wait(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                    await writer.drain()
+                    continue
+                watcher.wake.clear()
+                if watcher.overflowed:
+                    break
+                chunks = list(watcher.batches)
+                watcher.batches.clear()
+                writer.write(b''.join(chunks))
+                await writer.drain()
+        finally:
+            self.hub.watchers.discard(watcher)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader.daemon',
+        description="Run the download engine as a service with a JSON API.")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f"address to listen on; 0.0.0.0 for the LAN (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port (default: {DEFAULT_PORT})")
+    parser.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                        help=f"require this bearer token (default: ${TOKEN_ENV}; generated when "
+                             "listening beyond localhost)")
+    add_engine_arguments(parser)
+    return parser
+
+
+async def serve(args):
+    journal = JobJournal(args.journal or get_data_dir() / 'daemon-journal.ndjson')
+    events = EventChannel()
+    
+    def log(message):
+        events.post(LOG, message=message)
+        if args.verbose:
+            print(message, file=sys.stderr, flush=True)
+            
+    def on_progress(job, d, snapshot):
+        events.post(PROGRESS, job.id, **snapshot)
+        
+    token = args.token
+    if token is None and not is_loopback(args.host):
+        token = secrets.token_urlsafe(16)
+        print(f"Generated API token: {token}", file=sys.stderr, flush=True)
+        
+    engine = Engine(args, journal, log, lambda job: events.post(JOB, job.id), on_progress)
+    daemon = await DownloadDaemon(engine, events, token).start(args.host, args.port)
+    host, port = daemon.address
+    print(f"Listening on http://{host}:{port}", file=sys.stderr, flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, engine.resume, journal.pending())
+    
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stopped.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+            pass
+    try:
+        await stopped.wait()
+    finally:
+        await daemon.stop()
+        # Queued jobs stay unfinished in the journal and are resumed on the next start;
+        # running ones still write their result, so the journal stays open until they are done
+        engine.queue.shutdown(wait=False)
+        engine.close_metrics()
+    active = engine.queue.counts().get(ACTIVE, 0)
+    if active:
+        print(f"Waiting for {active} running download(s); stop again to quit now",
+              file=sys.stderr, flush=True)
+    stopped.clear()
+    finished = loop.create_future()
+    
+    def shutdown():
+        engine.shutdown()
+        try:
+            loop.call_soon_threadsafe(finished.set_result, None)
+        except RuntimeError:
+            # The loop is gone after a second stop
+            pass
+            
+    # Not the loop's executor: asyncio.run() would wait for it on the way out
+    threading.Thread(target=shutdown, daemon=True, name='engine-shutdown').start()
+    await asyncio.wait([finished, asyncio.ensure_future(stopped.wait())],
+                       return_when=asyncio.FIRST_COMPLETED)
+    if not finished.done():
+        # Leave the journal open: every record is already fsync'ed, and the workers may still write
+        return False
+    journal.close()
+    return True
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        finished = asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return 0
+    if not finished:
+        # Stopped twice: don't wait for the download and encoder threads at interpreter exit
+        sys.stderr.flush()
+        os._exit(130)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
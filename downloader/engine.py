@@ -0,0 +1,217 @@
+"""
+Headless download pipeline shared by the command line and the daemon.
+
+An Engine owns the job queue and everything its runner needs: the info
+cache, download archive, transcode pool, session pool, bandwidth
+scheduler, retry policy, per-host circuit breaker and optional metrics.
+It is configured from the options that add_engine_arguments() defines;
+default_arguments() gives those options without a command line, as the
+GUI uses them.
+"""
+
+import argparse
+import sqlite3
+import threading
+from pathlib import Path
+
+from .archive import DownloadArchive
+from .bandwidth import BandwidthScheduler, parse_rate
+from .formats import POLICIES, QUALITY
+from .infocache import InfoCache
+from .metrics import Metrics, MetricsServer
+from .progress import DEFAULT_MIN_INTERVAL, ProgressBoard
+from .retry import DEFAULT_RETRIES, CircuitBreaker, RetryPolicy
+from .segmented import DEFAULT_MAX_CONNECTIONS
+from .sessions import SessionPool, DEFAULT_MAX_IDLE
+from .transcode import TranscodePool
+from .jobqueue import (Job, DownloadQueue, DEFAULT_MAX_WORKERS, DEFAULT_HOST_LIMIT, INTERACTIVE,
+                       NORMAL, BULK, host_key)
+
+
+PRIORITIES = {'interactive': INTERACTIVE, 'normal': NORMAL, 'bulk': BULK}
+
+
+def host_rate(text):
+    """Parse a --host-rate value like youtube.com=2M"""
+    host, sep, rate = text.partition('=')
+    if not sep or not host:
+        raise argparse.ArgumentTypeError(f"expected HOST=RATE, got {text!r}")
+    try:
+        return host_key('//' + host), parse_rate(rate)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def rate(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_engine_arguments(parser):
+    parser.add_argument('-o', '--output-dir', default=str(Path.cwd() / 'downloads'),
+                        help="download folder (default: ./downloads)")
+    parser.add_argument('-j', '--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"parallel downloads (default: {DEFAULT_MAX_WORKERS})")
+    parser.add_argument('--host-limit', type=int, default=DEFAULT_HOST_LIMIT,
+                        help=f"parallel downloads per site (default: {DEFAULT_HOST_LIMIT})")
+    parser.add_argument('-c', '--connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help="max parallel connections per file, 1 disables splitting "
+                             f"(default: {DEFAULT_MAX_CONNECTIONS})")
+    parser.add_argument('--transcode-workers', type=int, default=None,
+                        help="parallel MP3 encodes in audio mode (default: CPU count)")
+    parser.add_argument('--stream-audio', action='store_true',
+                        help="in audio mode, encode MP3 while downloading without a temporary file")
+    parser.add_argument('--format-policy', choices=POLICIES, default=QUALITY,
+                        help="'quality' picks the best format the site profile allows, 'fastest' the "
+                             "cheapest to download and convert that is still good enough (default: quality)")
+    parser.add_argument('-r', '--limit-rate', type=rate, metavar='RATE',
+                        help="total download speed, such as 500K or 2M bytes per second")
+    parser.add_argument('--host-rate', type=host_rate, action='append', default=[],
+                        metavar='HOST=RATE', help="download speed cap for one site (repeatable)")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="retries of a job after a transient error such as HTTP 429 or 503, "
+                             f"with growing delays (default: {DEFAULT_RETRIES})")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="append per-job phase spans to FILE (Chrome trace format)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always extract video info instead of using the local cache")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="download again even if the URL is in the download archive")
+    parser.add_argument('--journal', metavar='FILE',
+                        help="job journal used to resume interrupted batches")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log progress to stderr")
+
+
+def default_arguments(**values):
+    """Engine options as parsed from an empty command line, with `values` replacing some"""
+    parser = argparse.ArgumentParser(add_help=False)
+    add_engine_arguments(parser)
+    args = parser.parse_args([])
+    for name, value in values.items():
+        if not hasattr(args, name):
+            raise TypeError(f"unknown engine option {name!r}")
+        setattr(args, name, value)
+    return args
+
+
+class Engine:
+    """Download queue and its shared resources, configured from parsed arguments.
+    
+    `on_update` is called with a job after every state change.
+    `on_progress(job, d, snapshot)` receives yt-dlp progress dicts together
+    with a ProgressBoard snapshot, at most every `progress_interval` seconds
+    per job.
+    """
+    
+    def __init__(self, args, journal, log, on_update=None, on_progress=None,
+                 progress_interval=DEFAULT_MIN_INTERVAL):
+        self.args = args
+        self.journal = journal
+        self.log = log
+        self.on_progress = on_progress
+        self.board = ProgressBoard(min_interval=progress_interval)
+        self.info_cache = None if args.no_cache else InfoCache()
+        self.archive = None
+        if not args.no_archive:
+            self.archive = DownloadArchive()
+            self.index(args.output_dir)
+        self.transcoder = TranscodePool(max_workers=args.transcode_workers)
+        # Every worker can keep a warm session between jobs
+        self.sessions = SessionPool(max_idle=max(DEFAULT_MAX_IDLE, args.workers))
+        self.bandwidth = BandwidthScheduler(args.limit_rate, dict(args.host_rate))
+        # Transient errors are retried by the queue; a host that keeps failing is paused
+        self.breaker = CircuitBreaker()
+        self.metrics = None
+        self.metrics_server = None
+        if args.metrics_port is not None or args.trace:
+            self.metrics = Metrics(args.trace)
+        if args.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, args.metrics_port).start()
+            log(f"Serving metrics on {self.metrics_server.url}")
+        self.queue = DownloadQueue(self.run, max_workers=args.workers, host_limit=args.host_limit,
+                                   on_update=on_update, journal=journal,
+                                   retry=RetryPolicy(args.retries), breaker=self.breaker,
+                                   metrics=self.metrics)
+        # Where playlist entries go; the local queue unless replaced
+        self.expand = self.queue.feed
+        if self.metrics is not None:
+            self.metrics.add_gauge('downloader_queue_jobs', "Jobs per queue state", self.queue.counts, 'state')
+            self.metrics.add_gauge('downloader_host_paused_seconds', "Seconds until a failing host gets jobs again",
+                                   self.breaker.paused, 'host')
+            
+    def index(self, folder):
+        """Catch the archive up with files already in `folder`, on a background thread"""
+        if self.archive is None:
+            return
+        # Hashes every new file in the folder, so it runs beside the first jobs
+        threading.Thread(target=self._rebuild_archive, args=(folder,), daemon=True,
+                         name='archive-rebuild').start()
+        
+    def _rebuild_archive(self, folder):
+        try:
+            count = self.archive.rebuild(folder)
+        except (OSError, sqlite3.Error) as e:
+            self.log(f"Cannot index {folder}: {e}")
+            return
+        if count:
+            self.log(f"Indexed {count} existing file(s) in {folder}")
+            
+    def run(self, job):
+        """Queue runner: download one job on a worker thread"""
+        # Imported here so the GUI can draw its window before yt_dlp is loaded
+        from yt_dlp.utils import DownloadCancelled
+        from . import core
+        
+        def progress_hook(d):
+            if job.aborted:
+                raise DownloadCancelled(f"Job {job.id} was aborted")
+            snapshot = self.on_progress and self.board.update(job.id, d)
+            if snapshot:
+                self.on_progress(job, d, snapshot)
+                
+        # Keep yt-dlp quiet; progress and results are reported by the caller
+        try:
+            return core.run_job(job, progress_hook=progress_hook,
+                                log=self.log, info_cache=self.info_cache, archive=self.archive,
+                                journal=self.journal, connections=self.args.connections,
+                                transcoder=self.transcoder, stream_audio=self.args.stream_audio,
+                                expand=self.expand, sessions=self.sessions,
+                                bandwidth=self.bandwidth, metrics=self.metrics,
+                                format_policy=self.args.format_policy,
+                                ydl_opts={'quiet': True, 'no_warnings': not self.args.verbose,
+                                          'noprogress': True})
+        finally:
+            self.board.remove(job.id)
+            
+    def resume(self, records, quality='best'):
+        """Requeue unfinished journal records; returns the new jobs"""
+        jobs = []
+        for record in records:
+            self.log(f"Resuming {record['url']}")
+            jobs.append(Job(record['url'], quality=record.get('quality', quality),
+                            output_dir=record.get('output_dir') or self.args.output_dir,
+                            format=record.get('format'), uid=record['uid'],
+                            priority=record.get('priority', NORMAL)))
+        return self.queue.submit_many(jobs)
+        
+    def close_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.metrics is not None:
+            self.metrics.close()
+            
+    def shutdown(self):
+        """Wait for the workers and encoders, then close the sessions"""
+        self.queue.shutdown()
+        self.transcoder.shutdown()
+        self.sessions.close()
+        self.log("Sessions: {created} created, {reused} reused".format(**self.sessions.stats()))
+        stats = self.transcoder.stats()
+        if stats['completed'] or stats['failed']:
+            self.log(f"Transcoded {stats['completed']} file(s) in {stats['encode']:.1f}s, "
+                     f"waited {stats['wait']:.1f}s for an encoder, blocked downloads for {stats['blocked']:.1f}s")
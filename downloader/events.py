@@ -0,0 +1,65 @@
+"""
+Thread-safe event channel between download workers and the UI loop.
+
+Workers post events from any thread; the UI drains them in batches on its
+own thread. Events that only describe the latest state of a job (progress
+and status) are merged, so a drain returns at most one of each per job no
+matter how many chunks were downloaded since the last tick.
+"""
+
+import itertools
+import threading
+
+
+# Event kinds
+LOG = 'log'
+JOB = 'job'
+PROGRESS = 'progress'
+
+# Kinds where only the most recent event per job matters
+MERGED_KINDS = (JOB, PROGRESS)
+
+
+class Event:
+    __slots__ = ('kind', 'job_id', 'data')
+    
+    def __init__(self, kind, job_id=None, data=None):
+        self.kind = kind
+        self.job_id = job_id
+        self.data = data or {}
+        
+    def __repr__(self):
+        return f"<Event {self.kind} job={self.job_id} {self.data}>"
+
+
+class EventChannel:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seq = itertools.count()
+        
+    def post(self, kind, job_id=None, **data):
+        """Queue an event; safe to call from any thread"""
+        if kind in MERGED_KINDS and job_id is not None:
+            key = (kind, job_id)
+        else:
+            key = next(self._seq)
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is not None:
+                # Keep the original position, fold in the newer fields
+                previous.data.update(data)
+            else:
+                self._pending[key] = Event(kind, job_id, data)
+                
+    def drain(self):
+        """Return and clear all pending events in posting order"""
+        with self._lock:
+            if not self._pending:
+                return []
+            pending, self._pending = self._pending, {}
+        return list(pending.values())
+        
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
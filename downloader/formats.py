@@ -0,0 +1,239 @@
+"""
+Cost-aware format selection.
+
+yt-dlp's format strings only say which formats are acceptable. This
+module looks at the formats a site actually offers and estimates what
+each choice costs end to end: the bytes to transfer, an ffmpeg merge for
+separate video and audio streams, and an MP3 encode when the audio is not
+MP3 already. Site profiles set the limits (maximum height, container)
+per domain; a candidate in another container is only taken when the
+site offers nothing in its own.
+
+Two policies are available:
+
+    quality   highest quality single file within the site profile, as the
+              site format string picks it; among candidates of the same
+              quality, audio that needs no MP3 encode wins, then cost
+              decides (the default)
+    fastest   cheapest candidate that still meets the profile's minimum
+              quality, merging separate streams when no single file
+              does; in audio mode an AAC stream is kept as .m4a instead
+              of being encoded to MP3
+
+The result is a Choice whose `spec` is a plain yt-dlp format string, so
+merging and fallbacks still go through yt-dlp.
+"""
+
+from .jobqueue import host_key
+
+
+QUALITY = 'quality'
+FASTEST = 'fastest'
+POLICIES = (QUALITY, FASTEST)
+
+# Assumptions used to turn bytes and codecs into seconds
+ASSUMED_BANDWIDTH = 4 * 1024 * 1024  # bytes per second
+FFMPEG_STARTUP = 0.3                 # seconds per ffmpeg run
+REMUX_RATE = 150 * 1024 * 1024       # bytes per second for a stream-copy merge
+MP3_ENCODE_SPEED = 40.0              # seconds of audio encoded per second
+
+# Audio bitrates are compared in steps of this many kbit/s
+ABR_STEP = 32
+
+# Video and audio containers that merge into the same container without re-encoding
+MERGEABLE = {('mp4', 'm4a'): 'mp4', ('mp4', 'mp4'): 'mp4', ('webm', 'webm'): 'webm'}
+
+# Audio that can be kept as is under the fastest policy
+KEEP_AUDIO_EXTS = ('mp3', 'm4a')
+
+DEFAULT_PROFILE = {
+    'format': 'best[ext=mp4]/best',
+    'max_height': None,
+    'min_height': 360,
+    'min_abr': 96,
+    'prefer_ext': 'mp4',
+}
+
+# Site profiles, keyed by jobqueue.host_key(); missing keys come from DEFAULT_PROFILE
+SITE_PROFILES = {
+    'youtube.com': {'format': 'best[height<=1080][ext=mp4]/best[ext=mp4]/best', 'max_height': 1080,
+                    'min_height': 480},
+    'twitter.com': {},
+    'reddit.com': {},
+    'tiktok.com': {'min_height': 540},
+}
+SITE_PROFILES = {site: dict(DEFAULT_PROFILE, **profile) for site, profile in SITE_PROFILES.items()}
+
+
+def site_profile(url):
+    return SITE_PROFILES.get(host_key(url), DEFAULT_PROFILE)
+
+
+class Candidate:
+    """One way to satisfy a job: a single format or a video+audio pair"""
+    
+    def __init__(self, formats, duration, to_mp3, merge_ext=None):
+        self.formats = formats
+        self.merge_ext = merge_ext
+        self.to_mp3 = to_mp3
+        # Audio kept as downloaded although MP3 was asked for
+        self.keep = False
+        sizes = [estimate_size(f, duration) for f in formats]
+        self.size = None if None in sizes else sum(sizes)
+        self.height = max((f.get('height') or 0 for f in formats), default=0)
+        self.abr = max((f.get('abr') or 0 for f in formats), default=0)
+        self.ext = merge_ext or formats[0].get('ext')
+        
+        self.transfer = None if self.size is None else self.size / ASSUMED_BANDWIDTH
+        self.processing = 0.0
+        if merge_ext:
+            self.processing += FFMPEG_STARTUP + (self.size or 0) / REMUX_RATE
+        if to_mp3:
+            seconds = duration or (self.size * 8 / (self.abr * 1000) if self.size and self.abr else 0)
+            self.processing += FFMPEG_STARTUP + seconds / MP3_ENCODE_SPEED
+            
+    @property
+    def spec(self):
+        return '+'.join(str(f['format_id']) for f in self.formats)
+        
+    @property
+    def cost(self):
+        # Unknown sizes sort after every known one
+        return float('inf') if self.transfer is None else self.transfer + self.processing
+        
+    def describe(self):
+        parts = [f"{self.height}p" if self.height else f"{self.abr:.0f}k" if self.abr else "?",
+                 self.ext or "?",
+                 f"~{self.size / 1024 / 1024:.1f} MB" if self.size is not None else "size unknown"]
+        if self.merge_ext:
+            parts.append("merge")
+        if self.to_mp3:
+            parts.append("MP3 encode")
+        elif self.keep:
+            parts.append("kept without MP3 encode")
+        elif not self.merge_ext:
+            parts.append("no post-processing")
+        return ', '.join(parts)
+
+
+class Choice:
+    def __init__(self, candidate, runner_up, policy, count):
+        self.candidate = candidate
+        # Keep the file as downloaded instead of encoding it to MP3
+        self.keep_audio = candidate.keep
+        self.spec = candidate.spec
+        self.reason = (f"Format {candidate.spec} ({candidate.describe()}): "
+                       f"{_seconds(candidate.transfer)} transfer + {candidate.processing:.1f}s processing, "
+                       f"best of {count} under '{policy}'")
+        if runner_up is not None:
+            self.reason += f"; next {runner_up.spec} ({runner_up.describe()}, {_seconds(runner_up.cost)})"
+
+
+def _seconds(value):
+    return "?" if value is None or value == float('inf') else f"~{value:.1f}s"
+
+
+def estimate_size(fmt, duration):
+    """Bytes a format will transfer, from its stated or approximate size or bitrate"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def _is_audio_only(fmt):
+    return fmt.get('vcodec') == 'none' and fmt.get('acodec') != 'none'
+
+
+def _is_video_only(fmt):
+    return fmt.get('acodec') == 'none' and fmt.get('vcodec') != 'none'
+
+
+def _has_both(fmt):
+    # Missing codec fields mean the site did not say; such formats usually carry both
+    return fmt.get('vcodec') != 'none' and fmt.get('acodec') != 'none'
+
+
+def video_candidates(formats, duration, can_merge):
+    candidates = [Candidate([f], duration, False) for f in formats if _has_both(f)]
+    if can_merge:
+        audio = [f for f in formats if _is_audio_only(f)]
+        for video in (f for f in formats if _is_video_only(f)):
+            for track in audio:
+                merge_ext = MERGEABLE.get((video.get('ext'), track.get('ext')))
+                if merge_ext:
+                    candidates.append(Candidate([video, track], duration, False, merge_ext))
+    return candidates
+
+
+def audio_candidates(formats, duration, to_mp3):
+    candidates = []
+    for fmt in formats:
+        if not (_is_audio_only(fmt) or _has_both(fmt)):
+            continue
+        already_mp3 = fmt.get('ext') == 'mp3' or fmt.get('acodec') == 'mp3'
+        candidates.append(Candidate([fmt], duration, to_mp3 and not already_mp3))
+    # Audio-only formats first; a video file only supplies audio when nothing else does
+    audio_only = [c for c in candidates if _is_audio_only(c.formats[0])]
+    return audio_only or candidates
+
+
+def choose_format(info, quality, policy=QUALITY, ffmpeg=None, keep_audio=False):
+    """Return the cheapest Choice for an extracted video under `policy`, or None to use the site default.
+    
+    `ffmpeg` enables merges and MP3 encoding. With `keep_audio`, the
+    fastest policy may skip the MP3 encode for audio it can keep as is.
+    """
+    formats = [f for f in info.get('formats') or [] if f.get('format_id')]
+    if len(formats) < 2 or quality not in ('best', 'audio'):
+        return None
+    profile = site_profile(info.get('webpage_url') or info.get('original_url') or info.get('url') or '')
+    duration = info.get('duration')
+    
+    if quality == 'audio':
+        candidates = audio_candidates(formats, duration, to_mp3=bool(ffmpeg))
+        if policy == FASTEST and keep_audio:
+            for candidate in candidates:
+                if candidate.to_mp3 and candidate.ext in KEEP_AUDIO_EXTS:
+                    candidate.keep = True
+                    candidate.to_mp3 = False
+                    candidate.processing = 0.0
+        floor = profile['min_abr']
+        
+        def level(candidate):
+            return (candidate.abr or 0) // ABR_STEP
+    else:
+        # The default policy stays with the single files the site format string picks;
+        # only the fastest policy weighs a merge against them
+        candidates = video_candidates(formats, duration, can_merge=bool(ffmpeg) and policy == FASTEST)
+        cap = profile['max_height']
+        if cap:
+            capped = [c for c in candidates if c.height <= cap]
+            candidates = capped or candidates
+        # Keep the site's container, like its [ext=...] filter
+        preferred = [c for c in candidates if c.ext == profile['prefer_ext']]
+        candidates = preferred or candidates
+        floor = profile['min_height']
+        
+        def level(candidate):
+            return candidate.height
+    if not candidates:
+        return None
+        
+    prefer = profile['prefer_ext']
+    if policy == FASTEST:
+        # Cheapest of those meeting the floor, or of the best available when none does
+        good_enough = [c for c in candidates if (c.abr if quality == 'audio' else c.height) >= floor]
+        # A merge only when no single file is good enough
+        good_enough = [c for c in good_enough if not c.merge_ext] or good_enough
+        if not good_enough:
+            top = max(level(c) for c in candidates)
+            good_enough = [c for c in candidates if level(c) == top]
+        ranked = sorted(good_enough, key=lambda c: (c.cost, c.ext != prefer, -level(c)))
+    else:
+        # At the same quality, audio that is MP3 already wins over an encode
+        ranked = sorted(candidates, key=lambda c: (-level(c), c.to_mp3, c.ext != prefer, c.cost))
+        
+    return Choice(ranked[0], ranked[1] if len(ranked) > 1 else None, policy, len(candidates))
@@ -0,0 +1,164 @@
+"""
+On-disk cache of yt-dlp extraction results.
+
+Entries hold the unprocessed extract_info() result, before format
+selection, so switching between auto, audio and mute reuses the same
+entry. An entry expires after its TTL or shortly before the signed stream
+URLs inside it stop working, whichever comes first. The cache is bounded
+by entry count and total size and evicts the least recently used entries.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse, parse_qs
+
+from .paths import get_data_dir
+
+
+DEFAULT_TTL = 6 * 3600
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Drop entries this many seconds before their stream URLs expire
+EXPIRY_MARGIN = 300
+
+# Signed URLs carry their expiry as a Unix timestamp in one of these
+EXPIRY_QUERY_PARAMS = ('expire', 'expires', 'x-expires', 'Expires', 'X-Amz-Expires-At')
+EXPIRY_PATH_PATTERN = re.compile(r'/expire/(\d{9,11})(?:/|$)')
+
+
+def stream_expiry(info):
+    """Return the earliest expiry timestamp of the stream URLs in info, or None"""
+    earliest = None
+    for fmt in info.get('formats') or [info]:
+        url = fmt.get('url')
+        if not url:
+            continue
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        candidates = [query[name][0] for name in EXPIRY_QUERY_PARAMS if name in query]
+        match = EXPIRY_PATH_PATTERN.search(parsed.path)
+        if match:
+            candidates.append(match.group(1))
+        for value in candidates:
+            try:
+                expires = int(value)
+            except ValueError:
+                continue
+            # Ignore relative lifetimes such as X-Amz-Expires=3600
+            if expires > 1_000_000_000 and (earliest is None or expires < earliest):
+                earliest = expires
+    return earliest
+
+
+def is_cacheable(info):
+    """Only single videos with plain, serializable formats are cached"""
+    if not info or info.get('_type', 'video') != 'video' or info.get('is_live'):
+        return False
+    for fmt in info.get('formats') or []:
+        # Some extractors build fragment lists lazily; those cannot be stored
+        if 'fragments' in fmt and not isinstance(fmt['fragments'], list):
+            return False
+    return True
+
+
+class InfoCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.path = str(path or get_data_dir() / 'info_cache.sqlite3')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL
+            )''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS info_last_used ON info (last_used)')
+        
+    def get(self, key):
+        """Return the cached info dict for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT data, expires FROM info WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM info WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE info SET last_used = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+        
+    def put(self, keys, info):
+        """Store a sanitized info dict under one or more keys"""
+        if isinstance(keys, str):
+            keys = [keys]
+        now = time.time()
+        expires = now + self.ttl
+        stream_expires = stream_expiry(info)
+        if stream_expires is not None:
+            expires = min(expires, stream_expires - EXPIRY_MARGIN)
+        if expires <= now:
+            return False
+            
+        data = zlib.compress(json.dumps(info, separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for key in set(keys):
+                    self._db.execute('INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?, ?)',
+                                     (key, data, len(data), now, expires, now))
+                self._evict(now)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return True
+        
+    def invalidate(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM info WHERE key = ?', (key,))
+            
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM info')
+            
+    def stats(self):
+        with self._lock:
+            count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM info').fetchone()
+        return {'entries': count, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
+        
+    def close(self):
+        with self._lock:
+            self._db.close()
+            
+    def _evict(self, now):
+        # Called inside a transaction: expired entries first, then least recently used
+        self._db.execute('DELETE FROM info WHERE expires <= ?', (now,))
+        count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM info').fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        for key, entry_size in self._db.execute(
+                'SELECT key, size FROM info ORDER BY last_used').fetchall():
+            if count <= self.max_entries and size <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM info WHERE key = ?', (key,))
+            count -= 1
+            size -= entry_size
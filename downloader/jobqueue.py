@@ -0,0 +1,458 @@
+"""
+Job queue with a bounded worker pool and per-host concurrency limits.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, Future
+from urllib.parse import urlparse
+
+from .metrics import RETRIED
+from .retry import HostDown, classify, short_reason
+
+
+DEFAULT_MAX_WORKERS = 3
+DEFAULT_HOST_LIMIT = 2
+# Playlist entries kept queued ahead of the workers
+DEFAULT_PREFETCH = 10
+
+# Job states
+QUEUED = 'queued'
+ACTIVE = 'active'
+# Downloaded, waiting for post-processing outside the worker pool
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Job priorities; lower values are started first and get bandwidth first
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+# Sites that are reachable under several domains share one host slot
+SITE_DOMAINS = {
+    'youtube.com': 'youtube.com',
+    'youtu.be': 'youtube.com',
+    'twitter.com': 'twitter.com',
+    'x.com': 'twitter.com',
+    'reddit.com': 'reddit.com',
+    'redd.it': 'reddit.com',
+    'tiktok.com': 'tiktok.com',
+}
+
+
+def host_key(url):
+    """Return the normalized domain used to group jobs per host"""
+    domain = urlparse(url).netloc.lower()
+    # Drop credentials and port
+    domain = domain.rsplit('@', 1)[-1].split(':', 1)[0]
+    
+    for site, key in SITE_DOMAINS.items():
+        if domain == site or domain.endswith('.' + site):
+            return key
+            
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain
+
+
+class Job:
+    """A single download request and its current state"""
+    
+    _ids = itertools.count(1)
+    
+    def __init__(self, url, quality='best', output_dir='downloads', format=None, uid=None,
+                 parent=None, priority=NORMAL):
+        self.id = next(Job._ids)
+        # Stable across restarts, unlike id
+        self.uid = uid or uuid.uuid4().hex
+        self.url = url
+        self.host = host_key(url)
+        self.quality = quality
+        self.output_dir = output_dir
+        # Exact yt-dlp format id, set when resuming a partial download
+        self.format = format
+        # Id of the playlist job this entry came from
+        self.parent = parent
+        self.priority = priority
+        # Entries queued so far when this job is a playlist
+        self.entries = None
+        self.status = QUEUED
+        self.created = time.time()
+        # When the job last entered the queue: created, or put back for a retry
+        self.queued_at = self.created
+        self.filename = None
+        self.error = None
+        # Set when the file was already in the download archive
+        self.skipped = False
+        self.started = None
+        self.finished = None
+        # Retries so far, and the time.time() the next one may start
+        self.attempts = 0
+        self.retry_at = None
+        # Set by DownloadQueue.abort(); the runner stops the job at its next progress update
+        self.aborted = False
+        # JobTrace of a failed attempt, closed by the queue once it knows whether the job is retried
+        self.trace = None
+        # Seconds spent in each pipeline stage
+        self.timings = {}
+        
+    def to_dict(self):
+        """Return a JSON-serializable summary of the job"""
+        elapsed = None
+        if self.started is not None and self.finished is not None:
+            elapsed = round(self.finished - self.started, 3)
+        return {
+            'id': self.id,
+            'url': self.url,
+            'quality': self.quality,
+            'status': self.status,
+            'filename': self.filename,
+            'error': self.error,
+            'skipped': self.skipped,
+            'parent': self.parent,
+            'priority': self.priority,
+            'entries': self.entries,
+            'attempts': self.attempts,
+            'retry_at': self.retry_at,
+            'elapsed': elapsed,
+            'timings': {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+        }
+        
+    def __repr__(self):
+        return f"<Job {self.id} {self.status} {self.url}>"
+
+
+class DownloadQueue:
+    """Runs queued jobs on a pool of worker threads.
+    
+    `runner` is called with each job on a worker thread and should raise on
+    failure. At most `max_workers` jobs run at once, and at most
+    `host_limit` of them (or the override in `host_limits`) share a host.
+    `on_update` is called with the job after every state change. A runner
+    may return a Future for work that continues after the download; the
+    job then frees its slot, stays PROCESSING and finishes with the future.
+    With a `retry` policy (see retry.py), jobs that fail with a transient
+    error go back to the queue until their backoff delay has passed. With
+    a `breaker`, hosts that keep failing get no new jobs for a while. With
+    `metrics` (see metrics.py), retries are counted and the trace of a
+    retried attempt is not counted as a failed job. With a `journal`,
+    jobs are recorded before they are queued and after they finish; jobs
+    dropped by shutdown() stay unfinished in the journal so they can be
+    resumed.
+    """
+    
+    def __init__(self, runner, max_workers=DEFAULT_MAX_WORKERS,
+                 host_limit=DEFAULT_HOST_LIMIT, host_limits=None, on_update=None, journal=None,
+                 retry=None, breaker=None, metrics=None):
+        self.runner = runner
+        self.max_workers = max(1, int(max_workers))
+        self.host_limit = max(1, int(host_limit))
+        self.host_limits = dict(host_limits or {})
+        self.on_update = on_update
+        self.journal = journal
+        self.retry = retry
+        self.breaker = breaker
+        self.metrics = metrics
+        
+        self.jobs = {}
+        self._pending = []
+        self._active_hosts = {}
+        self._active = 0
+        self._processing = 0
+        # When a job held back by its retry delay or its host's breaker becomes ready
+        self._wake_at = None
+        self._threads = []
+        self._closed = False
+        self._cond = threading.Condition()
+        
+    def submit(self, job):
+        """Add a job to the queue and return it"""
+        self.submit_many([job])
+        return job
+        
+    def submit_many(self, jobs):
+        """Add several jobs at once, with one journal write for all of them"""
+        if not jobs:
+            return jobs
+        if self._closed:
+            raise RuntimeError("Queue has been shut down")
+        if self.journal:
+            self.journal.record_queued_many(jobs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Queue has been shut down")
+            for job in jobs:
+                self.jobs[job.id] = job
+                self._pending.append(job)
+            self._spawn_workers()
+            self._cond.notify_all()
+        for job in jobs:
+            self._notify(job)
+        return jobs
+        
+    def feed(self, jobs, window=DEFAULT_PREFETCH):
+        """Submit jobs from an iterator, keeping at most `window` of them queued.
+        
+        The iterator is consumed on a separate thread, so a long or slow
+        playlist never holds a worker slot. Returns a Future resolving to
+        the number of jobs submitted once the iterator is exhausted, or
+        cancelled when shutdown() interrupts it.
+        """
+        result = Future()
+        
+        def run():
+            waiting = []
+            count = 0
+            try:
+                for job in jobs:
+                    with self._cond:
+                        def has_room():
+                            waiting[:] = [j for j in waiting if j.status == QUEUED]
+                            return self._closed or len(waiting) < window
+                        self._cond.wait_for(has_room)
+                        if self._closed:
+                            result.cancel()
+                            return
+                    self.submit(job)
+                    waiting.append(job)
+                    count += 1
+            except Exception as e:
+                result.set_exception(e)
+                return
+            finally:
+                close = getattr(jobs, 'close', None)
+                if close:
+                    close()
+            result.set_result(count)
+            
+        threading.Thread(target=run, daemon=True, name='playlist-feeder').start()
+        return result
+        
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return False
+            self._pending.remove(job)
+            job.status = CANCELLED
+            self._cond.notify_all()
+        if self.journal:
+            self.journal.record_finished(job)
+        self._notify(job)
+        return True
+        
+    def abort(self, job_id):
+        """Cancel a job, stopping it if it is already running.
+        
+        A running job is only flagged: the runner is expected to check
+        `job.aborted` and raise, and the job then ends CANCELLED instead of
+        failing or being retried.
+        """
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != ACTIVE:
+                job = None
+            else:
+                job.aborted = True
+        return job is not None or self.cancel(job_id)
+        
+    def set_max_workers(self, count):
+        with self._cond:
+            self.max_workers = max(1, int(count))
+            self._spawn_workers()
+            self._cond.notify_all()
+            
+    def set_host_limit(self, host, count):
+        with self._cond:
+            self.host_limits[host] = max(1, int(count))
+            self._cond.notify_all()
+            
+    def counts(self):
+        """Return the number of jobs in each state"""
+        with self._cond:
+            result = {}
+            for job in self.jobs.values():
+                result[job.status] = result.get(job.status, 0) + 1
+            return result
+            
+    def snapshot(self):
+        """Return every submitted job in id order"""
+        with self._cond:
+            jobs = list(self.jobs.values())
+        return sorted(jobs, key=lambda job: job.id)
+        
+    def wait(self, timeout=None):
+        """Block until every submitted job has finished"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._active and not self._processing, timeout)
+                
+    def shutdown(self, wait=True):
+        """Stop accepting jobs; pending jobs are cancelled"""
+        with self._cond:
+            self._closed = True
+            cancelled = self._pending
+            self._pending = []
+            for job in cancelled:
+                job.status = CANCELLED
+            self._cond.notify_all()
+        for job in cancelled:
+            self._notify(job)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+                
+    def _spawn_workers(self):
+        # Called with the lock held
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._worker, daemon=True,
+                                      name=f"download-worker-{len(self._threads) + 1}")
+            self._threads.append(thread)
+            thread.start()
+            
+    def _limit_for(self, host):
+        return self.host_limits.get(host, self.host_limit)
+        
+    def _next_job(self):
+        # Called with the lock held; oldest job of the highest priority whose host has a free slot
+        # and is not paused
+        self._wake_at = None
+        if self._active >= self.max_workers:
+            return None
+        now = time.time()
+        paused = {}
+        best = None
+        for index, job in enumerate(self._pending):
+            wait = job.retry_at - now if job.retry_at is not None else 0
+            if wait <= 0 and self.breaker is not None:
+                if job.host not in paused:
+                    paused[job.host] = self.breaker.available(job.host)
+                wait = paused[job.host]
+            if wait > 0:
+                if self._wake_at is None or now + wait < self._wake_at:
+                    self._wake_at = now + wait
+                continue
+            if (self._active_hosts.get(job.host, 0) < self._limit_for(job.host)
+                    and (best is None or job.priority < self._pending[best].priority)):
+                best = index
+                if job.priority == INTERACTIVE:
+                    break
+        if best is None:
+            return None
+        job = self._pending.pop(best)
+        if self.breaker is not None:
+            self.breaker.started(job.host)
+        return job
+        
+    def _retry_delay(self, job, error):
+        # Count the failure against the host; returns the delay before the job runs again, or None
+        if self.retry is None and self.breaker is None:
+            return None
+        failure = classify(error)
+        if self.breaker is not None:
+            self.breaker.failed(job.host, failure, short_reason(str(error)))
+        delay = self.retry.delay(job.attempts + 1, failure) if self.retry is not None else None
+        if delay is not None:
+            job.attempts += 1
+            job.retry_at = time.time() + delay
+            if self.metrics is not None:
+                self.metrics.inc('downloader_retries_total', host=job.host, kind='job')
+        return delay
+        
+    def _close_trace(self, job, error):
+        # The runner leaves the trace of a failed attempt to the queue, to close once job.status is decided
+        trace, job.trace = job.trace, None
+        if trace is not None:
+            status = RETRIED if job.status == QUEUED else job.status
+            trace.close(status, error if status == FAILED else None)
+            job.timings.update(trace.totals())
+            
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._cond.wait(None if self._wake_at is None else max(0, self._wake_at - time.time()))
+                    job = self._next_job()
+                self._active += 1
+                self._active_hosts[job.host] = self._active_hosts.get(job.host, 0) + 1
+                job.status = ACTIVE
+                job.started = time.time()
+                job.retry_at = None
+                job.error = None
+                # Playlist feeders wait for queued jobs to start
+                self._cond.notify_all()
+            self._notify(job)
+            
+            future = None
+            retry = None
+            try:
+                down = self.breaker.down(job.host) if self.breaker is not None else None
+                if down is not None:
+                    raise HostDown(f"{job.host} is not responding: {down}")
+                result = self.runner(job)
+                if self.breaker is not None:
+                    self.breaker.succeeded(job.host)
+                if isinstance(result, Future):
+                    future = result
+                    job.status = PROCESSING
+                else:
+                    job.status = DONE
+            except Exception as e:
+                if job.aborted:
+                    job.status = CANCELLED
+                else:
+                    job.error = str(e)
+                    retry = self._retry_delay(job, e)
+                    job.status = FAILED if retry is None else QUEUED
+                self._close_trace(job, e)
+            finally:
+                if future is None and retry is None:
+                    job.finished = time.time()
+                    if self.journal:
+                        self.journal.record_finished(job)
+                with self._cond:
+                    self._active -= 1
+                    self._active_hosts[job.host] -= 1
+                    if future is not None:
+                        self._processing += 1
+                    if retry is not None:
+                        if self._closed:
+                            job.status = CANCELLED
+                        else:
+                            job.queued_at = time.time()
+                            self._pending.append(job)
+                    self._cond.notify_all()
+            self._notify(job)
+            if future is not None:
+                future.add_done_callback(lambda f, job=job: self._processed(job, f))
+                
+    def _processed(self, job, future):
+        try:
+            future.result()
+            job.status = DONE
+        except CancelledError:
+            # Interrupted by shutdown(); left unfinished in the journal
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        job.finished = time.time()
+        if self.journal and job.status != CANCELLED:
+            self.journal.record_finished(job)
+        with self._cond:
+            self._processing -= 1
+            self._cond.notify_all()
+        self._notify(job)
+        
+    def _notify(self, job):
+        if self.on_update:
+            self.on_update(job)
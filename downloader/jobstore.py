@@ -0,0 +1,201 @@
+"""
+Job table shared by worker processes on several machines.
+
+Workers claim jobs with time-limited leases. A lease is kept alive by
+renew() (the heartbeat); when a worker dies, its lease expires and the
+next claim() picks the job up again, with the format and partial file
+the first worker recorded, so the transfer continues where it stopped
+on a shared download folder. Every claim gets a new random token, and a
+result is only written while the token still matches: a worker that
+lost its lease cannot overwrite the result of the worker that took the
+job over, so each job is committed exactly once.
+
+The table lives in SQLite. The rollback journal is used instead of WAL
+because WAL does not work on network filesystems; every change is a
+short BEGIN IMMEDIATE transaction. Lease expiry compares wall clocks,
+so the machines need synchronized clocks (NTP) well within the lease
+length. Another backend only has to provide the public methods of
+JobStore.
+"""
+
+import hashlib
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .jobqueue import NORMAL
+
+
+# Seconds a claim is valid without a heartbeat
+DEFAULT_LEASE = 60.0
+# Claims of one job before a lease that keeps expiring fails it
+MAX_ATTEMPTS = 3
+
+# Job states in the store; a leased job whose lease expired counts as queued
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def stable_uid(*parts):
+    """Uid derived from what identifies a job, so adding the same job again adds nothing"""
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+class Lease:
+    """A claimed job; `token` proves the claim is still ours"""
+    
+    def __init__(self, row, token, expires):
+        (self.id, self.uid, self.url, self.quality, self.output_dir, self.priority, self.format,
+         self.path, self.attempts) = row
+        self.token = token
+        self.expires = expires
+        
+    def __repr__(self):
+        return f"<Lease {self.id} {self.url} attempt {self.attempts}>"
+
+
+class JobStore:
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=DELETE')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                uid TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                output_dir TEXT,
+                priority INTEGER NOT NULL,
+                parent INTEGER,
+                status TEXT NOT NULL,
+                format TEXT,
+                path TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                token TEXT,
+                expires REAL,
+                created REAL NOT NULL,
+                finished REAL,
+                error TEXT,
+                result TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, id);
+        ''')
+        
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+                
+    def add(self, urls, quality='best', output_dir=None, priority=NORMAL, parent=None, uids=None):
+        """Queue URLs; returns how many were new. Known `uids` are skipped."""
+        now = time.time()
+        rows = [(uid or secrets.token_hex(16), url, quality, output_dir, priority, parent, QUEUED, now)
+                for url, uid in zip(urls, uids or [None] * len(urls))]
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany('INSERT OR IGNORE INTO jobs (uid, url, quality, output_dir, priority, parent, '
+                           'status, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            return db.total_changes - before
+            
+    def claim(self, worker):
+        """Lease the next queued job (or one whose lease expired) to `worker`; None when there is none"""
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    'SELECT id, uid, url, quality, output_dir, priority, format, path, attempts FROM jobs '
+                    'WHERE status = ? OR (status = ? AND expires < ?) ORDER BY priority, id LIMIT 1',
+                    (QUEUED, LEASED, now)).fetchone()
+                if row is None:
+                    return None
+                if row[-1] >= MAX_ATTEMPTS:
+                    # Every worker that took it so far disappeared; don't let it take down the next one
+                    db.execute('UPDATE jobs SET status = ?, token = NULL, finished = ?, error = ? WHERE id = ?',
+                               (FAILED, now, f"Lease expired {row[-1]} times", row[0]))
+                    continue
+                token = secrets.token_hex(16)
+                expires = now + self.lease_seconds
+                db.execute('UPDATE jobs SET status = ?, worker = ?, token = ?, expires = ?, '
+                           'attempts = attempts + 1 WHERE id = ?', (LEASED, worker, token, expires, row[0]))
+                return Lease(row[:-1] + (row[-1] + 1,), token, expires)
+                
+    def renew(self, lease):
+        """Extend a lease; False when it expired and went to another worker"""
+        expires = time.time() + self.lease_seconds
+        with self._transaction() as db:
+            updated = db.execute('UPDATE jobs SET expires = ? WHERE id = ? AND token = ? AND status = ?',
+                                 (expires, lease.id, lease.token, LEASED)).rowcount
+        if updated:
+            lease.expires = expires
+        return bool(updated)
+        
+    def set_format(self, lease, format_id, path):
+        """Remember the format and partial file, for a worker that has to take the job over"""
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET format = ?, path = ? WHERE id = ? AND token = ?',
+                       (format_id, path, lease.id, lease.token))
+            
+    def complete(self, lease, status, result=None, error=None):
+        """Write a job's final state; False when the lease was lost and the result is dropped"""
+        with self._transaction() as db:
+            updated = db.execute(
+                'UPDATE jobs SET status = ?, token = NULL, expires = NULL, finished = ?, error = ?, result = ? '
+                'WHERE id = ? AND token = ?',
+                (status, time.time(), error, json.dumps(result) if result is not None else None,
+                 lease.id, lease.token)).rowcount
+        return bool(updated)
+        
+    def release(self, lease):
+        """Hand a job back unfinished, without counting the attempt"""
+        with self._transaction() as db:
+            return bool(db.execute(
+                'UPDATE jobs SET status = ?, token = NULL, expires = NULL, attempts = attempts - 1 '
+                'WHERE id = ? AND token = ?', (QUEUED, lease.id, lease.token)).rowcount)
+                
+    def counts(self):
+        """Return the number of jobs per state; expired leases count as queued"""
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT CASE WHEN status = ? AND expires < ? THEN ? ELSE status END, count(*) '
+                'FROM jobs GROUP BY 1', (LEASED, now, QUEUED)).fetchall()
+        return dict(rows)
+        
+    def jobs(self, status=None):
+        """Return jobs as dicts in id order, optionally only those in `status`"""
+        query = ('SELECT id, uid, url, quality, output_dir, priority, parent, status, format, attempts, worker, '
+                 'expires, created, finished, error, result FROM jobs')
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        with self._lock:
+            cursor = self._db.execute(query + ' ORDER BY id', params)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(zip(names, row))
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            jobs.append(job)
+        return jobs
+        
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,127 @@
+"""
+Write-ahead journal of download jobs.
+
+Every state change is appended as one JSON line and fsync'ed before the
+queue acts on it. After a crash or an unclean exit, pending() returns the
+jobs that never finished, with the format and partial file they were
+using. Requeued with the same format, yt-dlp picks the .part file up again
+and continues from its current size.
+"""
+
+import json
+import os
+import threading
+import time
+
+from .paths import get_data_dir
+
+
+# Rewrite the journal after this many finished jobs so it stays small
+COMPACT_EVERY = 500
+
+# Record types
+QUEUED = 'queued'
+STARTED = 'started'
+FINISHED = 'finished'
+
+
+class JobJournal:
+    def __init__(self, path=None):
+        self.path = str(path or get_data_dir() / 'journal.ndjson')
+        self._lock = threading.Lock()
+        self._live = self._replay()
+        self._finished_since_compact = 0
+        self._file = None
+        self._compact()
+        
+    def pending(self):
+        """Return the unfinished job records from earlier runs, oldest first"""
+        with self._lock:
+            return [dict(record) for record in self._live.values()]
+            
+    def record_queued(self, job):
+        self.record_queued_many([job])
+        
+    def record_queued_many(self, jobs):
+        """Record several queued jobs with a single fsync"""
+        self._append(*({
+            'op': QUEUED,
+            'uid': job.uid,
+            'url': job.url,
+            'quality': job.quality,
+            'output_dir': job.output_dir,
+            'format': job.format,
+            'priority': job.priority,
+        } for job in jobs))
+        
+    def record_started(self, job, format_id, path):
+        """Remember the format and partial file chosen for an active job"""
+        self._append({'op': STARTED, 'uid': job.uid, 'format': format_id, 'path': path})
+        
+    def record_finished(self, job):
+        self._append({'op': FINISHED, 'uid': job.uid, 'status': job.status})
+        
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+                
+    def _append(self, *records):
+        now = round(time.time(), 3)
+        for record in records:
+            record['ts'] = now
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for record in records:
+                self._apply(self._live, record)
+                if record['op'] == FINISHED:
+                    self._finished_since_compact += 1
+            if self._finished_since_compact >= COMPACT_EVERY:
+                self._compact()
+                
+    @staticmethod
+    def _apply(live, record):
+        uid = record.get('uid')
+        if not uid:
+            return
+        op = record.get('op')
+        if op == FINISHED:
+            live.pop(uid, None)
+        elif op == QUEUED:
+            live[uid] = {key: value for key, value in record.items() if key not in ('op', 'ts')}
+        elif op == STARTED and uid in live:
+            live[uid]['format'] = record.get('format')
+            live[uid]['path'] = record.get('path')
+            
+    def _replay(self):
+        live = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a torn last line behind
+                        continue
+                    self._apply(live, record)
+        except FileNotFoundError:
+            pass
+        return live
+        
+    def _compact(self):
+        # Called with the lock held (or before the journal is shared)
+        if self._file:
+            self._file.close()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for state in self._live.values():
+                f.write(json.dumps(dict(state, op=QUEUED), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._finished_since_compact = 0
@@ -0,0 +1,301 @@
+"""
+Per-job phase spans, per-site counters and their export.
+
+A JobTrace records when each phase of a job ran: waiting in the queue,
+borrowing a session, extraction, format selection, the transfer, every
+yt-dlp post-processor, the final move and MP3 conversion. It is fed by
+the session's progress, post-processor and retry hooks (see
+ytdl.EngineYDL). Finished traces update the Metrics registry, which
+counts jobs, bytes, retries and errors per site. The registry is served
+in the Prometheus text format by MetricsServer, and traces can be
+appended to a Chrome trace file that chrome://tracing and Perfetto open.
+
+Without a Metrics object nothing is recorded; the hooks only check for a
+missing trace.
+"""
+
+import collections
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+
+
+METRICS_PORT_ENV = 'VIDEO_DOWNLOADER_METRICS_PORT'
+TRACE_ENV = 'VIDEO_DOWNLOADER_TRACE'
+
+# Job phases in the order they run
+PHASES = ('queued', 'session', 'extract', 'select', 'transfer', 'postprocess', 'move', 'transcode')
+
+# Upper bounds of the phase duration histogram, in seconds
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Trace status of an attempt that failed and went back to the queue; not a finished job
+RETRIED = 'retried'
+
+# yt-dlp post-processor that moves finished files to their final name
+MOVE_POSTPROCESSOR = 'MoveFiles'
+
+METRIC_HELP = {
+    'downloader_jobs_total': ('counter', "Finished jobs by site and final status"),
+    'downloader_bytes_total': ('counter', "Bytes downloaded by site"),
+    'downloader_retries_total': ('counter', "Retries by site and kind (http, fragment, extractor, ...)"),
+    'downloader_errors_total': ('counter', "Failed jobs by site and error type"),
+    'downloader_phase_seconds': ('histogram', "Time spent per job phase"),
+}
+
+
+def format_phases(timings):
+    """Return 'extract 0.41s, transfer 3.10s, ...' for the phases in a job's timings"""
+    return ', '.join(f"{phase} {timings[phase]:.2f}s" for phase in PHASES if phase in timings)
+
+
+def options_from_env():
+    """Engine options for metrics and traces as configured by the environment"""
+    port = os.environ.get(METRICS_PORT_ENV)
+    return {'metrics_port': int(port) if port else None,
+            'trace': os.environ.get(TRACE_ENV) or None}
+
+
+def error_type(error):
+    """Name of the exception behind a failure, looking through yt-dlp's DownloadError"""
+    exc_info = getattr(error, 'exc_info', None)
+    if exc_info and exc_info[1] is not None:
+        error = exc_info[1]
+    return type(error).__name__
+
+
+class JobTrace:
+    """Phase spans and byte counts of one job; hooks may call it from any thread"""
+    
+    def __init__(self, metrics, job):
+        self.metrics = metrics
+        self.job = job
+        # (phase, start, end, detail) with time.time() timestamps
+        self.spans = []
+        self._open = {}
+        self._seen = {}
+        self._lock = threading.Lock()
+        
+    def begin(self, phase, detail=None):
+        with self._lock:
+            self._open.setdefault(phase, (time.time(), detail))
+            
+    def end(self, phase):
+        with self._lock:
+            started = self._open.pop(phase, None)
+            if started is not None:
+                self.spans.append((phase, started[0], time.time(), started[1]))
+                
+    @contextmanager
+    def span(self, phase, detail=None):
+        self.begin(phase, detail)
+        try:
+            yield
+        finally:
+            self.end(phase)
+            
+    def on_progress(self, d):
+        """yt-dlp progress hook: the transfer span and byte counts"""
+        status = d.get('status')
+        if status not in ('downloading', 'finished'):
+            return
+        # 'finished' only names the final file, so that is the key for both
+        key = d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        with self._lock:
+            last = self._seen.get(key, 0)
+            self._seen[key] = downloaded
+        if downloaded > last:
+            self.metrics.inc('downloader_bytes_total', downloaded - last, host=self.job.host)
+        if status == 'downloading':
+            self.begin('transfer')
+        else:
+            self.end('transfer')
+            
+    def on_postprocess(self, d):
+        """yt-dlp post-processor hook: one span per post-processor run"""
+        name = d.get('postprocessor')
+        phase = 'move' if name == MOVE_POSTPROCESSOR else 'postprocess'
+        if d.get('status') == 'started':
+            self.begin(phase, name)
+        elif d.get('status') == 'finished':
+            self.end(phase)
+            
+    def on_before_download(self):
+        # Formats are chosen; the transfer starts with the connection setup
+        self.end('select')
+        self.begin('transfer')
+        
+    def retry(self, kind):
+        self.metrics.inc('downloader_retries_total', host=self.job.host, kind=kind)
+        
+    def totals(self):
+        """Return seconds per phase, summed over repeated spans"""
+        totals = {}
+        with self._lock:
+            for phase, start, end, _ in self.spans:
+                totals[phase] = totals.get(phase, 0.0) + end - start
+        return totals
+        
+    def close(self, status, error=None):
+        """End the open spans and hand the trace to the registry"""
+        now = time.time()
+        with self._lock:
+            for phase, (start, detail) in self._open.items():
+                self.spans.append((phase, start, now, detail))
+            self._open.clear()
+            if self.job.queued_at is not None and self.job.started is not None:
+                self.spans.insert(0, ('queued', self.job.queued_at, self.job.started, None))
+        self.metrics.finish(self, status, error)
+
+
+class Metrics:
+    """Thread-safe counters and phase histograms for the whole process"""
+    
+    def __init__(self, trace_path=None):
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)
+        # phase -> [count per bucket..., +Inf count, sum]
+        self._phases = {}
+        self._gauges = []
+        self._trace = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+        if self._trace is not None and self._trace.tell() == 0:
+            # Chrome's trace format tolerates an array that is never closed
+            self._trace.write('[\n')
+        self._pid = os.getpid()
+        
+    def trace(self, job):
+        return JobTrace(self, job)
+        
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+            
+    def add_gauge(self, name, description, collect, label):
+        """Export collect() -> {label value: number} as gauge `name` on every scrape"""
+        self._gauges.append((name, description, collect, label))
+        
+    def finish(self, trace, status, error=None):
+        job = trace.job
+        if status != RETRIED:
+            self.inc('downloader_jobs_total', host=job.host, status=status)
+        if error is not None:
+            self.inc('downloader_errors_total', host=job.host, error=error_type(error))
+        with self._lock:
+            for phase, start, end, _ in trace.spans:
+                buckets = self._phases.setdefault(phase, [0] * (len(PHASE_BUCKETS) + 2))
+                seconds = end - start
+                for index, bound in enumerate(PHASE_BUCKETS):
+                    if seconds <= bound:
+                        buckets[index] += 1
+                buckets[-2] += 1
+                buckets[-1] += seconds
+            if self._trace is not None:
+                self._write_trace(trace, status)
+                
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            phases = {phase: list(buckets) for phase, buckets in self._phases.items()}
+        lines = []
+        families = collections.defaultdict(list)
+        for (name, labels), value in counters:
+            families[name].append((labels, value))
+        for name, samples in families.items():
+            kind, text = METRIC_HELP[name]
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                
+        if phases:
+            name = 'downloader_phase_seconds'
+            kind, text = METRIC_HELP[name]
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            for phase, buckets in sorted(phases.items()):
+                for bound, count in zip(PHASE_BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{_labels([("phase", phase), ("le", f"{bound:g}")])} {count}')
+                lines.append(f'{name}_bucket{_labels([("phase", phase), ("le", "+Inf")])} {buckets[-2]}')
+                lines.append(f'{name}_sum{_labels([("phase", phase)])} {buckets[-1]:.6f}')
+                lines.append(f'{name}_count{_labels([("phase", phase)])} {buckets[-2]}')
+                
+        for name, text, collect, label in self._gauges:
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} gauge']
+            for key, value in sorted(collect().items()):
+                lines.append(f'{name}{_labels([(label, key)])} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+        
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+                
+    def _write_trace(self, trace, status):
+        # Called with the lock held; one row per job in the trace viewer
+        job = trace.job
+        for phase, start, end, detail in trace.spans:
+            args = {'url': job.url, 'status': status}
+            if detail:
+                args['detail'] = detail
+            event = {'name': phase, 'cat': job.host, 'ph': 'X', 'pid': self._pid, 'tid': job.id,
+                     'ts': round(start * 1e6), 'dur': round((end - start) * 1e6), 'args': args}
+            self._trace.write(json.dumps(event) + ',\n')
+        self._trace.flush()
+
+
+def _number(value):
+    # Counters are floats internally; byte counts must not lose digits
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+        
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Serves /metrics on localhost from a background thread"""
+    
+    daemon_threads = True
+    
+    def __init__(self, metrics, port=0, host='127.0.0.1'):
+        super().__init__((host, port), MetricsHandler)
+        self.metrics = metrics
+        
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/metrics'
+        
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True, name='metrics').start()
+        return self
+        
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,23 @@
+"""
+Where the downloader keeps its own state (caches, indexes, journals).
+"""
+
+import os
+import sys
+from pathlib import Path
+
+
+def get_data_dir():
+    """Return the per-user data folder, creating it if needed.
+    
+    VIDEO_DOWNLOADER_HOME overrides the default location.
+    """
+    override = os.environ.get('VIDEO_DOWNLOADER_HOME')
+    if override:
+        data_dir = Path(override)
+    elif sys.platform == 'win32':
+        data_dir = Path(os.environ.get('APPDATA', Path.home())) / 'VideoDownloader'
+    else:
+        data_dir = Path(os.environ.get('XDG_DATA_HOME', Path.home() / '.local' / 'share')) / 'video-downloader'
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
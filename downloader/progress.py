@@ -0,0 +1,206 @@
+"""
+Transfer progress model fed by yt-dlp progress hooks.
+
+Speed is smoothed with an exponentially weighted moving average over the
+bytes actually received, so a stalled transfer decays towards zero instead
+of reporting yt-dlp's last instantaneous value. ProgressBoard keeps one
+tracker per job, rate-limits the snapshots it hands to the UI and sums the
+per-job speeds into an aggregate rate for the whole queue.
+"""
+
+import threading
+import time
+
+
+# Weight of the newest speed sample in the moving average
+DEFAULT_ALPHA = 0.3
+# Minimum seconds between two snapshots for the same job
+DEFAULT_MIN_INTERVAL = 0.25
+# Seconds without new bytes before a transfer counts as stalled
+STALL_SECONDS = 10.0
+
+
+def format_bytes(count):
+    if count is None:
+        return "?"
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(count) < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024.0
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class TransferProgress:
+    """Progress of one job, possibly spanning several files (video + audio)"""
+    
+    __slots__ = ('alpha', 'filename', 'downloaded', 'total', 'speed', 'done_bytes',
+                 'last_time', 'last_bytes_time', 'finished')
+    
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.filename = None
+        self.downloaded = 0
+        self.total = None
+        self.speed = None
+        # Bytes of files that already finished within this job
+        self.done_bytes = 0
+        self.last_time = None
+        self.last_bytes_time = None
+        self.finished = False
+        
+    def update(self, downloaded, total=None, filename=None, now=None):
+        now = time.monotonic() if now is None else now
+        
+        if filename != self.filename:
+            # A job can download several files in sequence; keep the speed estimate
+            if self.filename is not None:
+                self.done_bytes += self.downloaded
+            self.filename = filename
+            self.downloaded = 0
+            self.last_time = now
+            
+        delta = downloaded - self.downloaded
+        elapsed = now - self.last_time if self.last_time is not None else 0
+        if delta > 0:
+            self.last_bytes_time = now
+        if elapsed > 0 and delta >= 0:
+            sample = delta / elapsed
+            if self.speed is None:
+                self.speed = sample
+            else:
+                self.speed += self.alpha * (sample - self.speed)
+            self.last_time = now
+        elif self.last_time is None:
+            self.last_time = now
+            
+        self.downloaded = downloaded
+        if total:
+            self.total = total
+            
+    def finish(self):
+        self.finished = True
+        if self.total:
+            self.downloaded = self.total
+            
+    def is_stalled(self, now=None):
+        if self.finished or self.last_bytes_time is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.last_bytes_time >= STALL_SECONDS
+        
+    def current_speed(self, now=None):
+        """Smoothed speed, decayed for the time since the last sample"""
+        if self.speed is None or self.finished:
+            return None
+        now = time.monotonic() if now is None else now
+        idle = now - self.last_bytes_time if self.last_bytes_time is not None else 0
+        if idle > 1.0:
+            # No hook calls while a transfer hangs; fade the estimate out
+            return self.speed / idle
+        return self.speed
+        
+    @property
+    def percent(self):
+        if not self.total:
+            return None
+        return min(100.0, 100.0 * self.downloaded / self.total)
+        
+    def snapshot(self, now=None):
+        speed = self.current_speed(now)
+        eta = None
+        if self.total and speed:
+            eta = max(0.0, (self.total - self.downloaded) / speed)
+        return {
+            'filename': self.filename,
+            'downloaded': self.done_bytes + self.downloaded,
+            'total': self.total,
+            'percent': self.percent,
+            'speed': speed,
+            'eta': eta,
+            'stalled': self.is_stalled(now),
+        }
+
+
+class ProgressBoard:
+    """Thread-safe collection of per-job trackers"""
+    
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, alpha=DEFAULT_ALPHA):
+        self.min_interval = min_interval
+        self.alpha = alpha
+        self._trackers = {}
+        self._last_emit = {}
+        self._lock = threading.Lock()
+        
+    def update(self, job_id, d):
+        """Feed a yt-dlp progress dict; returns a snapshot when one is due"""
+        status = d.get('status')
+        now = time.monotonic()
+        with self._lock:
+            tracker = self._trackers.get(job_id)
+            if tracker is None:
+                tracker = self._trackers[job_id] = TransferProgress(self.alpha)
+                
+            if status == 'downloading':
+                tracker.update(d.get('downloaded_bytes') or 0,
+                               d.get('total_bytes') or d.get('total_bytes_estimate'),
+                               d.get('filename'), now)
+            elif status == 'finished':
+                total = d.get('total_bytes') or d.get('downloaded_bytes')
+                if total:
+                    tracker.update(total, total, d.get('filename'), now)
+            else:
+                return None
+                
+            # Always let a file's final update through, throttle the rest
+            if status == 'downloading' and now - self._last_emit.get(job_id, 0) < self.min_interval:
+                return None
+            self._last_emit[job_id] = now
+            return tracker.snapshot(now)
+            
+    def finish(self, job_id):
+        with self._lock:
+            tracker = self._trackers.get(job_id)
+            if tracker is not None:
+                tracker.finish()
+            self._last_emit.pop(job_id, None)
+            
+    def remove(self, job_id):
+        with self._lock:
+            self._trackers.pop(job_id, None)
+            self._last_emit.pop(job_id, None)
+            
+    def snapshot(self, job_id):
+        with self._lock:
+            tracker = self._trackers.get(job_id)
+            return tracker.snapshot() if tracker else None
+            
+    def stalled(self):
+        """Return ids of unfinished jobs that have not received bytes recently"""
+        now = time.monotonic()
+        with self._lock:
+            return [job_id for job_id, t in self._trackers.items() if t.is_stalled(now)]
+            
+    def aggregate(self):
+        """Combined speed and byte counts of all unfinished jobs"""
+        now = time.monotonic()
+        speed = 0.0
+        downloaded = 0
+        active = 0
+        with self._lock:
+            for tracker in self._trackers.values():
+                if tracker.finished:
+                    continue
+                active += 1
+                downloaded += tracker.done_bytes + tracker.downloaded
+                speed += tracker.current_speed(now) or 0.0
+        return {'speed': speed, 'downloaded': downloaded, 'active': active}
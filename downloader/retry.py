@@ -0,0 +1,278 @@
+"""
+Retries with backoff, and a circuit breaker per host.
+
+A failed job is retried when the error looks transient: HTTP 408, 429
+and 5xx, timeouts and dropped connections. The delay doubles with every
+attempt and is drawn at random below that bound ("full jitter"), so jobs
+that failed together do not come back together; a Retry-After header
+from the server takes precedence. Other errors, such as 404, private or
+removed videos and unsupported sites, fail at once.
+
+When one host keeps failing, its breaker opens and the queue stops
+starting jobs there for a cooldown, while other hosts keep running.
+After the cooldown a single job probes the host: success closes the
+breaker, another failure reopens it for twice as long. A host that is
+still failing after a few of these rounds is given up on, and its
+remaining jobs fail at once, so a dead site cannot hold a batch open.
+"""
+
+import email.utils
+import http.client
+import random
+import re
+import socket
+import threading
+import time
+
+
+DEFAULT_RETRIES = 3
+# Seconds; the n-th retry waits a random time below min(MAX_DELAY, BASE_DELAY * 2 ** n)
+BASE_DELAY = 2.0
+MAX_DELAY = 300.0
+
+# Consecutive transient failures that open a host's breaker
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30.0
+MAX_BREAKER_COOLDOWN = 300.0
+# Openings in a row, each twice as long, before a host counts as down (about 7.5 minutes)
+MAX_TRIPS = 4
+
+TRANSIENT_STATUS = {408, 425, 429}
+TRANSIENT_TYPES = (TimeoutError, ConnectionError, socket.gaierror, http.client.HTTPException)
+# yt-dlp and segmented.py errors, matched by name so yt_dlp is not imported here
+TRANSIENT_NAMES = {'TransportError', 'IncompleteRead', 'IncompleteDownload', 'ProxyError'}
+# For errors that only survive as a message, like most of yt-dlp's
+HTTP_STATUS_MESSAGE = re.compile(r'HTTP Error (\d{3})')
+TRANSIENT_MESSAGE = re.compile(r'timed out|connection (?:reset|refused|aborted)|remote end closed|'
+                               r'temporary failure in name resolution|incomplete ?read', re.IGNORECASE)
+
+
+class HostDown(Exception):
+    """Raised instead of running a job whose host the circuit breaker gave up on"""
+
+
+class Failure:
+    """What went wrong, as far as retrying is concerned"""
+    
+    def __init__(self, transient, status=None, retry_after=None):
+        self.transient = transient
+        self.status = status
+        # Seconds the server asked us to wait
+        self.retry_after = retry_after
+        
+    def __repr__(self):
+        return f"<Failure transient={self.transient} status={self.status} retry_after={self.retry_after}>"
+
+
+def error_chain(error):
+    """Yield an exception and the ones it wraps (yt-dlp keeps them in exc_info or cause)"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        exc_info = getattr(error, 'exc_info', None)
+        wrapped = exc_info[1] if isinstance(exc_info, tuple) and len(exc_info) > 1 else None
+        error = wrapped or getattr(error, 'cause', None) or error.__cause__ or error.__context__
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+def classify(error):
+    """Return a Failure describing whether `error` is worth retrying"""
+    if isinstance(error, HostDown):
+        return Failure(False)
+    status = None
+    retry_after = None
+    transient = False
+    for cause in error_chain(error):
+        code = getattr(cause, 'status', None) or getattr(cause, 'code', None)
+        if isinstance(code, int) and 100 <= code < 600 and status is None:
+            status = code
+            headers = getattr(getattr(cause, 'response', None), 'headers', None) or getattr(cause, 'headers', None)
+            if headers is not None:
+                retry_after = parse_retry_after(headers.get('Retry-After'))
+        if isinstance(cause, TRANSIENT_TYPES) or type(cause).__name__ in TRANSIENT_NAMES:
+            transient = True
+    message = str(error)
+    if status is None:
+        match = HTTP_STATUS_MESSAGE.search(message)
+        status = int(match.group(1)) if match else None
+    if status is not None:
+        # The status is the most precise answer; a 404 after a reset connection is still a 404
+        transient = status in TRANSIENT_STATUS or status >= 500
+    elif TRANSIENT_MESSAGE.search(message):
+        transient = True
+    return Failure(transient, status, retry_after)
+
+
+class RetryPolicy:
+    def __init__(self, retries=DEFAULT_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.retries = max(0, int(retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        
+    def delay(self, attempt, failure):
+        """Seconds before retry number `attempt` (from 1), or None when the job should fail"""
+        if not failure.transient or attempt > self.retries:
+            return None
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if failure.retry_after is not None:
+            # Honour the server, but never hammer it and never wait for hours
+            return min(self.max_delay, max(failure.retry_after, backoff))
+        return backoff
+
+
+class HostState:
+    __slots__ = ('failures', 'trips', 'cooldown', 'open_until', 'probing', 'reason')
+    
+    def __init__(self, cooldown):
+        # Consecutive transient failures, and how often they opened the breaker in a row
+        self.failures = 0
+        self.trips = 0
+        self.cooldown = cooldown
+        self.open_until = None
+        self.probing = False
+        self.reason = None
+
+
+class CircuitBreaker:
+    """Consecutive transient failures per host; open hosts get no new jobs until their cooldown ends.
+    
+    A host whose breaker opened `max_trips` times without a success in
+    between is considered down: its jobs fail at once instead of waiting
+    for ever longer probes, until `max_cooldown` later a job probes it again.
+    """
+    
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_cooldown=MAX_BREAKER_COOLDOWN,
+                 max_trips=MAX_TRIPS, clock=time.monotonic):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+        
+    def available(self, host):
+        """Return 0 when a job for `host` may start, else the seconds until it may"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.open_until is None or state.trips >= self.max_trips:
+                return 0
+            left = state.open_until - self.clock()
+            if left > 0:
+                return left
+            # Half-open: one probe at a time
+            return self.cooldown if state.probing else 0
+            
+    def down(self, host):
+        """Return the last error of a host that is considered down, else None"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state.trips < self.max_trips:
+                return None
+            if self.clock() - state.open_until < self.max_cooldown:
+                return state.reason
+            # Down long enough to try once more; the next job is a probe again
+            state.trips -= 1
+            return None
+            
+    def started(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None and state.open_until is not None:
+                state.probing = True
+                
+    def succeeded(self, host):
+        with self._lock:
+            self._hosts.pop(host, None)
+            
+    def failed(self, host, failure, reason=None):
+        """Count a failed job; returns the seconds the host is paused for, or None"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if not failure.transient:
+                # A missing video says nothing about the host, but lets the next probe start
+                if state is not None and state.probing:
+                    state.open_until = self.clock()
+                    state.probing = False
+                return None
+            if state is None:
+                state = self._hosts[host] = HostState(self.cooldown)
+            now = self.clock()
+            probing, state.probing = state.probing, False
+            state.failures += 1
+            state.reason = reason
+            if failure.status == 429 and failure.retry_after is not None and not probing:
+                # Rate limited with a clear answer; wait as told, without counting it as an outage
+                pause = failure.retry_after
+            elif probing or (state.failures >= self.threshold
+                             and (state.open_until is None or state.open_until <= now)):
+                # Jobs that were already running when the breaker opened don't open it again
+                if probing:
+                    state.cooldown = min(self.max_cooldown, state.cooldown * 2)
+                state.trips += 1
+                pause = max(state.cooldown, failure.retry_after or 0)
+            else:
+                return None
+            state.open_until = max(state.open_until or 0, now + pause)
+            return pause
+            
+    def paused(self):
+        """Return {host: seconds left} for the hosts whose breaker is open"""
+        now = self.clock()
+        with self._lock:
+            return {host: round(state.open_until - now, 1) for host, state in self._hosts.items()
+                    if state.open_until is not None and state.open_until > now and state.trips < self.max_trips}
+
+
+class FailureReport:
+    """Failed jobs grouped by host and reason, for a summary instead of a dialog per failure"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = []
+        
+    def add(self, job):
+        with self._lock:
+            self._failures.append((job.host, short_reason(job.error), job.url))
+            
+    def __len__(self):
+        with self._lock:
+            return len(self._failures)
+            
+    def take(self):
+        """Return the summary lines and start a new report"""
+        with self._lock:
+            failures, self._failures = self._failures, []
+        if not failures:
+            return []
+        groups = {}
+        for host, reason, url in failures:
+            groups.setdefault((host, reason), []).append(url)
+        lines = [f"{len(failures)} download(s) failed:"]
+        for (host, reason), urls in sorted(groups.items(), key=lambda item: -len(item[1])):
+            lines.append(f"  {host or 'unknown site'}: {reason} ({len(urls)}), e.g. {urls[0]}")
+        return lines
+
+
+def short_reason(error):
+    """First line of an error message without yt-dlp's 'ERROR: [site] id:' prefix"""
+    if not error:
+        return "unknown error"
+    reason = error.strip().splitlines()[0]
+    reason = re.sub(r'^(?:ERROR:\s*)?(?:\[[^\]]+\]\s*)?(?:[\w-]+:\s+)?', '', reason)
+    reason = re.sub(r'\s*\(caused by .*\)$', '', reason)
+    return reason[:120] or "unknown error"
@@ -0,0 +1,361 @@
+"""
+Multi-connection downloader for plain HTTP(S) files.
+
+The file is split into byte ranges that a small pool of keep-alive
+connections fetch in parallel. Many CDNs cap bandwidth per connection, so
+this gets more of the link than one stream. It starts with a couple of
+connections and adds more only while each addition still raises total
+throughput. Completed ranges go to a sidecar file, so an interrupted
+download continues where it stopped. Servers that ignore Range raise
+RangeNotSupported, usually on the probe but possibly in the middle of a
+transfer, and the caller falls back to a normal single-stream download.
+The file is preallocated, so it must not be one that a single-stream
+download would resume from: callers use segment_path() for it and
+discard() it on fallback.
+"""
+
+import collections
+import http.client
+import json
+import os
+import re
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit, urljoin
+
+
+DEFAULT_MAX_CONNECTIONS = 8
+INITIAL_CONNECTIONS = 2
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+# Files smaller than this are not worth splitting
+MIN_SEGMENTED_SIZE = 2 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# A new connection must raise throughput by this fraction to keep growing
+MIN_GAIN = 0.10
+ADAPT_INTERVAL = 1.0
+SEGMENT_RETRIES = 3
+MAX_REDIRECTS = 5
+# Idle connections older than this have probably been closed by the server
+MAX_IDLE_SECONDS = 15
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port)"""
+    
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        
+    def get(self, url, fresh=False):
+        """Return an idle connection to url's server, or a new one when fresh is set"""
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        stale = []
+        with self._lock:
+            idle = self._idle[(https, parts.hostname, port)]
+            while idle and not fresh:
+                conn, since = idle.pop()
+                if time.monotonic() - since < MAX_IDLE_SECONDS:
+                    break
+                stale.append(conn)
+            else:
+                conn = None
+        for old in stale:
+            old.close()
+        if conn is not None:
+            return conn
+        if https:
+            return http.client.HTTPSConnection(parts.hostname, port, timeout=self.timeout,
+                                               context=ssl.create_default_context())
+        return http.client.HTTPConnection(parts.hostname, port, timeout=self.timeout)
+        
+    def put(self, conn):
+        key = (isinstance(conn, http.client.HTTPSConnection), conn.host, conn.port)
+        with self._lock:
+            self._idle[key].append((conn, time.monotonic()))
+            
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn, _ in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+# Suffix of the preallocated file, kept apart from the single-stream .part
+SEGMENT_SUFFIX = '.segmented.part'
+
+
+def segment_path(path):
+    return path + SEGMENT_SUFFIX
+
+
+def discard(path):
+    """Remove a segmented download's file and sidecar"""
+    for name in (path, path + '.segments'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def partial_bytes(path):
+    """Bytes already downloaded into a partial file.
+    
+    Segmented downloads preallocate the whole file, so the sidecar is the
+    only reliable measure for them.
+    """
+    try:
+        with open(path + '.segments', encoding='utf-8') as f:
+            return sum(end - start + 1 for start, end in json.load(f).get('done', []))
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _request_target(url):
+    parts = urlsplit(url)
+    return (parts.path or '/') + ('?' + parts.query if parts.query else '')
+
+
+class SegmentedDownloader:
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+                 min_size=MIN_SEGMENTED_SIZE, timeout=30, pool=None, on_bytes=None):
+        self.max_connections = max(1, max_connections)
+        self.segment_size = segment_size
+        self.min_size = min_size
+        self.pool = pool or ConnectionPool(timeout)
+        # Called from worker threads with the size of every chunk written
+        self.on_bytes = on_bytes
+        
+        self.downloaded = 0
+        self.total = None
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._running = 0
+        self._workers_done = threading.Condition(self._lock)
+        
+    def probe(self, url, headers=None):
+        """Return (final_url, total_size) for a server that honours Range.
+        
+        Raises RangeNotSupported when the server answers a range request
+        with the whole body or without a usable Content-Range.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            conn, response = self._request(url, dict(headers or {}, Range='bytes=0-0'))
+            try:
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                self.pool.put(conn)
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            self.pool.put(conn)
+            match = CONTENT_RANGE.match(response.getheader('Content-Range') or '')
+            if response.status != 206 or not match or match.group(3) == '*':
+                raise RangeNotSupported(f"HTTP {response.status} for a range request")
+            return url, int(match.group(3))
+        raise RangeNotSupported("too many redirects")
+        
+    def download(self, url, path, headers=None):
+        """Download url into path; returns the number of bytes in the file"""
+        url, total = self.probe(url, headers)
+        if total < self.min_size:
+            raise RangeNotSupported(f"file too small to split ({total} bytes)")
+        self.total = total
+        
+        state_path = path + '.segments'
+        done = self._load_state(state_path, path, total)
+        pending = collections.deque(self._missing_ranges(done, total))
+        self.downloaded = sum(end - start + 1 for start, end in done)
+        
+        # Preallocate so every worker can write at its own offset
+        with open(path, 'ab') as f:
+            if f.tell() != total:
+                f.truncate(total)
+        self._save_state(state_path, done, total)
+        
+        errors = []
+        workers = []
+        
+        def worker():
+            try:
+                self._worker(url, path, headers, pending, done, state_path)
+            except BaseException as e:
+                errors.append(e)
+                self._abort.set()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._workers_done.notify_all()
+                    
+        def add_worker():
+            thread = threading.Thread(target=worker, daemon=True, name='segment-worker')
+            workers.append(thread)
+            with self._lock:
+                self._running += 1
+            thread.start()
+            
+        for _ in range(min(INITIAL_CONNECTIONS, self.max_connections, max(1, len(pending)))):
+            add_worker()
+            
+        # Grow the pool while the measured throughput keeps improving
+        last_bytes = self.downloaded
+        last_time = time.monotonic()
+        last_rate = None
+        growing = True
+        while True:
+            with self._lock:
+                if self._workers_done.wait_for(lambda: self._running == 0, ADAPT_INTERVAL):
+                    break
+            now = time.monotonic()
+            rate = (self.downloaded - last_bytes) / max(now - last_time, 1e-6)
+            last_bytes, last_time = self.downloaded, now
+            if growing and pending and len(workers) < self.max_connections and not self._abort.is_set():
+                if last_rate is None or rate >= last_rate * (1 + MIN_GAIN):
+                    last_rate = rate
+                    add_worker()
+                else:
+                    growing = False
+        self.connections = len(workers)
+        
+        if errors:
+            raise errors[0]
+        self._verify(path, done, total)
+        try:
+            os.remove(state_path)
+        except OSError:
+            pass
+        return total
+        
+    def abort(self):
+        self._abort.set()
+        
+    def _worker(self, url, path, headers, pending, done, state_path):
+        with open(path, 'r+b') as f:
+            while not self._abort.is_set():
+                with self._lock:
+                    if not pending:
+                        return
+                    start, end = pending.popleft()
+                for attempt in range(SEGMENT_RETRIES):
+                    try:
+                        start = self._fetch(url, headers, f, start, end)
+                        break
+                    except (OSError, http.client.HTTPException, IncompleteDownload):
+                        if attempt == SEGMENT_RETRIES - 1 or self._abort.is_set():
+                            raise
+                        time.sleep(0.5 * (attempt + 1))
+                # The state file must not claim bytes that a crash could still lose
+                f.flush()
+                os.fsync(f.fileno())
+                with self._lock:
+                    done.append((start, end))
+                    self._save_state(state_path, done, self.total)
+                    
+    def _request(self, url, headers):
+        """Send a GET on a pooled connection and return (conn, response).
+        
+        A reused connection that the server has closed in the meantime is
+        replaced by a fresh one.
+        """
+        for fresh in (False, True):
+            conn = self.pool.get(url, fresh=fresh)
+            reused = conn.sock is not None
+            try:
+                conn.request('GET', _request_target(url), headers=headers)
+                return conn, conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+                    
+    def _fetch(self, url, headers, f, start, end):
+        """Fetch one range into f; returns the range's original start"""
+        conn, response = self._request(url, dict(headers or {}, Range=f'bytes={start}-{end}'))
+        offset = start
+        try:
+            match = CONTENT_RANGE.match(response.getheader('Content-Range') or '')
+            if response.status != 206 or not match or int(match.group(1)) != start:
+                response.close()
+                raise RangeNotSupported(f"HTTP {response.status} for bytes {start}-{end}")
+            while offset <= end:
+                if self._abort.is_set():
+                    raise IncompleteDownload("aborted")
+                chunk = response.read(min(CHUNK_SIZE, end - offset + 1))
+                if not chunk:
+                    raise IncompleteDownload(f"connection closed at byte {offset} of {start}-{end}")
+                f.seek(offset)
+                f.write(chunk)
+                offset += len(chunk)
+                with self._lock:
+                    self.downloaded += len(chunk)
+                if self.on_bytes:
+                    self.on_bytes(len(chunk))
+        except BaseException:
+            conn.close()
+            # Bytes of an unfinished range are fetched again on retry
+            with self._lock:
+                self.downloaded -= offset - start
+            raise
+        self.pool.put(conn)
+        return start
+        
+    def _missing_ranges(self, done, total):
+        covered = sorted(done)
+        position = 0
+        for start, end in covered + [(total, total)]:
+            while position < start:
+                segment_end = min(start, position + self.segment_size) - 1
+                yield position, segment_end
+                position = segment_end + 1
+            position = max(position, end + 1)
+            
+    def _verify(self, path, done, total):
+        covered = 0
+        position = 0
+        for start, end in sorted(done):
+            if start != position:
+                raise IncompleteDownload(f"missing bytes {position}-{start - 1}")
+            covered += end - start + 1
+            position = end + 1
+        if covered != total or os.path.getsize(path) != total:
+            raise IncompleteDownload(f"got {covered} of {total} bytes")
+            
+    @staticmethod
+    def _load_state(state_path, path, total):
+        try:
+            with open(state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('total') == total and os.path.getsize(path) == total:
+                return [tuple(r) for r in state.get('done', [])]
+        except (OSError, ValueError):
+            pass
+        return []
+        
+    @staticmethod
+    def _save_state(state_path, done, total):
+        # Called with the lock held
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'total': total, 'done': done}, f)
+        os.replace(tmp_path, state_path)
@@ -0,0 +1,78 @@
+"""
+Pool of long-lived YoutubeDL sessions.
+
+Building a YoutubeDL sets up extractors, the cookie jar and HTTP
+handlers, and the first request to each host pays for DNS and the TLS
+handshake. Workers borrow a session for their job's option profile
+(quality, format and output folder) and hand it back afterwards. A batch
+of short clips from one site then runs on warm sessions whose
+connections to the site and its CDN are still open.
+"""
+
+import collections
+import json
+import threading
+
+
+# Idle sessions kept across all profiles; the least recently used go first
+DEFAULT_MAX_IDLE = 8
+
+
+def profile_key(opts):
+    """Return the key of the sessions that can serve these options"""
+    return json.dumps(opts, sort_keys=True, default=repr)
+
+
+class SessionPool:
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._idle = collections.OrderedDict()
+        self._lock = threading.Lock()
+        
+    def acquire(self, opts):
+        """Borrow a session for opts, creating one if none is idle"""
+        key = profile_key(opts)
+        with self._lock:
+            sessions = self._idle.get(key)
+            if sessions:
+                ydl = sessions.pop()
+                if not sessions:
+                    del self._idle[key]
+                self.reused += 1
+                return ydl
+            self.created += 1
+        # Imported here so the GUI can draw its window before yt_dlp is loaded
+        from .ytdl import EngineYDL
+        ydl = EngineYDL(opts)
+        ydl.profile = key
+        return ydl
+        
+    def release(self, ydl, reuse=True):
+        """Return a borrowed session; it is closed if it should not be reused or the pool is full"""
+        ydl.reset()
+        closing = [] if reuse else [ydl]
+        with self._lock:
+            if reuse:
+                self._idle.setdefault(ydl.profile, []).append(ydl)
+                self._idle.move_to_end(ydl.profile)
+            while sum(len(sessions) for sessions in self._idle.values()) > self.max_idle:
+                key, sessions = next(iter(self._idle.items()))
+                closing.append(sessions.pop(0))
+                if not sessions:
+                    del self._idle[key]
+        for session in closing:
+            session.close()
+            
+    def stats(self):
+        with self._lock:
+            idle = sum(len(sessions) for sessions in self._idle.values())
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}
+        
+    def close(self):
+        with self._lock:
+            sessions = [ydl for idle in self._idle.values() for ydl in idle]
+            self._idle.clear()
+        for ydl in sessions:
+            ydl.close()
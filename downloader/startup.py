@@ -0,0 +1,111 @@
+"""
+Start-up timing and background warm-up for the GUI.
+
+yt_dlp loads its whole extractor list on import, which dominates the
+launch of a one-file build. The GUI therefore draws its window first and
+loads the download engine on a Warmup thread. A job that starts early
+waits only for the part of the warm-up that has not finished.
+
+Set VIDEO_DOWNLOADER_STARTUP_TIMING=1 to print a per-phase report to
+stderr, laid out like `python -X importtime`.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+TIMING_ENV = 'VIDEO_DOWNLOADER_STARTUP_TIMING'
+
+
+class StartupTimer:
+    """Collects (phase, start, end) spans relative to a common origin"""
+    
+    def __init__(self, origin=None):
+        self.origin = origin if origin is not None else time.perf_counter()
+        self.enabled = bool(os.environ.get(TIMING_ENV))
+        self._spans = []
+        self._lock = threading.Lock()
+        
+    def record(self, name, start, end=None):
+        end = time.perf_counter() if end is None else end
+        with self._lock:
+            self._spans.append((name, start, end, threading.current_thread().name))
+            
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+            
+    def mark(self, name):
+        """Record a point in time, such as the window becoming visible"""
+        now = time.perf_counter()
+        self.record(name, now, now)
+        
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+        
+    def report(self):
+        """Return the spans as text, one line per phase in order of completion"""
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span[2])
+        lines = ['startup:  self [ms] |  at [ms] | phase']
+        for name, start, end, thread in spans:
+            where = '' if thread == 'MainThread' else f' ({thread})'
+            lines.append(f"startup: {(end - start) * 1000:9.1f} | {(end - self.origin) * 1000:8.1f} | "
+                         f"{name}{where}")
+        return '\n'.join(lines)
+        
+    def print_report(self, stream=None):
+        if self.enabled:
+            print(self.report(), file=stream or sys.stderr, flush=True)
+
+
+class Warmup:
+    """Imports the download engine and finds ffmpeg on a background thread"""
+    
+    def __init__(self, timer=None):
+        self.timer = timer or StartupTimer()
+        self._done = threading.Event()
+        self._core = None
+        self._error = None
+        self._thread = None
+        
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='warmup')
+            self._thread.start()
+            
+    @property
+    def ready(self):
+        return self._done.is_set()
+        
+    def wait(self):
+        """Return the downloader.core module, starting or finishing the warm-up as needed"""
+        self.start()
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._core
+        
+    def _run(self):
+        try:
+            with self.timer.phase('import yt_dlp'):
+                import yt_dlp
+            with self.timer.phase('load extractors'):
+                from yt_dlp.extractor import gen_extractor_classes
+                gen_extractor_classes()
+            with self.timer.phase('import download engine'):
+                from . import core
+            with self.timer.phase('find ffmpeg'):
+                core.get_ffmpeg_path()
+            self._core = core
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
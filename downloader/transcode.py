@@ -0,0 +1,177 @@
+"""
+Audio transcoding as a separate pipeline stage.
+
+In audio mode a download worker only fetches the source stream. The MP3
+encode runs on a pool sized to the CPU count, so the next download starts
+while ffmpeg is still busy. When encoding falls behind, submit() blocks
+the download worker until a slot frees up. That stops new downloads
+instead of letting unconverted files pile up on disk.
+
+Audio that ffmpeg can decode from a pipe can skip the intermediate file
+altogether (see ytdl.StreamingAudioFD). can_stream() decides which sources
+qualify.
+"""
+
+import os
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+DEFAULT_BITRATE = 192
+# Files allowed to wait for an encoder, per encoder
+PENDING_PER_WORKER = 2
+
+# ffmpeg reads these containers from the start; the rest must be checked
+MP4_EXTS = ('mp4', 'm4a', 'm4v', 'mov', '3gp')
+PIPE_INPUT = 'pipe:0'
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def mp3_command(ffmpeg, source, target, bitrate=DEFAULT_BITRATE):
+    """Return the ffmpeg command that encodes source (a path or PIPE_INPUT) to MP3"""
+    command = [ffmpeg, '-y', '-loglevel', 'error']
+    if source != PIPE_INPUT:
+        command.append('-nostdin')
+    return command + ['-i', source, '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k',
+                      '-f', 'mp3', target]
+
+
+def can_stream(ext, head):
+    """Whether ffmpeg can decode a file from a pipe, judging by its first bytes.
+    
+    MP4 files only qualify when the moov atom comes before the media data;
+    with moov at the end ffmpeg would have to seek back.
+    """
+    if ext not in MP4_EXTS:
+        return True
+    position = 0
+    while position + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[position:position + 8])
+        if kind == b'moov':
+            return True
+        if kind == b'mdat':
+            return False
+        if size == 1:
+            if position + 16 > len(head):
+                break
+            size = struct.unpack('>Q', head[position + 8:position + 16])[0]
+        elif size < 8:
+            # 0 means the box runs to the end of the file
+            return False
+        position += size
+    return False
+
+
+def transcode_audio(source, ffmpeg, bitrate=DEFAULT_BITRATE):
+    """Encode source to MP3 next to it and remove the source; returns the MP3 path"""
+    base, ext = os.path.splitext(source)
+    if ext.lower() == '.mp3':
+        return source
+    target = base + '.mp3'
+    tmp_path = target + '.part'
+    result = subprocess.run(mp3_command(ffmpeg, source, tmp_path, bitrate),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise TranscodeError(message[-1] if message else f"ffmpeg exited with {result.returncode}")
+    os.replace(tmp_path, target)
+    os.remove(source)
+    return target
+
+
+class TranscodePool:
+    """Runs transcode_audio for finished downloads, one ffmpeg process per worker"""
+    
+    def __init__(self, max_workers=None, max_pending=None, bitrate=DEFAULT_BITRATE):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * PENDING_PER_WORKER
+        self.bitrate = bitrate
+        
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='transcode')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._stats = {'completed': 0, 'failed': 0, 'blocked': 0.0, 'wait': 0.0, 'encode': 0.0}
+        
+    def submit(self, source, ffmpeg):
+        """Queue one file; blocks while max_pending files are waiting or encoding.
+        
+        The future resolves to (mp3_path, timings) where timings holds the
+        seconds spent blocked on backpressure, waiting for an encoder and
+        encoding.
+        """
+        blocked_since = time.monotonic()
+        self._slots.acquire()
+        submitted = time.monotonic()
+        blocked = submitted - blocked_since
+        
+        def task():
+            started = time.monotonic()
+            try:
+                target = transcode_audio(source, ffmpeg, self.bitrate)
+            except BaseException:
+                with self._lock:
+                    self._stats['failed'] += 1
+                raise
+            finally:
+                self._slots.release()
+            timings = {'blocked': blocked, 'wait': started - submitted,
+                       'encode': time.monotonic() - started}
+            with self._lock:
+                self._stats['completed'] += 1
+                for stage, seconds in timings.items():
+                    self._stats[stage] += seconds
+            return target, timings
+            
+        try:
+            return self._executor.submit(task)
+        except BaseException:
+            self._slots.release()
+            raise
+            
+    def convert(self, paths, ffmpeg):
+        """Transcode several files; the future resolves to ({source: mp3_path}, timings)"""
+        result = Future()
+        futures = [self.submit(path, ffmpeg) for path in paths]
+        if not futures:
+            result.set_result(({}, {}))
+            return result
+        remaining = [len(futures)]
+        lock = threading.Lock()
+        
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            renamed, timings = {}, {}
+            try:
+                for path, future in zip(paths, futures):
+                    renamed[path], file_timings = future.result()
+                    for stage, seconds in file_timings.items():
+                        timings[stage] = timings.get(stage, 0.0) + seconds
+            except BaseException as e:
+                result.set_exception(e)
+                return
+            result.set_result((renamed, timings))
+            
+        for future in futures:
+            future.add_done_callback(done)
+        return result
+        
+    def stats(self):
+        """Return completed/failed counts and total seconds per stage"""
+        with self._lock:
+            return dict(self._stats)
+            
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,93 @@
+"""
+URL validation and canonical keys for video URLs.
+
+Different links to the same video (youtu.be vs youtube.com/watch, x.com vs
+twitter.com, tracking parameters, ...) map to the same key, so caches and
+indexes can be looked up without touching the network.
+"""
+
+import re
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from .jobqueue import host_key
+
+
+# (site, pattern matched against host + path) -> key is "<site>:<id>"
+VIDEO_ID_PATTERNS = [
+    ('youtube', re.compile(r'^youtu\.be/(?P<id>[\w-]{11})(?:$|[/?#])')),
+    ('youtube', re.compile(r'^youtube\.com/(?:shorts|embed|live|v)/(?P<id>[\w-]{11})(?:$|[/?#])')),
+    ('twitter', re.compile(r'^twitter\.com/(?:[^/]+/status|i/web/status|i/status)/(?P<id>\d+)')),
+    ('tiktok', re.compile(r'^tiktok\.com/@[^/]+/video/(?P<id>\d+)')),
+    ('reddit', re.compile(r'^reddit\.com/(?:r/[^/]+/)?comments/(?P<id>[a-z0-9]+)')),
+    ('reddit', re.compile(r'^redd\.it/(?P<id>[a-z0-9]+)$')),
+]
+
+URL_PATTERN = re.compile(
+    r'^https?://'
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'
+    r'localhost|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    r'(?::\d+)?'
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+YOUTUBE_ID = re.compile(r'^[\w-]{11}$')
+
+# Query parameters that never change which video a link points to
+TRACKING_PARAMS = {'si', 'feature', 'fbclid', 'gclid', 'igshid', 'ref_src'}
+
+
+def _site_path(url):
+    parsed = urlparse(url.strip())
+    host = host_key(url)
+    # Keep the short-link domains distinct from the main site for matching
+    netloc = parsed.netloc.lower().rsplit('@', 1)[-1].split(':', 1)[0]
+    if netloc in ('youtu.be', 'redd.it'):
+        host = netloc
+    return parsed, host + parsed.path.rstrip('/')
+
+
+def is_valid_url(url):
+    return URL_PATTERN.match(url) is not None
+
+
+def canonical_key(url):
+    """Return a stable key such as 'youtube:dQw4w9WgXcQ' for a video URL.
+    
+    Links that also select a playlist (YouTube's list=) and unknown sites
+    fall back to a normalized form of the URL.
+    """
+    parsed, site_path = _site_path(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    params = dict(query)
+    
+    if 'list' not in params:
+        if site_path == 'youtube.com/watch' and YOUTUBE_ID.match(params.get('v', '')):
+            return 'youtube:' + params['v']
+        for site, pattern in VIDEO_ID_PATTERNS:
+            match = pattern.match(site_path)
+            if match:
+                return f"{site}:{match.group('id')}"
+                
+    return 'url:' + normalize_url(url)
+
+
+def normalize_url(url):
+    """Lowercase the host, drop fragments, tracking parameters and trailing slashes"""
+    parsed, site_path = _site_path(url)
+    if parsed.port:
+        host, _, path = site_path.partition('/')
+        site_path = f"{host}:{parsed.port}/{path}"
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_'))
+    if query:
+        site_path += '?' + urlencode(query)
+    return site_path
+
+
+def info_key(info):
+    """Return the canonical key for an extracted info dict"""
+    extractor = (info.get('extractor_key') or info.get('ie_key') or '').lower()
+    # Generic ids are derived from file names and are not unique
+    if extractor and extractor != 'generic' and info.get('id'):
+        return f"{extractor}:{info['id']}"
+    return None
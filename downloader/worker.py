@@ -0,0 +1,281 @@
+"""
+Worker mode: processes on one or more machines share the jobs of a
+JobStore (see jobstore.py). Usage:
+
+    python -m downloader.worker /shared/jobs.sqlite3 add -i urls.txt -q audio
+    python -m downloader.worker /shared/jobs.sqlite3 run -j 4 -o /shared/downloads --until-empty
+    python -m downloader.worker /shared/jobs.sqlite3 status --jobs > results.ndjson
+
+Each `run` process leases as many jobs as it has download slots and runs
+them on a local Engine, with its own sessions, bandwidth limits and MP3
+encoders. A heartbeat thread renews the leases; a worker that dies stops
+renewing, and its jobs are taken over by the others once their leases
+expire. A worker that finds one of its leases taken over (after a long
+pause, say) aborts that job instead of finishing it twice. Playlists are
+expanded into the store, not into the local queue, so their entries
+spread over all workers.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+
+from .cli import read_url_file
+from .engine import PRIORITIES, Engine, add_engine_arguments
+from .jobstore import DEFAULT_LEASE, LEASED, QUEUED, JobStore, stable_uid
+from .urls import canonical_key, is_valid_url
+from .jobqueue import Job, ACTIVE, CANCELLED, QUEUED as LOCAL_QUEUED
+
+
+# Seconds between looking for new jobs while the slots are not full
+POLL_INTERVAL = 2.0
+# Leases are renewed this many times per lease period
+HEARTBEATS_PER_LEASE = 3
+# Playlist entries written to the store per transaction
+EXPAND_BATCH = 50
+
+
+class StoreWorker:
+    """Runs jobs leased from a JobStore on a local Engine.
+    
+    The worker is also the Engine's journal: the queue and core.run_job
+    report the chosen format and every finished job to it, and both are
+    written to the store under the job's lease.
+    """
+    
+    def __init__(self, store, args, log, name=None):
+        self.store = store
+        self.log = log
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.output_dir = args.output_dir
+        # Store job id -> Lease for every job this worker holds
+        self.leases = {}
+        self.committed = 0
+        self.lost = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.engine = Engine(args, self, log, on_update=self._on_update)
+        self.engine.expand = self.expand
+        
+    def run(self, until_empty=False):
+        """Lease and run jobs until stop(), or until the store has nothing left with `until_empty`"""
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True, name='lease-heartbeat')
+        heartbeat.start()
+        while not self._stopped.is_set():
+            self._claim()
+            if until_empty and not self.leases:
+                counts = self.store.counts()
+                # Leases held by others may still expire and come back
+                if not counts.get(QUEUED) and not counts.get(LEASED):
+                    break
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+        self._stopped.set()
+        self.engine.shutdown()
+        
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        
+    def abandon(self):
+        """Stop at once and hand the unfinished jobs back to the store"""
+        self.stop()
+        self.engine.queue.shutdown(wait=False)
+        with self._lock:
+            leases, self.leases = list(self.leases.values()), {}
+        for lease in leases:
+            self.store.release(lease)
+        return len(leases)
+        
+    def _claim(self):
+        # Only waiting and downloading jobs take a slot; MP3 encoding runs beside them
+        counts = self.engine.queue.counts()
+        busy = counts.get(LOCAL_QUEUED, 0) + counts.get(ACTIVE, 0)
+        while busy < self.engine.queue.max_workers and not self._stopped.is_set():
+            lease = self.store.claim(self.name)
+            if lease is None:
+                return
+            job = Job(lease.url, quality=lease.quality, output_dir=lease.output_dir or self.output_dir,
+                      format=lease.format, uid=lease.uid, priority=lease.priority)
+            # Store ids are unique across workers and stable across attempts
+            job.id = lease.id
+            with self._lock:
+                self.leases[job.id] = lease
+            if lease.attempts > 1:
+                self.log(f"[{job.id}] Taking over {job.url} (attempt {lease.attempts})")
+            self.engine.queue.submit(job)
+            busy += 1
+            
+    def _heartbeat(self):
+        while not self._stopped.wait(self.store.lease_seconds / HEARTBEATS_PER_LEASE):
+            with self._lock:
+                leases = list(self.leases.values())
+            for lease in leases:
+                try:
+                    if not self.store.renew(lease):
+                        self._lose(lease)
+                except sqlite3.Error as e:
+                    # A busy or briefly unreachable store; the lease has some time left
+                    self.log(f"Cannot renew lease {lease.id}: {e}")
+                    
+    def _lose(self, lease):
+        # Another worker owns the job now: stop it here and never write its result
+        with self._lock:
+            if self.leases.get(lease.id) is not lease:
+                return
+            del self.leases[lease.id]
+        self.lost += 1
+        self.log(f"[{lease.id}] Lease expired and went to another worker, stopping: {lease.url}")
+        self.engine.queue.abort(lease.id)
+        self._wake.set()
+        
+    def _on_update(self, job):
+        if job.status not in (LOCAL_QUEUED, ACTIVE):
+            self._wake.set()
+            
+    def expand(self, jobs):
+        """Add playlist entries to the store instead of the local queue; returns the number added.
+        
+        Unlike DownloadQueue.feed() this runs on the worker thread, so the
+        playlist keeps its slot until every entry is in the store.
+        """
+        added = 0
+        batch = []
+        try:
+            for job in jobs:
+                batch.append(job)
+                if len(batch) >= EXPAND_BATCH:
+                    added += self._add_children(batch)
+                    batch = []
+            if batch:
+                added += self._add_children(batch)
+        finally:
+            close = getattr(jobs, 'close', None)
+            if close:
+                close()
+        return added
+        
+    def _add_children(self, jobs):
+        with self._lock:
+            lease = self.leases.get(jobs[0].parent)
+        parent_uid = lease.uid if lease is not None else ''
+        first = jobs[0]
+        return self.store.add([job.url for job in jobs], quality=first.quality, output_dir=first.output_dir,
+                              priority=first.priority, parent=first.parent,
+                              uids=[stable_uid(parent_uid, job.url) for job in jobs])
+        
+    # Journal interface used by DownloadQueue and core.run_job
+    
+    def record_queued_many(self, jobs):
+        # Already in the store
+        pass
+        
+    def record_started(self, job, format_id, path):
+        with self._lock:
+            lease = self.leases.get(job.id)
+        if lease is not None:
+            self.store.set_format(lease, format_id, path)
+            
+    def record_finished(self, job):
+        with self._lock:
+            lease = self.leases.pop(job.id, None)
+        if lease is None:
+            # Released by abandon() or lost to another worker
+            return
+        if job.status == CANCELLED:
+            self.store.release(lease)
+        elif self.store.complete(lease, job.status, dict(job.to_dict(), worker=self.name), job.error):
+            self.committed += 1
+        else:
+            self.lost += 1
+            self.log(f"[{job.id}] Lease was lost, result dropped: {job.url}")
+        self._wake.set()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader.worker',
+        description="Share download jobs between processes and machines through a job store.")
+    parser.add_argument('store', help="job store file, such as /shared/jobs.sqlite3")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    add = commands.add_parser('add', help="queue URLs in the store")
+    add.add_argument('urls', nargs='*', metavar='URL', help="video URLs to download")
+    add.add_argument('-i', '--input', metavar='FILE', help="file with one URL per line ('-' reads stdin)")
+    add.add_argument('-q', '--quality', choices=['best', 'audio', 'worst'], default='best',
+                     help="best video, MP3 audio or mute (default: best)")
+    add.add_argument('-o', '--output-dir',
+                     help="download folder for these jobs (default: the --output-dir of each worker)")
+    add.add_argument('--priority', choices=list(PRIORITIES), default='normal',
+                     help="priority of these jobs (default: normal)")
+    
+    run = commands.add_parser('run', help="download jobs from the store")
+    run.add_argument('--lease', type=float, default=DEFAULT_LEASE,
+                     help=f"seconds a job stays claimed without a heartbeat (default: {DEFAULT_LEASE:g})")
+    run.add_argument('--until-empty', action='store_true',
+                     help="exit once no job is queued or leased, instead of waiting for new ones")
+    run.add_argument('--name', help="worker name recorded in the store (default: host:pid)")
+    add_engine_arguments(run)
+    
+    status = commands.add_parser('status', help="show job counts")
+    status.add_argument('--jobs', action='store_true', help="print every job as a JSON line instead")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    store = JobStore(args.store, getattr(args, 'lease', DEFAULT_LEASE))
+    try:
+        if args.command == 'add':
+            urls = list(args.urls)
+            if args.input:
+                urls.extend(read_url_file(args.input))
+            invalid = [url for url in urls if not is_valid_url(url)]
+            for url in invalid:
+                print(f"Invalid URL: {url}", file=sys.stderr)
+            valid = [url for url in urls if is_valid_url(url)]
+            output_dir = os.path.abspath(args.output_dir) if args.output_dir else None
+            # Running the same add twice, say from a nightly script, queues nothing new
+            uids = [stable_uid(canonical_key(url), args.quality, output_dir or '') for url in valid]
+            added = store.add(valid, quality=args.quality, priority=PRIORITIES[args.priority],
+                              output_dir=output_dir, uids=uids)
+            print(f"Queued {added} new job(s) of {len(valid)}", file=sys.stderr)
+            return 1 if invalid else 0
+            
+        if args.command == 'status':
+            if args.jobs:
+                for job in store.jobs():
+                    print(json.dumps(job, ensure_ascii=False))
+            else:
+                print(json.dumps(store.counts()))
+            return 0
+            
+        def log(message):
+            if args.verbose:
+                print(message, file=sys.stderr, flush=True)
+                
+        worker = StoreWorker(store, args, log, args.name)
+        # Stop the same way on SIGTERM as on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            worker.run(until_empty=args.until_empty)
+        except KeyboardInterrupt:
+            released = worker.abandon()
+            log(f"Interrupted, handed {released} job(s) back to the store")
+            return 130
+        finally:
+            worker.engine.close_metrics()
+        log(f"Committed {worker.committed} job(s), dropped {worker.lost} after losing the lease")
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
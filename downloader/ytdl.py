@@ -0,0 +1,412 @@
+"""
+yt-dlp subclasses used by the download engine.
+"""
+
+import functools
+import itertools
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import yt_dlp
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.postprocessor import PostProcessor
+from yt_dlp.utils import ContentTooShortError, determine_protocol
+
+from .segmented import (SegmentedDownloader, ConnectionPool, RangeNotSupported, CONTENT_RANGE,
+                        DEFAULT_MAX_CONNECTIONS, discard, segment_path)
+from .transcode import DEFAULT_BITRATE, PIPE_INPUT, TranscodeError, can_stream, mp3_command
+
+
+# Seconds between progress hook calls from the segmented downloader
+PROGRESS_INTERVAL = 0.1
+
+# Options that the segmented downloader does not implement itself
+UNSUPPORTED_PARAMS = ('proxy', 'ratelimit', 'external_downloader', 'source_address', 'test')
+
+# Bytes read before deciding whether a source can be piped into ffmpeg
+STREAM_PEEK_SIZE = 64 * 1024
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# Kinds of retry_sleep_functions yt-dlp looks up
+RETRY_KINDS = ('http', 'fragment', 'file_access', 'extractor')
+
+
+class ThrottledHttpFD(HttpFD):
+    """HttpFD that pays the session's bandwidth scheduler for every block it reads"""
+    
+    def __init__(self, ydl, params):
+        super().__init__(ydl, params)
+        self._metered = 0
+        
+    def throttle(self, count):
+        throttle = getattr(self.ydl, 'throttle', None)
+        if throttle:
+            throttle(count)
+            
+    def slow_down(self, start_time, now, byte_counter):
+        # HttpFD calls this after every block with the bytes of the current attempt
+        super().slow_down(start_time, now, byte_counter)
+        if byte_counter < self._metered:
+            self._metered = 0
+        self.throttle(byte_counter - self._metered)
+        self._metered = byte_counter
+
+
+class SegmentedFD(ThrottledHttpFD):
+    """HttpFD that fetches large progressive files over several connections.
+    
+    Falls back to the regular single-stream HttpFD when the server does
+    not honour Range requests or the file is too small to split.
+    """
+    
+    @staticmethod
+    def can_download(info, params):
+        if any(params.get(name) for name in UNSUPPORTED_PARAMS):
+            return False
+        return (determine_protocol(info) in ('http', 'https')
+                and not info.get('is_live')
+                and not info.get('fragments')
+                and not info.get('requested_formats'))
+                
+    def real_download(self, filename, info_dict):
+        url = info_dict['url']
+        # Never the .part that HttpFD resumes; this one is preallocated
+        partfilename = segment_path(filename)
+        headers = dict(info_dict.get('http_headers') or {})
+        cookie = self.ydl.cookiejar.get_cookie_header(url)
+        if cookie:
+            headers['Cookie'] = cookie
+            
+        started = time.time()
+        emit_lock = threading.Lock()
+        last_emit = [0.0]
+        
+        def on_bytes(count):
+            self.throttle(count)
+            now = time.monotonic()
+            if now - last_emit[0] < PROGRESS_INTERVAL or not emit_lock.acquire(blocking=False):
+                return
+            try:
+                last_emit[0] = now
+                elapsed = time.time() - started
+                downloaded, total = downloader.downloaded, downloader.total
+                speed = downloaded / elapsed if elapsed > 0 else None
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'filename': filename,
+                    'tmpfilename': partfilename,
+                    'elapsed': elapsed,
+                    'speed': speed,
+                    'eta': (total - downloaded) / speed if speed and total else None,
+                }, info_dict)
+            finally:
+                emit_lock.release()
+                
+        # Sessions keep their connections open for the next job to the same CDN
+        pool = getattr(self.ydl, 'connection_pool', None)
+        downloader = SegmentedDownloader(
+            max_connections=getattr(self.ydl, 'segmented_connections', DEFAULT_MAX_CONNECTIONS),
+            pool=pool, on_bytes=on_bytes)
+        try:
+            total = downloader.download(url, partfilename, headers)
+        except RangeNotSupported as e:
+            self.write_debug(f"Segmented download not possible ({e}), using a single connection")
+            discard(partfilename)
+            return super().real_download(filename, info_dict)
+        finally:
+            if pool is None:
+                downloader.pool.close()
+                
+        self.write_debug(f"Downloaded {total} bytes over {downloader.connections} connections")
+        self.try_rename(partfilename, filename)
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+
+
+class BeforeDownload(PostProcessor):
+    """Calls the session's current before_download callback"""
+    
+    def run(self, info):
+        if self._downloader.trace is not None:
+            self._downloader.trace.on_before_download()
+        callback = self._downloader.before_download
+        if callback:
+            callback(info)
+        return [], info
+
+
+class StreamedAudio(PostProcessor):
+    """Points the post-processing chain at the MP3 written while streaming"""
+    
+    def __init__(self, downloader, path):
+        super().__init__(downloader)
+        self.path = path
+        
+    def run(self, info):
+        info['filepath'] = self.path
+        info['ext'] = 'mp3'
+        return [], info
+
+
+class StreamingAudioFD(ThrottledHttpFD):
+    """HttpFD that pipes the body straight into ffmpeg and only writes the MP3.
+    
+    Memory stays at one block plus the pipe buffer, and the source never
+    touches the disk. Containers ffmpeg cannot read front to back (MP4 with
+    the moov atom at the end) go through the regular HttpFD download and
+    are converted afterwards.
+    """
+    
+    def __init__(self, ydl, params):
+        super().__init__(ydl, params)
+        # Path of the MP3 once the stream was encoded
+        self.output = None
+        self.total = None
+        
+    def real_download(self, filename, info_dict):
+        target = os.path.splitext(filename)[0] + '.mp3'
+        tmp_path = target + '.part'
+        headers = dict(info_dict.get('http_headers') or {})
+        chunk_size = (self.params.get('http_chunk_size')
+                      or (info_dict.get('downloader_options') or {}).get('http_chunk_size'))
+        
+        blocks = self._blocks(info_dict['url'], headers, chunk_size)
+        head = b''
+        for block in blocks:
+            head += block
+            if len(head) >= STREAM_PEEK_SIZE:
+                break
+        if not can_stream(info_dict.get('ext'), head):
+            blocks.close()
+            self.write_debug("Container needs seeking, downloading the file before converting")
+            return super().real_download(filename, info_dict)
+            
+        started = time.time()
+        last_emit = 0.0
+        downloaded = 0
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(
+                mp3_command(self.params['ffmpeg_location'], PIPE_INPUT, tmp_path, DEFAULT_BITRATE),
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+            try:
+                for block in itertools.chain([head], blocks):
+                    process.stdin.write(block)
+                    downloaded += len(block)
+                    now = time.monotonic()
+                    if now - last_emit >= PROGRESS_INTERVAL:
+                        last_emit = now
+                        elapsed = time.time() - started
+                        speed = downloaded / elapsed if elapsed > 0 else None
+                        self._hook_progress({
+                            'status': 'downloading',
+                            'downloaded_bytes': downloaded,
+                            'total_bytes': self.total,
+                            'filename': target,
+                            'tmpfilename': tmp_path,
+                            'elapsed': elapsed,
+                            'speed': speed,
+                            'eta': (self.total - downloaded) / speed if speed and self.total else None,
+                        }, info_dict)
+                process.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg gave up; its exit status and stderr say why
+                pass
+            except BaseException:
+                process.kill()
+                process.wait()
+                self._remove(tmp_path)
+                raise
+            finally:
+                blocks.close()
+                
+            if process.wait() != 0:
+                self._remove(tmp_path)
+                errors.seek(0)
+                message = errors.read().decode('utf-8', 'replace').strip().splitlines()
+                raise TranscodeError(message[-1] if message else f"ffmpeg exited with {process.returncode}")
+                
+        if self.total and downloaded < self.total:
+            self._remove(tmp_path)
+            raise ContentTooShortError(downloaded, self.total)
+            
+        os.replace(tmp_path, target)
+        self.output = target
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': downloaded,
+            'total_bytes': downloaded,
+            'filename': target,
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+        
+    def _blocks(self, url, headers, chunk_size):
+        """Yield the body in blocks, as consecutive range requests when chunk_size is set"""
+        position = 0
+        while True:
+            request_headers = dict(headers)
+            if chunk_size:
+                request_headers['Range'] = f'bytes={position}-{position + chunk_size - 1}'
+            start = position
+            with self.ydl.urlopen(Request(url, headers=request_headers)) as response:
+                match = CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+                if match and match.group(3) != '*':
+                    self.total = int(match.group(3))
+                elif response.status == 200:
+                    # The server sent the whole file in one go
+                    chunk_size = None
+                    length = response.headers.get('Content-Length')
+                    self.total = int(length) if length else None
+                for block in iter(lambda: response.read(STREAM_BLOCK_SIZE), b''):
+                    position += len(block)
+                    self.throttle(len(block))
+                    yield block
+            if not chunk_size or self.total is None or position >= self.total or position == start:
+                return
+                
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def adopt_preallocated(filename):
+    """Move a .part that an older version preallocated for SegmentedFD out of HttpFD's way.
+    
+    Its sidecar tells it apart from a single-stream .part, which HttpFD
+    resumes by its size; resuming a zero-filled file that way corrupts it.
+    """
+    part = filename + '.part'
+    if os.path.exists(part + '.segments'):
+        os.replace(part, segment_path(filename))
+        os.replace(part + '.segments', segment_path(filename) + '.segments')
+
+
+class EngineYDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that routes plain HTTP transfers through SegmentedFD.
+    
+    With `stream_audio` set, they go through StreamingAudioFD instead and
+    come out as MP3 without an intermediate file. A session can serve
+    many jobs in turn (see sessions.SessionPool); the per-job settings
+    are the attributes that reset() restores. `throttle`, when set, is
+    called with the size of every chunk downloaded (see bandwidth), and
+    `trace` receives the job's progress, post-processor and retry events
+    (see metrics.JobTrace).
+    """
+    
+    # Upper bound for parallel connections per file; 1 disables splitting
+    segmented_connections = DEFAULT_MAX_CONNECTIONS
+    stream_audio = False
+    
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.profile = None
+        # Keep-alive connections for SegmentedFD, shared by every job of the session
+        self.connection_pool = ConnectionPool()
+        self.progress_hook = None
+        self.before_download = None
+        self.throttle = None
+        self.trace = None
+        # Selector for the session's 'format' option; select_format() overrides it per job
+        self._default_selector = self.format_selector
+        # Bytes seen per file while one of yt-dlp's own downloaders runs
+        self._metered = None
+        self.add_progress_hook(self._report_progress)
+        self.add_postprocessor_hook(self._report_postprocessing)
+        # Retries are counted through the sleep functions yt-dlp calls before each one
+        sleep_functions = dict(self.params.get('retry_sleep_functions') or {})
+        self.params['retry_sleep_functions'] = {
+            kind: functools.partial(self._retry_sleep, kind, sleep_functions.get(kind))
+            for kind in RETRY_KINDS}
+        self.add_post_processor(BeforeDownload(self), when='before_dl')
+        
+    def reset(self):
+        """Drop the settings of the last job before the session is reused"""
+        self.progress_hook = None
+        self.before_download = None
+        self.throttle = None
+        self.trace = None
+        self.format_selector = self._default_selector
+        self.__dict__.pop('segmented_connections', None)
+        self.__dict__.pop('stream_audio', None)
+        
+    def select_format(self, spec):
+        """Use format string `spec` instead of the 'format' option for the current job"""
+        self.format_selector = self.build_format_selector(spec)
+        
+    def close(self):
+        super().close()
+        self.connection_pool.close()
+        
+    def _report_progress(self, d):
+        if self._metered is not None and self.throttle and d.get('status') == 'downloading':
+            # Only the progress hook sees the bytes of HLS, DASH and other downloaders
+            key = d.get('tmpfilename') or d.get('filename')
+            downloaded = d.get('downloaded_bytes') or 0
+            last = self._metered.get(key, 0)
+            self._metered[key] = downloaded
+            if downloaded > last:
+                self.throttle(downloaded - last)
+        if self.trace is not None:
+            self.trace.on_progress(d)
+        if self.progress_hook:
+            self.progress_hook(d)
+            
+    def _report_postprocessing(self, d):
+        if self.trace is not None:
+            self.trace.on_postprocess(d)
+            
+    def _retry_sleep(self, kind, sleep_function, n):
+        if self.trace is not None:
+            self.trace.retry(kind)
+        return sleep_function(n=n) if sleep_function else None
+        
+    def dl(self, name, info, subtitle=False, test=False):
+        if (test or subtitle or name == '-'
+                or not SegmentedFD.can_download(info, self.params)):
+            return self._metered_dl(name, info, subtitle, test)
+        if not self.params.get('nopart'):
+            adopt_preallocated(name)
+        if self.stream_audio:
+            fd = StreamingAudioFD(self, self.params)
+            result = self._download_with(fd, name, info, subtitle)
+            if fd.output:
+                # Keeps fixups meant for the source container (m4a_dash) off the MP3
+                info['ext'] = 'mp3'
+                info['__postprocessors'].insert(0, StreamedAudio(self, fd.output))
+            return result
+        if self.segmented_connections > 1:
+            return self._download_with(SegmentedFD(self, self.params), name, info, subtitle)
+        # A single stream cannot continue a segmented download
+        discard(segment_path(name))
+        return self._metered_dl(name, info, subtitle, test)
+        
+    def _metered_dl(self, name, info, subtitle, test):
+        """Run yt-dlp's own downloader, throttled through the progress hook"""
+        self._metered = {}
+        try:
+            return super().dl(name, info, subtitle, test)
+        finally:
+            self._metered = None
+            
+    def _download_with(self, fd, name, info, subtitle):
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
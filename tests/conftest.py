@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages live next to this folder and are not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
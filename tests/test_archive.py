@@ -0,0 +1,27 @@
+"""
+Download archive (downloader/archive.py).
+"""
+
+import os
+
+from downloader.archive import DownloadArchive
+
+
+def test_rebuild_finds_moved_and_renamed_downloads(tmp_path):
+    old, new = tmp_path / 'old', tmp_path / 'new'
+    old.mkdir()
+    new.mkdir()
+    (old / 'video.mp4').write_bytes(b'video' * 1000)
+    (old / 'other.mp4').write_bytes(b'other')
+    archive = DownloadArchive(tmp_path / 'archive.sqlite3')
+    archive.record(['youtube.com/watch?v=abc', 'youtube:abc'], 'best', [str(old / 'video.mp4')])
+    
+    os.replace(old / 'video.mp4', new / 'renamed.mp4')
+    os.replace(old / 'other.mp4', new / 'other.mp4')
+    assert archive.rebuild(new) == 1
+    for key in ('youtube.com/watch?v=abc', 'youtube:abc'):
+        assert archive.lookup_key(key, 'best') == [str((new / 'renamed.mp4').resolve())]
+    assert archive.lookup_key('youtube:abc', 'audio') is None
+    # Nothing changed, nothing hashed
+    assert archive.rebuild(new) == 0
+    archive.close()
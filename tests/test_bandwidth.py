@@ -0,0 +1,43 @@
+"""
+Bandwidth scheduler (downloader/bandwidth.py).
+"""
+
+import threading
+import time
+
+from downloader.bandwidth import BandwidthScheduler
+from downloader.jobqueue import BULK, INTERACTIVE
+
+CHUNK = 16 * 1024
+
+
+def transfer(scheduler, host, priority, seconds, totals):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        scheduler.consume(CHUNK, host=host, priority=priority)
+        totals[host] += CHUNK
+
+
+def run(scheduler, jobs, seconds=1.0):
+    totals = {host: 0 for host, _ in jobs}
+    threads = [threading.Thread(target=transfer, args=(scheduler, host, priority, seconds, totals))
+               for host, priority in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {host: total / seconds for host, total in totals.items()}
+
+
+def test_capped_site_does_not_hold_back_other_sites():
+    scheduler = BandwidthScheduler(10 * 1024 * 1024, {'a': 20 * 1024})
+    rates = run(scheduler, [('a', INTERACTIVE), ('b', BULK)])
+    assert rates['a'] < 64 * 1024
+    # Most of the global cap, not the few KB/s left over by the waiting interactive job
+    assert rates['b'] > 4 * 1024 * 1024
+
+
+def test_interactive_first_on_a_shared_cap():
+    scheduler = BandwidthScheduler(1024 * 1024)
+    rates = run(scheduler, [('a', INTERACTIVE), ('b', BULK)])
+    assert rates['a'] > 4 * rates['b']
@@ -0,0 +1,41 @@
+"""
+Format selection (downloader/formats.py).
+"""
+
+from downloader.formats import FASTEST, QUALITY, choose_format
+
+
+def fmt(format_id, ext, height=None, vcodec='avc1', acodec='mp4a', abr=None, size=None):
+    return {'format_id': format_id, 'ext': ext, 'height': height, 'vcodec': vcodec, 'acodec': acodec,
+            'abr': abr, 'filesize': size}
+
+
+def info(formats, url='https://www.youtube.com/watch?v=abc'):
+    return {'formats': formats, 'duration': 600, 'webpage_url': url}
+
+
+YOUTUBE = [
+    fmt('18', 'mp4', 360, size=20_000_000),
+    fmt('22', 'mp4', 720, size=60_000_000),
+    fmt('135', 'mp4', 480, acodec='none', size=30_000_000),
+    fmt('140', 'm4a', vcodec='none', abr=128, size=5_000_000),
+    fmt('248', 'webm', 1080, vcodec='vp9', acodec='none', size=100_000_000),
+    fmt('251', 'webm', vcodec='none', acodec='opus', abr=160, size=6_000_000),
+]
+
+
+def test_quality_keeps_the_single_mp4_file():
+    assert choose_format(info(YOUTUBE), 'best', QUALITY, ffmpeg='ffmpeg').spec == '22'
+
+
+def test_fastest_merges_only_when_no_single_file_is_good_enough():
+    # 22 meets the 480p floor, so the cheaper 135+140 merge is not worth an ffmpeg run
+    assert choose_format(info(YOUTUBE), 'best', FASTEST, ffmpeg='ffmpeg').spec == '22'
+    without_22 = [f for f in YOUTUBE if f['format_id'] != '22']
+    assert choose_format(info(without_22), 'best', FASTEST, ffmpeg='ffmpeg').spec == '135+140'
+
+
+def test_quality_audio_prefers_mp3_at_the_same_bitrate():
+    formats = [fmt('aac', 'm4a', vcodec='none', abr=130, size=1_000_000),
+               fmt('mp3', 'mp3', vcodec='none', acodec='mp3', abr=128, size=80_000_000)]
+    assert choose_format(info(formats, 'https://example.com/a'), 'audio', QUALITY, ffmpeg='ffmpeg').spec == 'mp3'
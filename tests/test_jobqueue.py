@@ -0,0 +1,36 @@
+"""
+Job queue retries and their metrics (downloader/jobqueue.py).
+"""
+
+import time
+
+from downloader.jobqueue import DONE, DownloadQueue, Job
+from downloader.metrics import Metrics
+from downloader.retry import RetryPolicy
+
+
+def test_retried_attempt_is_not_a_failed_job():
+    metrics = Metrics()
+    attempts = []
+    
+    def runner(job):
+        # Like core.run_job: one trace per attempt, a failed one is left to the queue
+        trace = metrics.trace(job)
+        attempts.append(time.time())
+        if len(attempts) == 1:
+            job.trace = trace
+            raise ConnectionResetError("connection reset by peer")
+        trace.close(DONE)
+        
+    queue = DownloadQueue(runner, retry=RetryPolicy(retries=2, base_delay=0.05, max_delay=0.1), metrics=metrics)
+    job = queue.submit(Job('https://example.com/video'))
+    assert queue.wait(timeout=10)
+    queue.shutdown()
+    
+    assert job.status == DONE and job.attempts == 1
+    text = metrics.render()
+    assert 'downloader_jobs_total{host="example.com",status="done"} 1' in text
+    assert 'status="failed"' not in text and 'downloader_errors_total' not in text
+    assert 'downloader_retries_total{host="example.com",kind="job"} 1' in text
+    # The second attempt waited from its requeue, not from the job's creation
+    assert job.queued_at > attempts[0]
@@ -0,0 +1,79 @@
+"""
+Segmented downloads against the local fixture server (bench/server.py).
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from bench.server import FixtureServer, find_fixture
+from downloader.segmented import IncompleteDownload, SegmentedDownloader, segment_path
+from downloader.ytdl import EngineYDL
+
+
+SIZE = 3 * 1024 * 1024
+
+
+def expected_bytes(url):
+    fixture = find_fixture(urlsplit(url).path)
+    return fixture.read(0, fixture.size - 1)
+
+
+def download(url, folder, connections):
+    params = {'outtmpl': os.path.join(folder, '%(title)s.%(ext)s'), 'quiet': True,
+              'no_warnings': True, 'noprogress': True}
+    with EngineYDL(params) as ydl:
+        ydl.segmented_connections = connections
+        info = ydl.extract_info(url)
+        return ydl.prepare_filename(info)
+
+
+@pytest.fixture
+def server():
+    with FixtureServer() as server:
+        yield server
+
+
+def test_range_dropped_mid_transfer(server, tmp_path):
+    # The probe gets a 206, the first segment a plain 200 with the whole file
+    server.range_limit = 1
+    url = server.media_url('dropped', SIZE)
+    path = download(url, str(tmp_path), connections=4)
+    with open(path, 'rb') as f:
+        assert f.read() == expected_bytes(url)
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+@pytest.mark.parametrize('connections', [1, 4])
+def test_resume_interrupted_segmented_download(server, tmp_path, connections):
+    url = server.media_url('resumed', SIZE)
+    target = str(tmp_path / 'resumed.mp4')
+    server.rate = 512 * 1024
+    downloader = SegmentedDownloader(max_connections=2, segment_size=256 * 1024)
+    errors = []
+    
+    def run():
+        try:
+            downloader.download(url, segment_path(target))
+        except IncompleteDownload as e:
+            errors.append(e)
+            
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(1.0)
+    downloader.abort()
+    thread.join()
+    assert errors, "download finished before it could be interrupted"
+    # Preallocated to full size, but only partly filled
+    assert os.path.getsize(segment_path(target)) == SIZE
+    assert not os.path.exists(target + '.part')
+    
+    server.rate = None
+    path = download(url, str(tmp_path), connections=connections)
+    assert path == target
+    with open(path, 'rb') as f:
+        assert f.read() == expected_bytes(url)
+    assert sorted(os.listdir(tmp_path)) == ['resumed.mp4']
@@ -0,0 +1,90 @@
+"""
+Worker processes sharing one job store (downloader/worker.py).
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from bench.server import FixtureServer, find_fixture
+from downloader.jobstore import DONE, LEASED, JobStore
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZE = 1024 * 1024
+LEASE = 1.5
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def workers(tmp_path, store):
+    started = []
+    
+    def start(name):
+        command = [sys.executable, '-m', 'downloader.worker', store.path, 'run', '-j', '2', '-c', '1',
+                   '-o', str(tmp_path / name), '--lease', str(LEASE), '--until-empty', '--no-archive',
+                   '--no-cache', '-v', '--name', name]
+        env = dict(os.environ, VIDEO_DOWNLOADER_HOME=str(tmp_path / 'home'))
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stderr=subprocess.PIPE, text=True)
+        started.append(process)
+        return process
+        
+    yield start
+    for process in started:
+        if process.poll() is None:
+            process.kill()
+            process.communicate()
+
+
+@pytest.mark.parametrize('failure', ['killed', 'paused'])
+def test_jobs_taken_over_from_failed_worker(tmp_path, store, workers, failure):
+    with FixtureServer(rate=256 * 1024) as server:
+        urls = [server.media_url(f'takeover{n}', SIZE) for n in range(2)]
+        store.add(urls)
+        first = workers('first')
+        wait_for(lambda: [job['worker'] for job in store.jobs(LEASED)] == ['first', 'first'])
+        second = workers('second')
+        if failure == 'killed':
+            first.kill()
+        else:
+            # Longer than the lease: the second worker takes both jobs over meanwhile
+            first.send_signal(signal.SIGSTOP)
+            wait_for(lambda: [job['worker'] for job in store.jobs(LEASED)] == ['second', 'second'])
+            first.send_signal(signal.SIGCONT)
+            
+        _, log = second.communicate(timeout=60)
+        assert second.returncode == 0, log
+        _, log = first.communicate(timeout=30)
+        if failure == 'paused':
+            # The first worker notices, stops both downloads and writes nothing
+            assert first.returncode == 0, log
+            assert log.count("Lease expired and went to another worker") == 2
+            assert "Committed 0 job(s), dropped 2" in log
+            assert not [name for name in os.listdir(tmp_path / 'first') if name.endswith('.mp4')]
+            
+    jobs = store.jobs()
+    assert [job['status'] for job in jobs] == [DONE, DONE]
+    assert all(job['worker'] == 'second' and job['attempts'] == 2 for job in jobs)
+    assert all(job['result']['worker'] == 'second' for job in jobs)
+    for url, job in zip(urls, jobs):
+        fixture = find_fixture(urlsplit(url).path)
+        with open(job['result']['filename'], 'rb') as f:
+            assert f.read() == fixture.read(0, fixture.size - 1)
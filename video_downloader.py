@@ -4,19 +4,38 @@ Universal Video Downloader - Dark Theme GUI Version
 Downloads MP4 videos and MP3 audio from various platforms with a modern dark GUI interface.
 """
 
+import time
+
+# Taken before the other imports so the start-up report covers them
+STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
 import os
-import sys
 from pathlib import Path
-import yt_dlp
-from urllib.parse import urlparse
-import re
+from downloader import Job
+from downloader.jobqueue import (DEFAULT_MAX_WORKERS, ACTIVE, DONE, FAILED, PROCESSING, QUEUED,
+                                 INTERACTIVE, NORMAL)
+from downloader.client import DaemonClient, RemoteQueue
+from downloader.engine import Engine, default_arguments
+from downloader.formats import FASTEST, QUALITY
+from downloader.metrics import options_from_env
+from downloader.events import EventChannel, LOG, JOB, PROGRESS
+from downloader.progress import ProgressBoard, format_bytes, format_eta
+from downloader.retry import FailureReport, short_reason
+from downloader.journal import JobJournal
+from downloader.startup import StartupTimer, Warmup
+from downloader.urls import is_valid_url
+
+
+# How often the main loop applies events posted by download workers
+UI_TICK_MS = 100
+# How often the queue-wide transfer rate and stall markers are refreshed
+STATS_INTERVAL_MS = 1000
 
 
 class VideoDownloaderGUI:
-    def __init__(self, root):
+    def __init__(self, root, timer=None):
         self.root = root
         self.root.title("Video Downloader")
         self.root.geometry("700x650")
@@ -41,10 +60,59 @@ class VideoDownloaderGUI:
         # Variables
         self.output_dir = tk.StringVar(value=str(Path.cwd() / "downloads"))
         self.quality = tk.StringVar(value="best")
-        self.downloading = False
-        
-        self.setup_styles()
-        self.setup_ui()
+        self.max_workers = tk.IntVar(value=DEFAULT_MAX_WORKERS)
+        # MB/s shared by all downloads; 0 means unlimited
+        self.speed_limit = tk.DoubleVar(value=0)
+        # Prefer formats that need no merge or MP3 encode; read by the workers as format_policy
+        self.fastest = tk.BooleanVar(value=False)
+        self.job_rows = {}
+        # Failed jobs, summarized in the log once the queue is idle instead of a dialog each
+        self.failures = FailureReport()
+        
+        # yt_dlp is loaded in the background once the window is up
+        self.timer = timer or StartupTimer()
+        self.warmup = Warmup(self.timer)
+        self.startup_reported = False
+        
+        # Workers never touch widgets; they post events that the main loop drains
+        self.events = EventChannel()
+        
+        self.stats_countdown = 0
+        self.engine = None
+        
+        # With VIDEO_DOWNLOADER_DAEMON set, jobs run on that daemon and this window is one of its clients
+        self.daemon = DaemonClient.from_env()
+        if self.daemon is not None:
+            self.progress_board = ProgressBoard()
+            self.queue = RemoteQueue(self.daemon,
+                                     on_update=lambda job: self.events.post(JOB, job.id, status=job.status),
+                                     on_progress=lambda job_id, snapshot: self.events.post(PROGRESS, job_id,
+                                                                                           **snapshot),
+                                     on_log=self.log_message)
+        else:
+            self.setup_engine()
+            
+        with self.timer.phase('build widgets'):
+            self.setup_styles()
+            self.setup_ui()
+        self.root.after_idle(self.on_window_shown)
+        self.root.after(UI_TICK_MS, self.process_events)
+        self.resume_unfinished_jobs()
+        
+    def setup_engine(self):
+        """Create the local download engine, configured like a command line without options"""
+        # Phase metrics and traces only when enabled through the environment
+        args = default_arguments(output_dir=self.output_dir.get(), workers=self.max_workers.get(),
+                                 **options_from_env())
+        with self.timer.phase('open caches'):
+            # Caches, pools and the job queue; the archive catches up with the folder in the background
+            self.engine = Engine(args, JobJournal(), self.log_message,
+                                 on_update=lambda job: self.events.post(JOB, job.id, status=job.status),
+                                 on_progress=self.on_engine_progress)
+        # Jobs wait for yt_dlp to finish loading before the engine runs them
+        self.engine.queue.runner = self.download_video
+        self.queue = self.engine.queue
+        self.progress_board = self.engine.board
         
     def setup_styles(self):
         # Configure ttk styles for dark theme
@@ -196,6 +264,20 @@ class VideoDownloaderGUI:
             btn.pack(side='left', padx=(0, 10), pady=5, ipadx=15, ipady=8)
             self.quality_buttons.append((btn, value))
         
+        fastest_check = tk.Checkbutton(quality_frame,
+                                       text="⚡ fastest",
+                                       variable=self.fastest,
+                                       bg=self.colors['card_bg'],
+                                       fg=self.colors['text'],
+                                       selectcolor=self.colors['input_bg'],
+                                       activebackground=self.colors['card_bg'],
+                                       activeforeground=self.colors['text'],
+                                       font=('Arial', 10),
+                                       relief='flat',
+                                       bd=0,
+                                       command=self.update_format_policy)
+        fastest_check.pack(side='left', padx=(0, 10), pady=5)
+        
         # Output directory
         output_frame = tk.Frame(options_inner, bg=self.colors['card_bg'])
         output_frame.pack(fill='x', pady=(0, 15))
@@ -231,6 +313,38 @@ class VideoDownloaderGUI:
         download_frame = tk.Frame(options_inner, bg=self.colors['card_bg'])
         download_frame.pack(fill='x')
         
+        # Number of downloads running at once
+        ttk.Label(download_frame, text="Parallel downloads:", style='Card.TLabel').pack(side='left', pady=5)
+        workers_spin = tk.Spinbox(download_frame,
+                                  from_=1, to=16,
+                                  width=3,
+                                  textvariable=self.max_workers,
+                                  bg=self.colors['input_bg'],
+                                  fg=self.colors['text'],
+                                  buttonbackground=self.colors['input_bg'],
+                                  font=('Arial', 10),
+                                  relief='flat',
+                                  bd=0,
+                                  command=self.update_max_workers)
+        workers_spin.pack(side='left', padx=10, pady=5, ipady=4)
+        
+        # Total download speed, applied to running downloads as well
+        ttk.Label(download_frame, text="Max MB/s:", style='Card.TLabel').pack(side='left', pady=5)
+        speed_spin = tk.Spinbox(download_frame,
+                                from_=0, to=100, increment=0.5,
+                                width=4,
+                                textvariable=self.speed_limit,
+                                bg=self.colors['input_bg'],
+                                fg=self.colors['text'],
+                                buttonbackground=self.colors['input_bg'],
+                                font=('Arial', 10),
+                                relief='flat',
+                                bd=0,
+                                command=self.update_speed_limit)
+        speed_spin.pack(side='left', padx=10, pady=5, ipady=4)
+        speed_spin.bind('<Return>', lambda event: self.update_speed_limit())
+        speed_spin.bind('<FocusOut>', lambda event: self.update_speed_limit())
+        
         self.download_btn = tk.Button(download_frame,
                                      text="📥 paste",
                                      bg=self.colors['accent'],
@@ -250,13 +364,31 @@ class VideoDownloaderGUI:
         status_inner.columnconfigure(0, weight=1)
         status_inner.rowconfigure(2, weight=1)
         
-        # Progress bar
-        self.progress = ttk.Progressbar(status_inner, mode='indeterminate', style='Dark.Horizontal.TProgressbar')
-        self.progress.pack(fill='x', pady=(0, 10))
-        
-        # Status label
+        # Queue summary label
         self.status_label = ttk.Label(status_inner, text="Ready to download", style='Card.TLabel')
-        self.status_label.pack(anchor='w', pady=(0, 15))
+        self.status_label.pack(anchor='w', pady=(0, 10))
+        
+        # Scrollable list with one row per job
+        jobs_frame = tk.Frame(status_inner, bg=self.colors['card_bg'])
+        jobs_frame.pack(fill='x', pady=(0, 15))
+        
+        self.jobs_canvas = tk.Canvas(jobs_frame,
+                                     bg=self.colors['card_bg'],
+                                     height=150,
+                                     highlightthickness=0,
+                                     bd=0)
+        jobs_scrollbar = tk.Scrollbar(jobs_frame, orient='vertical', command=self.jobs_canvas.yview,
+                                      bg=self.colors['input_bg'], troughcolor=self.colors['input_bg'])
+        self.jobs_canvas.configure(yscrollcommand=jobs_scrollbar.set)
+        self.jobs_canvas.pack(side='left', fill='both', expand=True)
+        jobs_scrollbar.pack(side='right', fill='y')
+        
+        self.jobs_list = tk.Frame(self.jobs_canvas, bg=self.colors['card_bg'])
+        jobs_window = self.jobs_canvas.create_window((0, 0), window=self.jobs_list, anchor='nw')
+        self.jobs_list.bind('<Configure>',
+                            lambda e: self.jobs_canvas.configure(scrollregion=self.jobs_canvas.bbox('all')))
+        self.jobs_canvas.bind('<Configure>',
+                              lambda e: self.jobs_canvas.itemconfigure(jobs_window, width=e.width))
         
         # Log area with dark theme
         log_frame = tk.Frame(status_inner, bg=self.colors['input_bg'], relief='flat', bd=0)
@@ -310,45 +442,57 @@ class VideoDownloaderGUI:
         directory = filedialog.askdirectory(initialdir=self.output_dir.get())
         if directory:
             self.output_dir.set(directory)
+            self.index_output_dir()
             
-    def log_message(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
+    def index_output_dir(self):
+        """Catch the archive up with files already in the download folder"""
+        if self.engine is not None:
+            self.engine.index(self.output_dir.get())
+            
+    def on_window_shown(self):
         self.root.update_idletasks()
-        
-    def is_valid_url(self, url):
-        url_pattern = re.compile(
-            r'^https?://'
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'
-            r'localhost|'
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
-            r'(?::\d+)?'
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-        return url_pattern.match(url) is not None
+        self.timer.mark('window shown')
+        self.warmup.start()
+            
+    def log_message(self, message):
+        """Queue a log line; safe to call from worker threads"""
+        self.events.post(LOG, message=message)
+        
+    def process_events(self):
+        """Apply everything workers posted since the last tick"""
+        log_lines = []
+        jobs_changed = False
+        for event in self.events.drain():
+            if event.kind == LOG:
+                log_lines.append(event.data['message'])
+            elif event.kind == JOB:
+                job = self.queue.jobs[event.job_id]
+                # Playlist entries are queued by a worker, not from the UI
+                if job.id not in self.job_rows:
+                    self.add_job_row(job)
+                self.on_job_update(job)
+                jobs_changed = True
+            elif event.kind == PROGRESS:
+                self.on_job_progress(event.job_id, event.data)
     
-    def get_ffmpeg_path(self):
-        """Try to find FFmpeg executable"""
-        # Check if running as executable
-        if getattr(sys, 'frozen', False):
-            # Running as exe, check for bundled ffmpeg
-            exe_dir = Path(sys.executable).parent
-            ffmpeg_exe = exe_dir / 'ffmpeg.exe'
-            if ffmpeg_exe.exists():
-                return str(ffmpeg_exe)
-        else:
-            # Running as script, check local folder
-            script_dir = Path(__file__).parent
-            ffmpeg_exe = script_dir / 'ffmpeg.exe'
-            if ffmpeg_exe.exists():
-                return str(ffmpeg_exe)
-        
-        # Check system PATH for ffmpeg
-        import shutil
-        ffmpeg_system = shutil.which('ffmpeg')
-        if ffmpeg_system:
-            return ffmpeg_system
+        if log_lines:
+            # One insert per tick however many lines arrived
+            self.log_text.insert(tk.END, "\n".join(log_lines) + "\n")
+            self.log_text.see(tk.END)
+        
+        if not self.startup_reported and self.warmup.ready:
+            self.startup_reported = True
+            self.timer.print_report()
+            
+        # Refresh the aggregate rate on a slower clock than the event tick
+        self.stats_countdown -= UI_TICK_MS
+        if self.stats_countdown <= 0:
+            self.stats_countdown = STATS_INTERVAL_MS
+            self.refresh_transfer_stats()
+        elif jobs_changed:
+            self.update_queue_status()
             
-        return None
+        self.root.after(UI_TICK_MS, self.process_events)
     
     def show_ffmpeg_warning(self):
         """Show user-friendly warning about MP3 conversion"""
@@ -360,149 +504,218 @@ class VideoDownloaderGUI:
         )
         messagebox.showwarning("MP3 Conversion Unavailable", warning_msg)
         
-    def get_ydl_opts(self, url):
-        output_path = Path(self.output_dir.get())
-        output_path.mkdir(exist_ok=True)
+    def download_video(self, job):
+        """Run a single job; called on a queue worker thread"""
+        # Jobs queued right after launch wait for whatever warm-up is left
+        self.warmup.wait()
         
-        # Check if audio quality is selected for MP3 extraction
-        if self.quality.get() == 'audio':
-            # Check if FFmpeg is available
-            ffmpeg_path = self.get_ffmpeg_path()
+        # Errors go back to the queue, which retries the job or marks it failed (see on_job_update)
+        result = self.engine.run(job)
             
-            if ffmpeg_path:
-                # FFmpeg available - can convert to MP3
-                return {
-                    'outtmpl': str(output_path / '%(title)s.%(ext)s'),
-                    'format': 'bestaudio[ext=mp3]/bestaudio[acodec=mp3]/bestaudio',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                        'nopostoverwrites': False,
-                    }],
-                    'ffmpeg_location': ffmpeg_path,
-                    'writeinfojson': False,
-                    'writesubtitles': False,
-                    'writeautomaticsub': False,
-                }
-            else:
-                # No FFmpeg - download best audio format available
-                self.log_message("⚠️ FFmpeg not found - downloading in best available audio format")
-                return {
-                    'outtmpl': str(output_path / '%(title)s.%(ext)s'),
-                    'format': 'bestaudio/best',
-                    'writeinfojson': False,
-                    'writesubtitles': False,
-                    'writeautomaticsub': False,
-                }
-        
-        # Default video format options
-        base_opts = {
-            'outtmpl': str(output_path / '%(title)s.%(ext)s'),
-            'format': 'best[ext=mp4]/best',
-            'writeinfojson': False,
-            'writesubtitles': False,
-            'writeautomaticsub': False,
-        }
+        if not job.skipped and job.entries is None:
+            self.log_message("✅ Download completed successfully!")
+        return result
+        
+    def on_engine_progress(self, job, d, snapshot):
+        """Forward a progress snapshot to the main loop; the board only hands one out every few hundred ms"""
+        self.events.post(PROGRESS, job.id, **snapshot)
+        if d['status'] == 'finished':
+            filename = os.path.basename(d['filename'])
+            self.log_message(f"Finished downloading: {filename}")
+            
+    def add_job_row(self, job):
+        row_frame = tk.Frame(self.jobs_list, bg=self.colors['card_bg'])
+        row_frame.pack(fill='x', pady=(0, 8))
+        row_frame.columnconfigure(0, weight=1)
         
-        domain = urlparse(url).netloc.lower()
-        
-        if 'youtube.com' in domain or 'youtu.be' in domain:
-            base_opts.update({
-                'format': 'best[height<=1080][ext=mp4]/best[ext=mp4]/best',
-            })
-        elif 'twitter.com' in domain or 'x.com' in domain:
-            base_opts.update({
-                'format': 'best[ext=mp4]/best',
-            })
-        elif 'reddit.com' in domain:
-            base_opts.update({
-                'format': 'best[ext=mp4]/best',
-            })
-        elif 'tiktok.com' in domain:
-            base_opts.update({
-                'format': 'best[ext=mp4]/best',
-            })
-        
-        return base_opts
-        
-    def download_video(self):
-        url = self.url_entry.get().strip()
+        name_label = ttk.Label(row_frame, text=job.url, style='Card.TLabel')
+        name_label.grid(row=0, column=0, sticky='w')
         
-        # Clear placeholder text
-        if url == "paste the link here":
-            url = ""
+        status_label = ttk.Label(row_frame, text="Queued", style='Card.TLabel')
+        status_label.grid(row=0, column=1, sticky='e', padx=(10, 5))
         
-        if not url:
-            messagebox.showerror("Error", "Please enter a video URL")
-            return
-            
-        if not self.is_valid_url(url):
-            messagebox.showerror("Error", f"Invalid URL: {url}")
+        progress = ttk.Progressbar(row_frame, mode='indeterminate', style='Dark.Horizontal.TProgressbar')
+        progress.grid(row=1, column=0, columnspan=2, sticky='ew', pady=(3, 0), padx=(0, 5))
+        
+        self.job_rows[job.id] = {'frame': row_frame, 'name': name_label,
+                                 'status': status_label, 'progress': progress}
+        
+    def on_job_update(self, job):
+        """Reflect a job state change in its row"""
+        row = self.job_rows.get(job.id)
+        if row is None:
             return
-            
-        try:
-            self.status_label.config(text="Downloading...")
-            self.progress.start()
-            self.log_message(f"Starting download from: {url}")
-            
-            ydl_opts = self.get_ydl_opts(url)
-            
-            # Custom hook to capture progress
-            def progress_hook(d):
-                if d['status'] == 'downloading':
-                    if 'filename' in d:
-                        filename = os.path.basename(d['filename'])
-                        self.status_label.config(text=f"Downloading: {filename}")
-                elif d['status'] == 'finished':
-                    filename = os.path.basename(d['filename'])
-                    self.log_message(f"Finished downloading: {filename}")
-            
-            ydl_opts['progress_hooks'] = [progress_hook]
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-                
-            self.log_message("✅ Download completed successfully!")
-            self.status_label.config(text="Download completed!")
+        if job.status == ACTIVE:
+            row['status'].config(text="Downloading...")
+            row['progress'].start()
+        elif job.status == PROCESSING:
+            self.progress_board.finish(job.id)
+            row['progress'].config(mode='indeterminate')
+            row['progress'].start()
+            row['status'].config(text="Adding playlist entries..." if job.entries is not None
+                                 else "Converting to MP3...")
+        elif job.status == DONE:
+            self.progress_board.remove(job.id)
+            row['progress'].stop()
+            row['progress'].config(mode='determinate', value=100)
+            if job.entries is not None:
+                row['status'].config(text=f"Queued {job.entries} entries")
+            else:
+                row['status'].config(text="Already downloaded" if job.skipped else "Completed")
             self.download_btn.config(text="✅ Done", bg=self.colors['success'])
             
             # Reset button after 3 seconds
             self.root.after(3000, lambda: self.download_btn.config(text="📥 paste", bg=self.colors['accent']))
+        elif job.status == FAILED:
+            self.progress_board.remove(job.id)
+            row['progress'].stop()
+            row['status'].config(text="Failed")
+            self.log_message(f"❌ {job.url}: {short_reason(job.error)}")
+            self.failures.add(job)
+        elif job.status == QUEUED and job.retry_at is not None:
+            # The next attempt starts with a fresh speed estimate
+            self.progress_board.remove(job.id)
+            row['progress'].stop()
+            wait = max(0, job.retry_at - time.time())
+            row['status'].config(text=f"Retry {job.attempts} in {wait:.0f}s")
+            self.log_message(f"⚠️ {short_reason(job.error)}, retrying {job.url} in {wait:.0f}s")
+        elif job.status != QUEUED:
+            self.progress_board.remove(job.id)
+            row['progress'].stop()
+            row['status'].config(text=job.status.capitalize())
+            
+    def on_job_progress(self, job_id, data):
+        row = self.job_rows.get(job_id)
+        job = self.queue.jobs.get(job_id)
+        if row is None or job is None or job.status != ACTIVE:
+            return
+        if data.get('filename'):
+            row['name'].config(text=os.path.basename(data['filename']))
+            
+        percent = data.get('percent')
+        if percent is not None:
+            if str(row['progress'].cget('mode')) != 'determinate':
+                row['progress'].stop()
+                row['progress'].config(mode='determinate', maximum=100)
+            row['progress'].config(value=percent)
+        row['status'].config(text=self.describe_progress(data))
+            
+    def describe_progress(self, data):
+        if data.get('stalled'):
+            return f"Stalled at {format_bytes(data['downloaded'])}"
+        parts = []
+        if data.get('percent') is not None:
+            parts.append(f"{data['percent']:.0f}%")
+        if data.get('total'):
+            parts.append(f"{format_bytes(data['downloaded'])} / {format_bytes(data['total'])}")
+        else:
+            parts.append(format_bytes(data['downloaded']))
+        if data.get('speed'):
+            parts.append(f"{format_bytes(data['speed'])}/s")
+        if data.get('eta') is not None:
+            parts.append(f"ETA {format_eta(data['eta'])}")
+        return " · ".join(parts)
+        
+    def refresh_transfer_stats(self):
+        # Hooks stop firing while a transfer hangs, so stalls are polled here
+        for job_id in self.progress_board.stalled():
+            snapshot = self.progress_board.snapshot(job_id)
+            if snapshot:
+                self.on_job_progress(job_id, snapshot)
+        self.update_queue_status()
+        
+    def update_queue_status(self):
+        counts = self.queue.counts()
+        active = counts.get(ACTIVE, 0)
+        queued = counts.get(QUEUED, 0)
+        converting = counts.get(PROCESSING, 0)
+        if active or queued or converting:
+            text = f"Downloading {active}, queued {queued}"
+            if converting:
+                text += f", converting {converting}"
+            speed = self.progress_board.aggregate()['speed']
+            if speed:
+                text += f" · {format_bytes(speed)}/s"
+        else:
+            text = f"Completed {counts.get(DONE, 0)}, failed {counts.get(FAILED, 0)}"
+            # The batch is over; one summary of what went wrong
+            if len(self.failures):
+                self.log_message("\n".join(self.failures.take()))
+        paused = self.engine.breaker.paused() if self.daemon is None else {}
+        if paused:
+            text += " · paused " + ", ".join(f"{host} ({seconds:.0f}s)" for host, seconds in sorted(paused.items()))
+        self.status_label.config(text=text)
+        
+    def update_max_workers(self):
+        try:
+            self.queue.set_max_workers(self.max_workers.get())
+        except (tk.TclError, ValueError):
+            pass
             
-        except yt_dlp.DownloadError as e:
-            error_msg = f"Download error: {str(e)}"
-            self.log_message(f"❌ {error_msg}")
-            messagebox.showerror("Download Error", error_msg)
-            self.status_label.config(text="Download failed")
+    def update_speed_limit(self):
+        try:
+            limit = self.speed_limit.get()
+        except (tk.TclError, ValueError):
+            return
+        rate = int(limit * 1024 * 1024) if limit > 0 else None
+        if self.daemon is not None:
+            self.queue.set_rate(rate)
+        else:
+            self.engine.bandwidth.set_rate(rate)
             
-        except Exception as e:
-            error_msg = f"Unexpected error: {str(e)}"
-            self.log_message(f"❌ {error_msg}")
-            messagebox.showerror("Error", error_msg)
-            self.status_label.config(text="Download failed")
+    def update_format_policy(self):
+        if self.engine is not None:
+            self.engine.args.format_policy = FASTEST if self.fastest.get() else QUALITY
             
-        finally:
-            self.progress.stop()
-            self.download_btn.config(state='normal')
-            self.downloading = False
+    def resume_unfinished_jobs(self):
+        """Requeue jobs that were queued or running when the app last closed"""
+        if self.daemon is not None:
+            # The daemon resumes its own jobs
+            return
+        records = self.engine.journal.pending()
+        if not records:
+            return
+        self.log_message(f"Resuming {len(records)} unfinished download(s)")
+        for job in self.engine.resume(records):
+            self.add_job_row(job)
             
     def start_download(self):
-        if self.downloading:
+        text = self.url_entry.get().strip()
+        
+        # Clear placeholder text
+        if text == "paste the link here":
+            text = ""
+            
+        # Several links may be pasted at once, separated by whitespace
+        urls = text.split()
+        if not urls:
+            messagebox.showerror("Error", "Please enter a video URL")
             return
             
-        self.downloading = True
-        self.download_btn.config(state='disabled')
+        invalid = [url for url in urls if not is_valid_url(url)]
+        if invalid:
+            messagebox.showerror("Error", f"Invalid URL: {invalid[0]}")
+            return
         
-        # Run download in separate thread to prevent GUI freezing
-        thread = threading.Thread(target=self.download_video)
-        thread.daemon = True
-        thread.start()
+        self.url_entry.delete(0, tk.END)
+        # A single link is someone waiting for it; a pasted batch can take its time
+        priority = INTERACTIVE if len(urls) == 1 else NORMAL
+        for url in urls:
+            job = Job(url, quality=self.quality.get(), output_dir=self.output_dir.get(),
+                      priority=priority)
+            # Daemon jobs get their rows when the daemon reports them under its own ids
+            if self.daemon is None:
+                self.add_job_row(job)
+            self.queue.submit(job)
 
 
 def main():
-    root = tk.Tk()
-    app = VideoDownloaderGUI(root)
+    timer = StartupTimer(STARTED)
+    timer.record('imports', STARTED)
+    with timer.phase('create window'):
+        root = tk.Tk()
+    with timer.phase('build interface'):
+        app = VideoDownloaderGUI(root, timer)
     root.mainloop()
 
 